@@ -0,0 +1,74 @@
+"""
+Registry of logged batches
+
+Every call that logs several foods at once (a meal template, a batch, a copied
+day) is recorded with the Fitbit logIds it created so the whole batch can be
+undone later with a single bulk delete.
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from serialization import dump_file, load_file
+
+# Most recent batches kept on disk
+MAX_BATCHES = 100
+
+
+class BatchRegistry:
+    def __init__(self, path='batches.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._batches = None
+
+    def _load(self):
+        if self._batches is None:
+            if os.path.exists(self.path):
+                self._batches = load_file(self.path)
+            else:
+                self._batches = []
+        return self._batches
+
+    def _save(self):
+        self._batches = self._batches[-MAX_BATCHES:]
+        tmp_path = f"{self.path}.tmp"
+        dump_file(self._batches, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def record(self, source, entries):
+        """
+        Record a logged batch, entries are dicts with at least logId and date
+        returns the batch id
+        """
+        batch = {
+            'id': uuid.uuid4().hex[:12],
+            'source': source,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'entries': entries,
+        }
+        with self._lock:
+            self._load().append(batch)
+            self._save()
+        return batch['id']
+
+    def get(self, batch_id):
+        with self._lock:
+            for batch in self._load():
+                if batch['id'] == batch_id:
+                    return batch
+        return None
+
+    def remove_entries(self, log_ids):
+        """Drop deleted entries from every batch, a batch goes away once it is empty"""
+        log_ids = {str(log_id) for log_id in log_ids}
+        with self._lock:
+            for batch in self._load():
+                batch['entries'] = [e for e in batch['entries'] if str(e['logId']) not in log_ids]
+            self._batches = [b for b in self._batches if b['entries']]
+            self._save()
+
+    def recent(self, limit=20):
+        with self._lock:
+            return list(reversed(self._load()[-limit:]))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the records in models.py
+
+Compares parsing Fitbit day logs and search results into the records with the
+dicts the routes used to build, and the memory a year of cached days takes
+either way.
+
+    cd backend
+    python benchmarks/bench_models.py
+"""
+
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import FoodLogEntry, FoodSearchHit
+from units_catalog import UnitsCatalog
+
+UNITS = [{'id': unit_id, 'name': name, 'plural': f'{name}s'}
+         for unit_id, name in enumerate(['cup', 'oz', 'serving', 'tbsp', 'tsp', 'container', 'slice', 'piece'], 1)]
+
+
+def day_log(entries, target_date):
+    return {'foods': [{
+        'logId': random.randint(10**9, 10**10),
+        'logDate': target_date,
+        'loggedFood': {
+            'foodId': random.randint(10000, 900000000),
+            'name': f'Chicken breast, grilled style {i}',
+            'mealTypeId': random.choice([1, 3, 5, 7]),
+            'amount': round(random.uniform(0.25, 3), 2),
+            'unit': random.choice(UNITS),
+            'calories': random.randint(50, 600),
+            'logDate': target_date,
+        },
+    } for i in range(entries)]}
+
+
+def search_result(results):
+    return {'foods': [{
+        'foodId': random.randint(10000, 900000000),
+        'name': f'Chicken breast, grilled style {i}',
+        'brand': random.choice(['', 'Generic', 'Store Brand']),
+        'calories': random.randint(50, 400),
+        'units': [unit['id'] for unit in random.sample(UNITS, 5)],
+    } for i in range(results)]}
+
+
+def day_as_dicts(foods_data):
+    """What the routes built before models.py"""
+    foods = []
+    for food in foods_data.get('foods', []):
+        logged_food = food.get('loggedFood', {})
+        foods.append({
+            'id': food.get('logId'),
+            'foodId': logged_food.get('foodId'),
+            'name': logged_food.get('name', 'Unknown'),
+            'mealType': logged_food.get('mealTypeId', 0),
+            'amount': logged_food.get('amount', 0),
+            'unit': logged_food.get('unit', {}).get('name', ''),
+            'unitId': logged_food.get('unit', {}).get('id'),
+            'calories': logged_food.get('calories', 0),
+            'time': logged_food.get('logDate', '')
+        })
+    return foods
+
+
+def day_as_records(foods_data):
+    return [FoodLogEntry.from_fitbit(food) for food in foods_data.get('foods', [])]
+
+
+def search_as_dicts(foods_data, catalog):
+    return [{
+        'id': food.get('foodId'),
+        'name': food.get('name', 'Unknown'),
+        'brand': food.get('brand', ''),
+        'calories': food.get('calories', 0),
+        'units': catalog.details(food['units']) if 'units' in food else [],
+    } for food in foods_data['foods']]
+
+
+def search_as_records(foods_data, catalog):
+    return [FoodSearchHit.from_fitbit(food, catalog) for food in foods_data['foods']]
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def retained(build):
+    """Bytes still allocated for what build() returns"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main():
+    random.seed(1)
+    catalog = UnitsCatalog(UNITS)
+    start = datetime(2024, 1, 1)
+    year = [day_log(12, (start + timedelta(days=i)).strftime('%Y-%m-%d')) for i in range(365)]
+    day = year[0]
+    search = search_result(50)
+
+    print(f"{'parse':<24}{'dicts us':>10}{'records us':>12}{'speedup':>9}")
+    for name, as_dicts, as_records, data in (
+            ('day log 12 entries', lambda: day_as_dicts(day), lambda: day_as_records(day), day),
+            ('search 50 results', lambda: search_as_dicts(search, catalog), lambda: search_as_records(search, catalog), search)):
+        dicts = bench(as_dicts, 2000)
+        records = bench(as_records, 2000)
+        print(f"{name:<24}{dicts:>10.1f}{records:>12.1f}{dicts / records:>8.2f}x")
+
+    print()
+    # Strings are shared with the parsed Fitbit JSON either way, the difference is the containers
+    dicts = retained(lambda: [day_as_dicts(log) for log in year])
+    records = retained(lambda: [day_as_records(log) for log in year])
+    print(f"{'memory, 365 cached days':<24}{'dicts B':>10}{'records B':>12}{'saved':>9}")
+    print(f"{'per day':<24}{dicts // 365:>10}{records // 365:>12}{1 - records / dicts:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for response serialization and compression
+
+Compares the stdlib json encoder with serialization.dumps (orjson when installed)
+and the transfer size of gzip and brotli on payloads shaped like real responses.
+
+    cd backend
+    python benchmarks/bench_serialization.py
+"""
+
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+from compression import compress, load_brotli
+
+
+def calories_payload(days):
+    start = datetime(2023, 1, 1)
+    data = []
+    for i in range(days):
+        consumed = random.randint(1500, 3000)
+        burned = random.randint(1800, 3200)
+        data.append({
+            'date': (start + timedelta(days=i)).strftime('%Y-%m-%d'),
+            'calories_consumed': str(consumed),
+            'calories_burned': str(burned),
+            'net_calories': consumed - burned
+        })
+    return {'days': days, 'data': data, 'unit': 'calories'}
+
+
+def weight_payload(days):
+    start = datetime(2023, 1, 1)
+    return {'days': days, 'data': [{
+        'date': (start + timedelta(days=i)).strftime('%Y-%m-%d'),
+        'weight': round(random.uniform(70, 90), 1) if random.random() > 0.3 else None
+    } for i in range(days)]}
+
+
+def search_payload(results):
+    units = ['cup', 'oz', 'serving', 'tbsp', 'tsp', 'container', 'slice', 'piece']
+    return {'query': 'chicken', 'total': results, 'foods': [{
+        'id': random.randint(10000, 900000000),
+        'name': f'Chicken breast, grilled style {i}',
+        'brand': random.choice(['', 'Generic', 'Store Brand']),
+        'calories': random.randint(50, 400),
+        'units': [{'id': random.randint(1, 400), 'name': name} for name in random.sample(units, 5)]
+    } for i in range(results)]}
+
+
+def batch_payload(entries):
+    return {
+        'message': f'Successfully logged {entries} foods',
+        'logged_foods': [f'Food {i}' for i in range(entries)],
+        'logged_ids': [random.randint(10**9, 10**10) for _ in range(entries)],
+        'batch_id': 'a1b2c3d4e5f6',
+        'date': '2024-05-01'
+    }
+
+
+PAYLOADS = {
+    'calories 3 years': calories_payload(365 * 3),
+    'weight 1 year': weight_payload(365),
+    'search 50 results': search_payload(50),
+    'bulk log 50 entries': batch_payload(50),
+}
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    random.seed(1)
+    brotli = load_brotli()
+    print(f"serializer backend: {serialization.BACKEND}, brotli: {'yes' if brotli else 'not installed'}")
+    print()
+    print(f"{'payload':<22}{'stdlib us':>11}{'fast us':>10}{'speedup':>9}{'raw B':>9}{'gzip B':>9}{'br B':>9}")
+    for name, payload in PAYLOADS.items():
+        stdlib = bench(lambda: json.dumps(payload).encode('utf-8'), 200)
+        fast = bench(lambda: serialization.dumps(payload), 200)
+        raw = serialization.dumps(payload)
+        gz = len(compress(raw, 'gzip'))
+        br = len(compress(raw, 'br')) if brotli else '-'
+        print(f"{name:<22}{stdlib:>11.1f}{fast:>10.1f}{stdlib / fast:>8.1f}x{len(raw):>9}{gz:>9}{br:>9}")
+
+
+if __name__ == '__main__':
+    main()
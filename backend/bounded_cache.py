@@ -0,0 +1,146 @@
+"""
+Bounded in-memory cache with LRU eviction and per-entry TTL
+
+Used for the server side caches that are kept as module globals (units catalog,
+food search results) so a long running server never grows without limit.
+Callers that know an entry's size (encoded payloads, see payload_size()) pass
+it to set(), everything else is estimated by estimate_size() without encoding
+the value again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+# Bytes counted for a number, a bool or None
+SCALAR_SIZE = 8
+
+
+def estimate_size(value):
+    """
+    Approximate memory used by a value in bytes: strings and bytes by their length,
+    containers by their items, other objects through their cache_size() method
+    raises TypeError for anything else, so a cache never silently undercounts it
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return SCALAR_SIZE
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(estimate_size(item) for item in value)
+    cache_size = getattr(value, 'cache_size', None)
+    if cache_size is None:
+        raise TypeError(f"Cannot estimate the size of {type(value).__name__}, pass size= or give it a cache_size() method")
+    return cache_size()
+
+
+class BoundedCache:
+    def __init__(self, name, max_entries=1000, max_bytes=None, ttl=300):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, size=None):
+        """
+        Store a value, evicting the least recently used entries to stay within bounds
+        size is the value's size in bytes when the caller knows it, estimated otherwise
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if size is None:
+            size = estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def delete_where(self, predicate):
+        """Drop every entry for which predicate(key, value) is true, returns how many were removed"""
+        with self._lock:
+            matching = [key for key, (value, _, _) in self._entries.items() if predicate(key, value)]
+            for key in matching:
+                self._remove(key)
+            return len(matching)
+
+    def purge_expired(self):
+        """Drop every expired entry, returns how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at, _) in self._entries.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
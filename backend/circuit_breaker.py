@@ -0,0 +1,120 @@
+"""
+Circuit breakers for upstream Fitbit endpoints
+
+Every endpoint (see upstream_timing.endpoint_key) has its own circuit. After
+FAILURE_THRESHOLD failures in a row (5xx answers, timeouts, connection errors)
+the circuit opens and calls to that endpoint fail fast with UpstreamUnavailable
+instead of adding load to a failing dependency. After RESET_TIMEOUT seconds the
+circuit is half-open: a single probe call goes through, if it succeeds the
+circuit closes again, if it fails the circuit stays open for another period.
+"""
+
+import threading
+import time
+
+from scheduler import DeadlineExceeded
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+
+class UpstreamUnavailable(DeadlineExceeded):
+    """
+    Raised instead of sending a call while its endpoint's circuit is open, or for a
+    read that failed moments ago. The call was never sent, so it is handled like a
+    job that missed its deadline and a write can safely be sent again later.
+    retry_in is the seconds until the circuit lets a probe through, when known
+    """
+
+    def __init__(self, message, retry_in=None):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class _Circuit:
+    __slots__ = ('state', 'failures', 'opened_at', 'probing', 'opened', 'rejected')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+
+class CircuitBreakers:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def before_call(self, key):
+        """Raise UpstreamUnavailable if a call to the endpoint may not be sent now"""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.state == CLOSED:
+                return
+            if circuit.state == OPEN and time.monotonic() - circuit.opened_at >= self.reset_timeout:
+                circuit.state = HALF_OPEN
+                circuit.probing = False
+            if circuit.state == HALF_OPEN and not circuit.probing:
+                # This call is the probe, everything else waits for its outcome
+                circuit.probing = True
+                return
+            circuit.rejected += 1
+            retry_in = self._retry_after(circuit)
+            raise UpstreamUnavailable(f"circuit for {key} is {circuit.state}, retry in {retry_in}s", retry_in=retry_in)
+
+    def record_success(self, key):
+        """The endpoint answered (anything but a 5xx), closes its circuit"""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None:
+                circuit.state = CLOSED
+                circuit.failures = 0
+                circuit.probing = False
+
+    def release(self, key):
+        """The call ended without showing whether the endpoint works, the next one may probe"""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None:
+                circuit.probing = False
+
+    def record_failure(self, key):
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or (circuit.state == CLOSED and circuit.failures >= self.failure_threshold):
+                if circuit.state == CLOSED:
+                    circuit.opened += 1
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+                circuit.probing = False
+
+    def is_open(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit is not None and circuit.state != CLOSED
+
+    def _retry_after(self, circuit):
+        if circuit.state != OPEN:
+            return 0
+        return max(0, int(circuit.opened_at + self.reset_timeout - time.monotonic()))
+
+    def stats(self):
+        """State of every endpoint that has failed since it was last healthy"""
+        with self._lock:
+            return {key: {
+                'state': circuit.state,
+                'failures': circuit.failures,
+                'times_opened': circuit.opened,
+                'rejected': circuit.rejected,
+                'retry_in': self._retry_after(circuit),
+            } for key, circuit in self._circuits.items() if circuit.state != CLOSED or circuit.failures}
@@ -0,0 +1,428 @@
+"""
+fitbit-logger, command line client for the Fitbit food log
+
+Shares the server's Fitbit client: calls are queued on the same rate limited
+scheduler, tokens come from the same json files and data that rarely changes
+is read from the same on-disk cache. Everything is given as arguments so it
+can be scripted or run from cron.
+
+    fitbit-logger log --meal 1 --meal 2 --meal-type 1 --days-ago 0 --days-ago 1
+    fitbit-logger log --food 22788636:301:1 --meal-type 7 --date 2024-05-01
+    fitbit-logger search oatmeal "greek yogurt" --json
+    fitbit-logger units cup
+    fitbit-logger import history.csv --wait
+    fitbit-logger export --days 30 --format csv --output foods.csv
+    fitbit-logger sync --days 7
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import fitbit_client
+from fitbit_client import (API_URL, make_fitbit_api_request, submit_fitbit_api_request, food_log_create_url, fetch_units,
+                           fetch_food_search, fetch_food_log, forget_food_logs,
+                           format_logged_foods, load_credentials)
+from food_import import (EntryResolver, ImportCheckpoint, read_rows, run_import, detect_format,
+                         WAVE_SIZE, DEFAULT_MEAL_TYPE, PAUSED)
+from food_index import FoodIndex
+from food_mirror import FoodMirror, hot_dates
+from food_export import (EXPORT_FORMATS, EXPORT_WINDOW, export_dates, iter_day_foods, export_rows,
+                         export_chunks, load_pyarrow)
+from meal_templates import MEAL_NAMES, MEAL_TYPES, build_meal_entries
+from models import FoodSearchHit
+from scheduler import DeadlineExceeded, INTERACTIVE_WRITE, PREFETCH
+from serialization import dumps, dump_file, load_file
+from units_catalog import UnitsCatalog
+from webhooks import COLLECTIONS
+
+# Threads waiting on upstream calls, the calls themselves are limited by the scheduler
+CLI_WORKERS = 8
+
+# Local food log mirror shared with the server
+food_mirror = FoodMirror()
+
+# Exit code of an import paused by the rate limit, run the same command again to resume
+EXIT_PAUSED = 75
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def parse_food(value):
+    """FOODID:UNITID:AMOUNT"""
+    try:
+        food_id, unit_id, amount = value.split(':')
+        return {'name': f'food {food_id}', 'foodId': int(food_id), 'unitId': int(unit_id), 'amount': float(amount)}
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid food {value!r}, expected FOODID:UNITID:AMOUNT")
+
+
+def target_dates(args):
+    """Dates from --date and --days-ago, today if neither is given"""
+    dates = list(args.date or [])
+    for days in args.days_ago or []:
+        dates.append((datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d'))
+    if not dates:
+        dates.append(datetime.now().strftime('%Y-%m-%d'))
+    return list(dict.fromkeys(dates))
+
+
+def date_range(args):
+    """Dates from --start/--end, or the last --days days ending today"""
+    end = args.end or datetime.now().strftime('%Y-%m-%d')
+    start = args.start or (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=args.days - 1)).strftime('%Y-%m-%d')
+    try:
+        return export_dates(start, end)
+    except ValueError as e:
+        raise SystemExit(f"fitbit-logger: {e}")
+
+
+def forget_days(dates):
+    """Drop cached copies of days that were just written, the server fetches them again"""
+    forget_food_logs(dates)
+    food_mirror.mark_dirty(dates)
+
+
+def fetch_day_foods(target_date, refresh=True):
+    foods_data = fetch_food_log(target_date, refresh=refresh, priority=PREFETCH)
+    return format_logged_foods(foods_data) if foods_data else None
+
+
+def run_concurrently(fn, items):
+    """fn(item) for every item in parallel, results in item order"""
+    with ThreadPoolExecutor(max_workers=CLI_WORKERS) as pool:
+        return list(pool.map(fn, items))
+
+
+def cmd_log(args):
+    entries = []
+    for target_date in target_dates(args):
+        for meal in args.meal or []:
+            meal_entries = build_meal_entries(meal, args.meal_type, target_date)
+            if meal_entries is None:
+                print(f"Unknown meal: {meal}", file=sys.stderr)
+                return 2
+            entries.extend(meal_entries)
+        for food in args.food or []:
+            entries.append(dict(food, mealTypeId=args.meal_type, date=target_date))
+
+    if not entries:
+        print("Nothing to log, use --meal or --food", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        for entry in entries:
+            print(f"{entry['date']} {entry['name']} foodId={entry['foodId']} unitId={entry['unitId']} amount={entry['amount']}")
+        return 0
+
+    # Every entry is queued at once, the scheduler dispatches them as fast as the rate limit allows
+    futures = [submit_fitbit_api_request(food_log_create_url(entry), method='POST',
+                                         description=f"logging {entry['name']}",
+                                         priority=INTERACTIVE_WRITE)
+               for entry in entries]
+
+    failed = 0
+    for entry, future in zip(entries, futures):
+        try:
+            result = future.result()
+        except DeadlineExceeded:
+            result = None
+        if result:
+            log_id = result.get('foodLog', {}).get('logId')
+            print(f"Logged {entry['name']} on {entry['date']} (logId {log_id})")
+        else:
+            failed += 1
+            print(f"Failed to log {entry['name']} on {entry['date']}", file=sys.stderr)
+
+    forget_days({entry['date'] for entry in entries})
+    return 1 if failed else 0
+
+
+def cmd_search(args):
+    results = run_concurrently(fetch_food_search, args.queries)
+    # Same hits as the server's food search, unit names from the cached units list
+    units_data = fetch_units()
+    catalog = UnitsCatalog(units_data) if units_data else None
+    hits = [[FoodSearchHit.from_fitbit(food, catalog) for food in data.get('foods', [])] if data is not None else None
+            for data in results]
+
+    if args.json:
+        output = [{'query': query, 'foods': foods or []} for query, foods in zip(args.queries, hits)]
+        print(dumps(output, indent=True).decode('utf-8'))
+    else:
+        for query, foods in zip(args.queries, hits):
+            if len(args.queries) > 1:
+                print(f"== {query}")
+            if foods is None:
+                print(f"Error searching for {query}", file=sys.stderr)
+                continue
+            for food in foods:
+                units = ', '.join(unit['name'] for unit in food.units)
+                print(f"Name: {food.name} - ID: {food.id} - Brand: {food.brand} "
+                      f"- Calories: {food.calories} - Units: {units}")
+    return 1 if any(data is None for data in results) else 0
+
+
+def cmd_units(args):
+    units_data = fetch_units(refresh=args.refresh)
+    if not units_data:
+        print("Error fetching units", file=sys.stderr)
+        return 1
+
+    catalog = UnitsCatalog(units_data)
+    units = catalog.search(args.query) if args.query else list(catalog.units)
+    if args.json:
+        print(dumps(units, indent=True).decode('utf-8'))
+    else:
+        for unit in units:
+            print(f"Unit ID: {unit.id} - Name: {unit.name} - Plural: {unit.plural}")
+    return 0
+
+
+def cmd_import(args):
+    checkpoint_path = args.checkpoint or f"{args.file}.checkpoint.json"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = ImportCheckpoint(checkpoint_path, source=os.path.abspath(args.file))
+    if checkpoint.state['source'] != os.path.abspath(args.file):
+        print(f"{checkpoint_path} belongs to {checkpoint.state['source']}, use --restart or --checkpoint", file=sys.stderr)
+        return 2
+    if checkpoint.rows_done:
+        print(f"Resuming after row {checkpoint.rows_done}", file=sys.stderr)
+
+    units_data = fetch_units()
+    resolver = EntryResolver(UnitsCatalog(units_data) if units_data else None, FoodIndex(),
+                             default_meal_type=args.meal_type)
+
+    def report(logged, failed):
+        for failure in failed:
+            print(f"Row {failure['row']}: {failure['error']}", file=sys.stderr)
+        print(f"Imported {checkpoint.state['logged']} foods, {checkpoint.rows_done} rows done", file=sys.stderr)
+
+    with open(args.file, newline='', encoding='utf-8-sig') as file:
+        run_import(read_rows(file, args.format or detect_format(args.file)), checkpoint, resolver,
+                   wave_size=args.wave_size, wait=args.wait, on_wave=report)
+    forget_days({entry['date'] for entry in checkpoint.logged_entries()})
+
+    summary = checkpoint.summary()
+    print(f"{summary['status']}: {summary['logged']} logged, {summary['failed']} failed, {summary['rows_done']} rows")
+    if checkpoint.status == PAUSED:
+        if checkpoint.state.get('retry_in') is not None:
+            print(f"Fitbit is unavailable, run the same command again in {checkpoint.state['retry_in']}s to resume",
+                  file=sys.stderr)
+        else:
+            print("Rate limit budget used, run the same command again to resume", file=sys.stderr)
+        return EXIT_PAUSED
+    return 1 if summary['failed'] else 0
+
+
+def cmd_export(args):
+    if args.format == 'parquet' and (load_pyarrow() is None or not args.output):
+        print("Parquet export needs the pyarrow package and --output", file=sys.stderr)
+        return 2
+    dates = date_range(args)
+
+    # A paused export to a file is continued from where it stopped when run again
+    checkpoint_path = f"{args.output}.checkpoint.json" if args.output else None
+    export = {'start': dates[0], 'end': dates[-1], 'format': args.format, 'next_start': None, 'part': 0}
+    resuming = False
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        saved = load_file(checkpoint_path)
+        if (saved['start'], saved['end'], saved['format']) == (export['start'], export['end'], export['format']):
+            export = saved
+            dates = dates[dates.index(saved['next_start']):]
+            resuming = True
+            print(f"Resuming from {saved['next_start']}", file=sys.stderr)
+
+    def fetch_day(target_date):
+        # Past days come from the mirror when it has them
+        if not args.refresh and target_date not in hot_dates():
+            foods = food_mirror.day_foods(target_date)
+            if foods is not None:
+                return foods
+        return fetch_day_foods(target_date, refresh=args.refresh)
+
+    with ThreadPoolExecutor(max_workers=EXPORT_WINDOW) as pool:
+        while True:
+            path = args.output
+            if args.format == 'parquet' and export['part']:
+                # Parquet files cannot be appended to, each resumed run writes a new part
+                root, ext = os.path.splitext(args.output)
+                path = f"{root}.part{export['part']}{ext}"
+            output = open(path, 'ab' if resuming and args.format != 'parquet' else 'wb') if path else sys.stdout.buffer
+
+            state = {}
+            try:
+                rows = export_rows(iter_day_foods(dates, fetch_day, pool.submit), state)
+                for chunk in export_chunks(rows, args.format, header=not resuming):
+                    output.write(chunk)
+            finally:
+                if output is sys.stdout.buffer:
+                    output.flush()
+                else:
+                    output.close()
+
+            if state['next_start'] is None:
+                if checkpoint_path and os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+                return 0
+
+            export['next_start'] = state['next_start']
+            export['part'] += 1
+            if checkpoint_path:
+                dump_file(export, checkpoint_path)
+            reset_in = fitbit_client.fitbit_scheduler.reset_in()
+            if not args.wait or reset_in is None:
+                print(f"Stopped at {state['next_start']}, run the same command again to resume"
+                      if checkpoint_path else f"Stopped at {state['next_start']}, continue with --start {state['next_start']}",
+                      file=sys.stderr)
+                return EXIT_PAUSED
+            print(f"Rate limit budget used, waiting {reset_in}s for the next window", file=sys.stderr)
+            time.sleep(reset_in + 1)
+            dates = dates[dates.index(state['next_start']):]
+            resuming = True
+
+
+def cmd_sync(args):
+    if args.status:
+        print(dumps(food_mirror.status(), indent=True).decode('utf-8'))
+        return 0
+
+    # Days marked dirty by earlier writes are synced along with the range
+    dates = date_range(args)
+    dates += [target_date for target_date in food_mirror.dirty_dates() if target_date not in dates]
+
+    units_data = fetch_units(refresh=True, priority=PREFETCH)
+    results = run_concurrently(fetch_day_foods, dates)
+    changed = [target_date for target_date, foods in zip(dates, results)
+               if foods is not None and food_mirror.store_day(target_date, foods)]
+    food_mirror.set_state('last_sync', time.time())
+
+    synced = sum(1 for foods in results if foods is not None)
+    print(f"Synced units ({len(units_data or [])}) and {synced}/{len(dates)} days, {len(changed)} changed")
+    return 0 if units_data and synced == len(dates) else 1
+
+
+def cmd_subscribe(args):
+    """Create, list or delete the Fitbit subscriptions that push changes to the server's webhook"""
+    if args.list:
+        subscriptions = make_fitbit_api_request(f"{API_URL}/user/-/apiSubscriptions.json",
+                                                description="listing subscriptions")
+        if subscriptions is None:
+            print("Error listing subscriptions", file=sys.stderr)
+            return 1
+        print(dumps(subscriptions, indent=True).decode('utf-8'))
+        return 0
+
+    failed = 0
+    for collection in args.collection or list(COLLECTIONS):
+        url = f"{API_URL}/user/-/{collection}/apiSubscriptions/{args.subscription_id}-{collection}.json"
+        result = make_fitbit_api_request(url, method='DELETE' if args.delete else 'POST',
+                                         description=f"{'deleting' if args.delete else 'creating'} {collection} subscription")
+        if result is None:
+            failed += 1
+            print(f"Failed to {'delete' if args.delete else 'create'} the {collection} subscription", file=sys.stderr)
+        else:
+            print(f"{'Deleted' if args.delete else 'Created'} the {collection} subscription")
+    return 1 if failed else 0
+
+
+def add_date_options(parser):
+    parser.add_argument('--date', action='append', type=parse_date, help='date to use (YYYY-MM-DD), repeatable')
+    parser.add_argument('--days-ago', action='append', type=int, help='0 for today, 1 for yesterday..., repeatable')
+
+
+def add_range_options(parser):
+    parser.add_argument('--start', type=parse_date, help='first date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=parse_date, help='last date (YYYY-MM-DD), default today')
+    parser.add_argument('--days', type=int, default=7, help='number of days ending at --end when --start is not given')
+
+
+def build_parser():
+    meals = ', '.join(f"{number}={name}" for number, name in MEAL_NAMES.items())
+    meal_types = ', '.join(f"{number}={name}" for number, name in MEAL_TYPES.items())
+
+    parser = argparse.ArgumentParser(prog='fitbit-logger', description='Log and look up Fitbit foods')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print upstream requests to stderr')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    log_parser = subparsers.add_parser('log', help='log meals or foods')
+    log_parser.add_argument('--meal', action='append', type=int, help=f'meal template ({meals}), repeatable')
+    log_parser.add_argument('--food', action='append', type=parse_food, metavar='FOODID:UNITID:AMOUNT',
+                            help='single food, repeatable')
+    log_parser.add_argument('--meal-type', type=int, required=True, choices=sorted(MEAL_TYPES),
+                            help=f'meal type ({meal_types})')
+    add_date_options(log_parser)
+    log_parser.add_argument('--dry-run', action='store_true', help='print the entries without logging them')
+    log_parser.set_defaults(func=cmd_log)
+
+    search_parser = subparsers.add_parser('search', help='search foods')
+    search_parser.add_argument('queries', nargs='+', metavar='query')
+    search_parser.add_argument('--json', action='store_true', help='print the raw results as JSON')
+    search_parser.set_defaults(func=cmd_search)
+
+    units_parser = subparsers.add_parser('units', help='list or search units')
+    units_parser.add_argument('query', nargs='?')
+    units_parser.add_argument('--json', action='store_true')
+    units_parser.add_argument('--refresh', action='store_true', help='ignore the disk cache')
+    units_parser.set_defaults(func=cmd_units)
+
+    import_parser = subparsers.add_parser('import', help='import food logs from a CSV or JSONL file')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'), help='default from the file extension')
+    import_parser.add_argument('--meal-type', type=int, default=DEFAULT_MEAL_TYPE, choices=sorted(MEAL_TYPES),
+                               help='meal type of rows without one')
+    import_parser.add_argument('--checkpoint', help='checkpoint file, default FILE.checkpoint.json')
+    import_parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    import_parser.add_argument('--wait', action='store_true',
+                               help='wait for the next rate limit window instead of pausing')
+    import_parser.add_argument('--wave-size', type=int, default=WAVE_SIZE, help='rows logged at once')
+    import_parser.set_defaults(func=cmd_import)
+
+    export_parser = subparsers.add_parser('export', help='export logged foods')
+    add_range_options(export_parser)
+    export_parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv',
+                               help='parquet needs the pyarrow package')
+    export_parser.add_argument('--output', help='file to write, default stdout, needed to resume')
+    export_parser.add_argument('--wait', action='store_true',
+                               help='wait for the next rate limit window instead of stopping')
+    export_parser.add_argument('--refresh', action='store_true', help='ignore the disk cache')
+    export_parser.set_defaults(func=cmd_export)
+
+    sync_parser = subparsers.add_parser('sync', help='refresh the food mirror and the disk cache for a date range')
+    add_range_options(sync_parser)
+    sync_parser.add_argument('--status', action='store_true', help='print the mirror status and exit')
+    sync_parser.set_defaults(func=cmd_sync)
+
+    subscribe_parser = subparsers.add_parser('subscribe', help='manage Fitbit change notifications')
+    subscribe_parser.add_argument('--collection', action='append', choices=COLLECTIONS,
+                                  help='collection to subscribe to, repeatable, default all')
+    subscribe_parser.add_argument('--subscription-id', default='fitbit-logger')
+    subscribe_parser.add_argument('--delete', action='store_true', help='remove the subscriptions instead')
+    subscribe_parser.add_argument('--list', action='store_true', help='list the current subscriptions')
+    subscribe_parser.set_defaults(func=cmd_subscribe)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    fitbit_client.log_file = sys.stderr
+    fitbit_client.quiet = not args.verbose
+    fitbit_client.set_user_key_func(lambda: 'cli')
+    load_credentials()
+
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
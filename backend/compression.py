@@ -0,0 +1,52 @@
+"""
+Response compression negotiated from the Accept-Encoding header
+
+gzip is always available, brotli is used when the brotli package is installed
+and the client accepts it.
+"""
+
+import gzip
+
+_brotli = None
+
+
+def load_brotli():
+    """Import brotli on first use, returns None when it is not installed"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:  # brotli is optional
+            _brotli = False
+    return _brotli or None
+
+
+# Bodies smaller than this are sent as is, compressing them costs more than it saves
+COMPRESS_MIN_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/csv', 'application/x-ndjson', 'text/plain')
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the best supported encoding from a werkzeug Accept-Encoding header
+    returns None if the client accepts neither
+    """
+    if accept_encodings['br'] and load_brotli() is not None:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    """Compress bytes with the given encoding"""
+    if encoding == 'br':
+        return load_brotli().compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unsupported encoding: {encoding}")
@@ -0,0 +1,96 @@
+"""
+Local journal for food log edits
+
+Fitbit has no update call for a food log, an edit is a DELETE followed by a POST.
+Each edit is written to the journal before anything is sent upstream so that if
+the POST fails the original entry can be restored, and so that edits interrupted
+by a crash or a restart can be finished on the next start.
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from serialization import dump_file, load_file
+
+# Journal states
+PENDING = 'pending'      # nothing sent upstream yet
+DELETED = 'deleted'      # original removed, replacement not created yet
+UPDATED = 'updated'      # replacement created, edit complete
+RESTORED = 'restored'    # replacement failed, original logged again
+FAILED = 'failed'        # original could not be deleted, nothing changed
+ORPHANED = 'orphaned'    # original removed and neither replacement nor restore succeeded
+QUEUED = 'queued'        # Fitbit unavailable, the writes left are in the write queue, which closes the edit
+
+FINAL_STATES = (UPDATED, RESTORED, FAILED)
+
+# Finished entries kept around for inspection
+MAX_FINISHED_ENTRIES = 200
+
+
+class EditJournal:
+    def __init__(self, path='edit_journal.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            if os.path.exists(self.path):
+                self._entries = load_file(self.path)
+            else:
+                self._entries = []
+        return self._entries
+
+    def _save(self):
+        entries = self._entries
+        finished = [e for e in entries if e['state'] in FINAL_STATES]
+        if len(finished) > MAX_FINISHED_ENTRIES:
+            drop = {e['id'] for e in finished[:len(finished) - MAX_FINISHED_ENTRIES]}
+            entries = [e for e in entries if e['id'] not in drop]
+            self._entries = entries
+        tmp_path = f"{self.path}.tmp"
+        dump_file(entries, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def begin(self, log_id, original, new):
+        """Record an edit before it is sent upstream, returns the journal id"""
+        entry = {
+            'id': uuid.uuid4().hex,
+            'logId': log_id,
+            'original': original,
+            'new': new,
+            'state': PENDING,
+            'newLogId': None,
+            'error': None,
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            self._load().append(entry)
+            self._save()
+        return entry['id']
+
+    def update(self, journal_id, state, **fields):
+        """Move an edit to a new state"""
+        with self._lock:
+            for entry in self._load():
+                if entry['id'] == journal_id:
+                    entry['state'] = state
+                    entry.update(fields)
+                    entry['updated_at'] = datetime.now().isoformat(timespec='seconds')
+                    break
+            self._save()
+
+    def get(self, journal_id):
+        """An edit by journal id, None if it is not (or no longer) in the journal"""
+        with self._lock:
+            for entry in self._load():
+                if entry['id'] == journal_id:
+                    return dict(entry)
+        return None
+
+    def unresolved(self):
+        """Edits that were started but never reached a final state"""
+        with self._lock:
+            return [dict(e) for e in self._load() if e['state'] not in FINAL_STATES]
@@ -0,0 +1,165 @@
+"""
+Preflight validation of food log entries
+
+Batch, template and copy entries are checked in one pass before any of them is
+sent to Fitbit: foodId and unitId must be ids, the amount a positive number,
+the meal type one of MEAL_TYPES and the date a real day. The unit must be in
+the units catalog and, when the food was seen in a search or its details are
+cached, one of the units that food can be logged in. Only what is known
+locally is checked, nothing here calls Fitbit.
+
+Mistakes with an unambiguous meaning are fixed and reported: a MM/DD/YYYY or
+timestamp date, a meal type or unit given by name, an amount with more than
+the two decimals Fitbit keeps. Everything else rejects the entry with its
+reasons, so a bad entry never spends an upstream call and a rate limit slot
+just to fail.
+"""
+
+import math
+from datetime import datetime
+
+from food_import import DATE_FORMATS, MEAL_TYPE_IDS
+from food_index import normalize_food_name
+from meal_templates import MEAL_TYPES
+
+AMOUNT_DECIMALS = 2
+
+
+def _entry_id(value):
+    """Positive integer id from an int or a digit string, None otherwise"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if isinstance(value, float) and value.is_integer():
+        return int(value) if value > 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip()) or None
+    return None
+
+
+def _parse_date(value):
+    """YYYY-MM-DD for a date in DATE_FORMATS or an ISO timestamp, None otherwise"""
+    value = str(value).strip()
+    for candidate in (value, value.partition('T')[0]):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+
+class EntryValidator:
+    """
+    Checks entries against the units catalog and the known per-food units,
+    food_units(food_id) returns the unit ids of a food or None when unknown
+    """
+
+    def __init__(self, catalog=None, food_units=None):
+        self.catalog = catalog
+        self.food_units = food_units
+
+    def check(self, entry):
+        """(entry, fixes, errors), the entry is a fixed copy and only usable without errors"""
+        entry = dict(entry)
+        fixes = []
+        errors = []
+
+        food_id = _entry_id(entry.get('foodId'))
+        if food_id is None:
+            errors.append(f"Invalid foodId: {entry.get('foodId')!r}")
+        else:
+            entry['foodId'] = food_id
+
+        self._check_amount(entry, fixes, errors)
+        self._check_meal_type(entry, fixes, errors)
+        self._check_date(entry, fixes, errors)
+        self._check_unit(entry, food_id, fixes, errors)
+        return entry, fixes, errors
+
+    def _check_amount(self, entry, fixes, errors):
+        value = entry.get('amount')
+        try:
+            amount = float(value)
+        except (TypeError, ValueError):
+            amount = None
+        if isinstance(value, bool) or amount is None or not math.isfinite(amount) or amount <= 0:
+            errors.append(f"Invalid amount: {value!r}")
+            return
+        rounded = round(amount, AMOUNT_DECIMALS)
+        if rounded <= 0:
+            errors.append(f"Amount too small: {value!r}")
+            return
+        if rounded != amount:
+            fixes.append(f"amount {value} rounded to {rounded}")
+        entry['amount'] = rounded
+
+    def _check_meal_type(self, entry, fixes, errors):
+        value = entry.get('mealTypeId')
+        meal_type = _entry_id(value)
+        if meal_type is None and isinstance(value, str):
+            meal_type = MEAL_TYPE_IDS.get(normalize_food_name(value))
+            if meal_type is not None:
+                fixes.append(f"meal type {value!r} is {meal_type}")
+        if meal_type not in MEAL_TYPES:
+            errors.append(f"Unknown meal type: {value!r}")
+            return
+        entry['mealTypeId'] = meal_type
+
+    def _check_date(self, entry, fixes, errors):
+        value = entry.get('date')
+        target_date = _parse_date(value) if value else None
+        if target_date is None:
+            errors.append(f"Invalid date: {value!r}")
+            return
+        if target_date != value:
+            fixes.append(f"date {value} is {target_date}")
+        entry['date'] = target_date
+
+    def _check_unit(self, entry, food_id, fixes, errors):
+        value = entry.get('unitId')
+        unit_id = _entry_id(value)
+        unit_name = entry.pop('unit', None)
+        if value in (None, '') and unit_name and self.catalog:
+            # A unit name instead of an id
+            unit = self.catalog.resolve_name(unit_name)
+            if unit is not None:
+                unit_id = unit.id
+                fixes.append(f"unit {unit_name!r} is {unit_id}")
+        if unit_id is None:
+            errors.append(f"Invalid unitId: {value!r}" if value not in (None, '') else "unitId is required")
+            return
+        if self.catalog and self.catalog.get(unit_id) is None:
+            errors.append(f"Unknown unit: {unit_id}")
+            return
+        allowed = self.food_units(food_id) if food_id is not None and self.food_units else None
+        if allowed and unit_id not in allowed:
+            names = [self._unit_name(allowed_id) for allowed_id in allowed]
+            errors.append(f"Food {food_id} cannot be logged in {self._unit_name(unit_id)}, "
+                          f"use one of: {', '.join(names)}")
+            return
+        entry['unitId'] = unit_id
+
+    def _unit_name(self, unit_id):
+        unit = self.catalog.get(unit_id) if self.catalog else None
+        return f"{unit.name} ({unit_id})" if unit is not None else str(unit_id)
+
+    def validate(self, entries):
+        """
+        (valid, rejected, fixed) for a list of entries, valid holds the fixed
+        entries to log, rejected and fixed the {index, name, errors/fixes} reports
+        """
+        valid = []
+        rejected = []
+        fixed = []
+        for index, entry in enumerate(entries):
+            entry, fixes, errors = self.check(entry)
+            name = entry.get('name') or f"Food {entry.get('foodId')}"
+            if errors:
+                rejected.append({'index': index, 'name': name, 'errors': errors})
+                continue
+            if fixes:
+                fixed.append({'index': index, 'name': name, 'fixes': fixes})
+            valid.append(entry)
+        return valid, rejected, fixed
@@ -0,0 +1,129 @@
+"""
+Server-Sent Events for food log changes
+
+The write routes publish what they changed (an entry added, removed or
+replaced) and the background paths publish the dates they invalidated (mirror
+sync, webhooks, replayed writes), so open pages patch their state instead of
+fetching the day again. Every client has a bounded queue: a client that falls
+more than QUEUE_SIZE events behind gets a single `resync` event instead of the
+backlog and fetches what it shows again. The last HISTORY_SIZE events are kept
+so a client reconnecting with Last-Event-ID gets what it missed, or a `resync`
+if that is too far back or the server restarted in between.
+"""
+
+import threading
+import uuid
+from collections import deque
+
+from serialization import dumps
+
+QUEUE_SIZE = 100
+HISTORY_SIZE = 500
+MAX_CLIENTS = 50
+
+# Client side reconnection delay sent with the first message
+RETRY_MS = 3000
+
+RESYNC = {'id': None, 'type': 'resync', 'data': {}}
+
+
+def format_event(event):
+    """An event as an SSE message"""
+    message = f"id: {event['id']}\n" if event['id'] else ''
+    return f"{message}event: {event['type']}\ndata: {dumps(event['data']).decode('utf-8')}\n\n"
+
+
+class Subscription:
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._overflowed = False
+
+    def put(self, event):
+        with self._cond:
+            if self._overflowed:
+                return
+            if len(self._events) >= self.queue_size:
+                # Too far behind, drop the backlog and let the client fetch again
+                self._events.clear()
+                self._overflowed = True
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Next event, None if nothing was published within timeout seconds"""
+        with self._cond:
+            if not self._events and not self._overflowed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return RESYNC
+            return self._events.popleft() if self._events else None
+
+
+class EventBus:
+    def __init__(self, queue_size=QUEUE_SIZE, history_size=HISTORY_SIZE, max_clients=MAX_CLIENTS):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        # Event ids are only meaningful within one server process
+        self._epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._history = deque(maxlen=history_size)
+        self._next_id = 1
+        self.published = 0
+        self.resyncs = 0
+        self.rejected = 0
+
+    def publish(self, event_type, **data):
+        with self._lock:
+            event = {'id': f"{self._epoch}-{self._next_id}", 'type': event_type, 'data': data}
+            self._next_id += 1
+            self._history.append((self._next_id - 1, event))
+            self.published += 1
+            clients = list(self._clients)
+        for client in clients:
+            client.put(event)
+
+    def subscribe(self, last_event_id=None):
+        """A new client queue, None when MAX_CLIENTS are connected"""
+        client = Subscription(self.queue_size)
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                self.rejected += 1
+                return None
+            if last_event_id:
+                missed = self._missed(last_event_id)
+                if missed is None:
+                    self.resyncs += 1
+                    client.put(RESYNC)
+                else:
+                    for event in missed:
+                        client.put(event)
+            self._clients.add(client)
+        return client
+
+    def _missed(self, last_event_id):
+        """Events after last_event_id, None if they are no longer all in the history"""
+        epoch, _, number = last_event_id.partition('-')
+        if epoch != self._epoch or not number.isdigit():
+            return None
+        number = int(number)
+        if self._history and number < self._history[0][0] - 1:
+            return None
+        return [event for event_number, event in self._history if event_number > number]
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'published': self.published,
+                'resyncs': self.resyncs,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,70 @@
+"""
+Send signed Fitbit subscription notifications to a local server
+
+Stands in for Fitbit when testing the webhook receiver, the body is signed with
+CLIENTSECRET from .env exactly like Fitbit does.
+
+    python fake_notifier.py --date 2024-05-01
+    python fake_notifier.py --collection body --days-ago 0 --days-ago 1
+    python fake_notifier.py --verify your_verification_code
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import requests
+from dotenv import load_dotenv
+
+from serialization import dumps
+from webhooks import COLLECTIONS, sign
+
+DEFAULT_URL = 'http://localhost:5000/api/fitbit/webhook'
+
+
+def build_notifications(collection, dates, owner_id='-', subscription_id='1'):
+    return [{
+        'collectionType': collection,
+        'date': target_date,
+        'ownerId': owner_id,
+        'ownerType': 'user',
+        'subscriptionId': subscription_id,
+    } for target_date in dates]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Send fake Fitbit subscription notifications')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--collection', choices=COLLECTIONS, default='foods')
+    parser.add_argument('--date', action='append', default=[], help='changed date (YYYY-MM-DD), repeatable')
+    parser.add_argument('--days-ago', action='append', type=int, default=[], help='changed day, repeatable')
+    parser.add_argument('--verify', help='send a verification request with this code instead')
+    parser.add_argument('--bad-signature', action='store_true', help='send an invalid signature')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        response = requests.get(args.url, params={'verify': args.verify}, timeout=10)
+        print(f"Verification: {response.status_code}")
+        return 0 if response.status_code == 204 else 1
+
+    load_dotenv()
+    client_secret = os.getenv('CLIENTSECRET')
+    if not client_secret:
+        print("CLIENTSECRET is not set", file=sys.stderr)
+        return 2
+
+    dates = list(args.date) + [(datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d') for days in args.days_ago]
+    if not dates:
+        dates = [datetime.now().strftime('%Y-%m-%d')]
+
+    body = dumps(build_notifications(args.collection, dates))
+    signature = 'invalid' if args.bad_signature else sign(body, client_secret)
+    response = requests.post(args.url, data=body, timeout=10,
+                             headers={'Content-Type': 'application/json', 'X-Fitbit-Signature': signature})
+    print(f"Notified {args.collection} for {', '.join(dates)}: {response.status_code}")
+    return 0 if response.status_code == 204 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,541 @@
+"""
+Fitbit API client shared by the server and the fitbit-logger CLI
+
+Holds the upstream scheduler every call is queued on, the token store, the app
+credentials and an on-disk cache for data that rarely changes (units list,
+food search results, day logs refreshed by `fitbit-logger sync`). Importing
+this module does no I/O, tokens are read on the first request and the disk
+cache directory is created on first use.
+"""
+
+import base64
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from cachelib import FileSystemCache
+from dotenv import load_dotenv
+
+from bounded_cache import BoundedCache
+from circuit_breaker import CircuitBreakers, UpstreamUnavailable
+from models import FoodLogEntry
+from profiling import active_profile
+from scheduler import UpstreamScheduler, DeadlineExceeded, INTERACTIVE_READ, INTERACTIVE_WRITE, PREFETCH
+from serialization import dump_file, load_file
+from upstream_timing import LatencyTracker, HedgeStats, endpoint_key, hedged_call
+
+API_URL = "https://api.fitbit.com/1"
+TOKEN_URL = "https://api.fitbit.com/oauth2/token"
+
+# Token json files, shared by the server, the CLI and generate_tokens.py
+TOKEN_DIR = os.getenv('FITBIT_TOKEN_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# On-disk cache shared by the server and the CLI
+CACHE_DIR = os.getenv('FITBIT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+UNITS_CACHE_DURATION = 3600        # 1 hour
+FOOD_SEARCH_CACHE_DURATION = 300   # 5 minutes
+FOOD_LOG_CACHE_DURATION = 300      # 5 minutes, day logs are also dropped on writes
+FOOD_DETAILS_CACHE_DURATION = 7 * 24 * 3600  # 1 week, food definitions rarely change
+PERSONAL_FOODS_CACHE_DURATION = 3600  # 1 hour, recent and frequent are also refetched after logging
+PERSONAL_FOOD_LISTS = ('recent', 'frequent', 'favorite')
+
+# All upstream calls are queued through the scheduler so interactive requests
+# are served before prefetch and background work
+fitbit_scheduler = UpstreamScheduler(workers=int(os.getenv('UPSTREAM_WORKERS', 4)))
+
+# Connect and read timeouts (seconds) of every upstream call, shortened to what
+# is left of the deadline of the request the call is made for
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 15))
+
+# Absolute time.monotonic() deadline of the incoming request being served, the
+# server sets it per request and copies it to the tasks a route fans out
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+# Hedged reads (UPSTREAM_HEDGE=1): a GET still running after its endpoint's p95
+# is sent a second time, only while the budget has room above the prefetch reserve
+HEDGE_READS = os.getenv('UPSTREAM_HEDGE', '0') == '1'
+HEDGE_PRIORITY = PREFETCH
+upstream_latency = LatencyTracker()
+hedge_stats = HedgeStats()
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+# Per endpoint circuit breakers, and reads that failed in the last
+# UPSTREAM_NEGATIVE_TTL seconds which are not sent again until it has passed
+circuit_breakers = CircuitBreakers(failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5)),
+                                   reset_timeout=int(os.getenv('CIRCUIT_RESET_TIMEOUT', 30)))
+NEGATIVE_CACHE_TTL = int(os.getenv('UPSTREAM_NEGATIVE_TTL', 30))
+failed_reads = BoundedCache('failed_reads', max_entries=1000, ttl=NEGATIVE_CACHE_TTL)
+
+upstream_failures = Counter()
+_failures_lock = threading.Lock()
+
+# Log lines go to stdout unless redirected, the CLI sends them to stderr so
+# they do not mix with its output
+log_file = None
+quiet = False
+
+def log(message):
+    if not quiet:
+        print(message, file=log_file or sys.stdout)
+
+def default_user_key():
+    return 'background'
+
+# Key used to share the upstream workers fairly between users, the server
+# replaces it with one that reads the current request
+user_key_func = default_user_key
+
+def set_user_key_func(func):
+    global user_key_func
+    user_key_func = func
+
+# Fitbit app credentials, read from the environment by load_credentials()
+client_id = None
+client_secret = None
+basic_token = None
+
+def load_credentials():
+    """Load environment variables and the Fitbit app credentials"""
+    global client_id, client_secret, basic_token
+    load_dotenv()
+    client_id = os.getenv('CLIENTID')
+    client_secret = os.getenv('CLIENTSECRET')
+    basic_token = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+def token_path(file_name):
+    return os.path.join(TOKEN_DIR, file_name)
+
+def load_token(file_path, osvar):
+    if os.path.exists(file_path):
+        return load_file(file_path)
+    return os.getenv(osvar) or None
+
+def read_token(file_path, osvar, key):
+    """Token from its json file ({key: token}) or the environment, None if missing"""
+    token_data = load_token(file_path, osvar)
+    if isinstance(token_data, dict):
+        return token_data.get(key)
+    return token_data
+
+def save_token(file_path, token):
+    dump_file(token, file_path)
+
+# Tokens are loaded from the json files on the first upstream request
+access_token = None
+refresh_token = None
+token_lock = threading.Lock()
+
+class TokensMissing(Exception):
+    pass
+
+class OutcomeUnknown(Exception):
+    """A write that timed out or lost its connection after it was sent, Fitbit may have applied it"""
+
+def ensure_tokens():
+    """Load the access and refresh tokens if they are not loaded yet"""
+    global access_token, refresh_token
+    if access_token and refresh_token:
+        return
+    with token_lock:
+        if not access_token or not refresh_token:
+            access_token = read_token(token_path('access_token.json'), 'ACCESSTOKEN', 'access_token')
+            refresh_token = read_token(token_path('refresh_token.json'), 'REFRESHTOKEN', 'refresh_token')
+    # todo how do we ask users to do this
+    # todo might be easier to ask for this on the frontend
+    if not access_token or not refresh_token:
+        raise TokensMissing("Tokens are missing. Please provide valid access and refresh tokens.")
+
+def refresh_access_token(refresh_token, deadline=None):
+    payload = {
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token,
+        'client_id': client_id,
+        'client_secret': client_secret
+    }
+    headers = {
+        'Authorization': f'Basic {basic_token}',
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+
+    try:
+        response = requests.post(TOKEN_URL, data=payload, headers=headers, timeout=call_timeout(deadline))
+    except requests.RequestException as e:
+        log(f"[Fitbit API] Token refresh failed: {e}")
+        return None, None
+
+    if response.status_code == 200:
+        new_tokens = response.json()
+        save_token(token_path('access_token.json'), {'access_token': new_tokens['access_token']})
+        save_token(token_path('refresh_token.json'), {'refresh_token': new_tokens['refresh_token']})
+        return new_tokens['access_token'], new_tokens['refresh_token']
+    else:
+        return None, None
+
+def refresh_tokens(rejected_token, deadline=None):
+    """
+    Refresh the tokens after rejected_token got a 401, unless another worker has
+    refreshed them meanwhile, returns the access token to retry with (None if the refresh failed)
+    """
+    global access_token, refresh_token
+    with token_lock:
+        if access_token != rejected_token:
+            return access_token
+        new_access_token, new_refresh_token = refresh_access_token(refresh_token, deadline)
+        if not new_access_token or not new_refresh_token:
+            return None
+        access_token, refresh_token = new_access_token, new_refresh_token
+        return access_token
+
+def submit_fitbit_api_request(url, method='GET', headers=None, data=None, description='',
+                              priority=None, user=None, deadline=None, raise_unknown=False):
+    """
+    Queue a Fitbit API request on the upstream scheduler and return a Future
+    GET requests default to the interactive read class, everything else to interactive write
+    raise_unknown makes a write whose answer was lost raise OutcomeUnknown instead of returning None
+    """
+    if priority is None:
+        priority = INTERACTIVE_READ if method.upper() == 'GET' else INTERACTIVE_WRITE
+    if user is None:
+        user = user_key_func()
+    if deadline is None:
+        deadline = request_deadline.get()
+    send = send_fitbit_api_request
+    profile = active_profile.get()
+    if profile is not None:
+        # The request is being profiled, time the call on its upstream timeline
+        send = profile.upstream_call(send, description, method, url)
+    return fitbit_scheduler.submit(send, url, method=method, headers=headers,
+                                   data=data, description=description, call_deadline=deadline,
+                                   raise_unknown=raise_unknown, priority=priority, user=user, deadline=deadline)
+
+def make_fitbit_api_request(url, method='GET', headers=None, data=None, description='',
+                            priority=None, user=None, deadline=None):
+    """
+    Centralized function to make Fitbit API requests
+    the request waits its turn on the upstream scheduler, returns None if it failed
+    or could not be dispatched before its deadline
+    """
+    future = submit_fitbit_api_request(url, method=method, headers=headers, data=data,
+                                       description=description, priority=priority,
+                                       user=user, deadline=deadline)
+    try:
+        return future.result()
+    except DeadlineExceeded as e:
+        log(f"[Fitbit API] {description} dropped: {e}")
+        return None
+
+def call_timeout(deadline=None):
+    """(connect, read) timeout for one upstream call, raises DeadlineExceeded if the deadline has passed"""
+    if deadline is None:
+        return UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("request deadline passed before the call was sent")
+    return min(UPSTREAM_CONNECT_TIMEOUT, remaining), min(UPSTREAM_READ_TIMEOUT, remaining)
+
+def hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=fitbit_scheduler.workers * 2,
+                                                 thread_name_prefix='fitbit-hedge')
+    return _hedge_pool
+
+def _request(method, url, headers, data, timeout):
+    started = time.monotonic()
+    response = requests.request(method, url, headers=headers, data=data, timeout=timeout)
+    upstream_latency.record(endpoint_key(url), time.monotonic() - started)
+    return response
+
+def _send(url, method, headers, data, timeout):
+    if method in ('GET', 'DELETE'):
+        data = None
+
+    if method == 'GET' and HEDGE_READS:
+        delay = upstream_latency.p95(endpoint_key(url))
+        if delay is not None:
+            return hedged_call(hedge_pool(), lambda: _request(method, url, headers, data, timeout), delay,
+                               lambda: fitbit_scheduler.spend(HEDGE_PRIORITY), hedge_stats)
+    return _request(method, url, headers, data, timeout)
+
+def _send_or_log(url, method, headers, data, description, deadline, raise_unknown=False):
+    """
+    _send() through the endpoint's circuit breaker, None if the call timed out or the
+    connection failed, raises UpstreamUnavailable instead of sending it while the
+    circuit is open or the same read failed moments ago
+    raise_unknown raises OutcomeUnknown instead of returning None for a write that may have been applied
+    """
+    method = method.upper()
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        raise ValueError(f"Unsupported HTTP method: {method}")
+    if method == 'GET' and failed_reads.get(url):
+        raise UpstreamUnavailable(f"{description} failed less than {NEGATIVE_CACHE_TTL}s ago")
+    timeout = call_timeout(deadline)
+    key = endpoint_key(url)
+    circuit_breakers.before_call(key)
+
+    try:
+        response = _send(url, method, headers, data, timeout)
+    except requests.RequestException as e:
+        with _failures_lock:
+            upstream_failures['timeouts' if isinstance(e, requests.Timeout) else 'connection_errors'] += 1
+        log(f"[Fitbit API] {description} failed: {e}")
+        if isinstance(e, requests.Timeout) and timeout[1] < UPSTREAM_READ_TIMEOUT:
+            # Cut short by the request deadline, not a sign that Fitbit is failing
+            circuit_breakers.release(key)
+        else:
+            circuit_breakers.record_failure(key)
+            if method == 'GET':
+                failed_reads.set(url, True)
+        if raise_unknown and method != 'GET' and not isinstance(e, requests.ConnectTimeout):
+            # Only a connect timeout proves the request never reached Fitbit
+            raise OutcomeUnknown(f"{description}: {e}") from e
+        return None
+
+    if response.status_code >= 500:
+        circuit_breakers.record_failure(key)
+        if method == 'GET':
+            failed_reads.set(url, True)
+    else:
+        circuit_breakers.record_success(key)
+    return response
+
+def upstream_stats():
+    """Open circuits, timeouts, connection errors, hedged reads and p95 latency per endpoint"""
+    with _failures_lock:
+        failures = dict(upstream_failures)
+    return {
+        'circuits': circuit_breakers.stats(),
+        'negative_cache': failed_reads.stats(),
+        'connect_timeout': UPSTREAM_CONNECT_TIMEOUT,
+        'read_timeout': UPSTREAM_READ_TIMEOUT,
+        'timeouts': failures.get('timeouts', 0),
+        'connection_errors': failures.get('connection_errors', 0),
+        'hedging': dict(hedge_stats.as_dict(), enabled=HEDGE_READS),
+        'latency': upstream_latency.stats(),
+    }
+
+def _log_rate_limit(response, description):
+    rate_limit = response.headers.get('Fitbit-Rate-Limit-Limit')
+    rate_remaining = response.headers.get('Fitbit-Rate-Limit-Remaining')
+    rate_reset = response.headers.get('Fitbit-Rate-Limit-Reset')
+
+    fitbit_scheduler.update_budget(rate_limit, rate_remaining, rate_reset)
+
+    log(f"[Fitbit API] {description}")
+    log(f"  Rate limit: {rate_limit}")
+    log(f"  Remaining: {rate_remaining}")
+    log(f"  Reset time: {rate_reset}")
+    log(f"  Status: {response.status_code}")
+
+def send_fitbit_api_request(url, method='GET', headers=None, data=None, description='', call_deadline=None,
+                            raise_unknown=False):
+    """
+    Send a single Fitbit API request, called from the scheduler workers
+    after a request is made, the function will check the response headers for rate limiting information
+    call_deadline (time.monotonic()) caps the timeouts, None for the default timeouts
+    raise_unknown raises OutcomeUnknown for a write that timed out after it was sent
+    """
+    try:
+        ensure_tokens()
+    except TokensMissing as e:
+        log(f"[Fitbit API] {description} not sent: {e}")
+        return None
+
+    if headers is None:
+        headers = {}
+
+    # Add authorization header
+    used_token = access_token
+    headers['Authorization'] = f'Bearer {used_token}'
+    if 'Content-Type' not in headers:
+        headers['Content-Type'] = 'application/json'
+
+    response = _send_or_log(url, method, headers, data, description, call_deadline, raise_unknown)
+    if response is None:
+        return None
+    _log_rate_limit(response, description)
+
+    # Handle different response status codes
+    if response.status_code in [200, 201, 204]:
+        if response.status_code == 204:  # No content for DELETE
+            return True
+        return response.json()
+    elif response.status_code == 401:
+        # Token expired, try to refresh
+        log("[Fitbit API] Token expired, attempting refresh...")
+        new_token = refresh_tokens(used_token, call_deadline)
+        if new_token:
+            # Retry the request with new token
+            headers['Authorization'] = f'Bearer {new_token}'
+            response = _send_or_log(url, method, headers, data, f"Retry {description}", call_deadline, raise_unknown)
+            if response is None:
+                return None
+            _log_rate_limit(response, f"Retry {description}")
+
+            if response.status_code in [200, 201, 204]:
+                if response.status_code == 204:
+                    return True
+                return response.json()
+
+    # If we get here, the request failed
+    log(f"[Fitbit API] Request failed: {response.status_code} - {response.text}")
+    return None
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+def disk_cache():
+    """On-disk cache shared with the CLI, created on first use"""
+    global _disk_cache
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = FileSystemCache(CACHE_DIR, threshold=2000,
+                                              default_timeout=FOOD_SEARCH_CACHE_DURATION)
+    return _disk_cache
+
+# Calls that are running, keyed so that concurrent callers can share them
+_coalesced = {}
+_coalesced_lock = threading.Lock()
+
+def coalesced(key, fn):
+    """Call fn(), or wait for the result of the call with the same key that is already running"""
+    with _coalesced_lock:
+        future = _coalesced.get(key)
+        running = future is not None
+        if not running:
+            future = _coalesced[key] = Future()
+    if running:
+        return future.result()
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _coalesced_lock:
+            del _coalesced[key]
+
+def food_log_create_url(entry):
+    """Fitbit URL that logs a food entry (foodId, mealTypeId, unitId, amount, date)"""
+    return (f"{API_URL}/user/-/foods/log.json?foodId={int(entry['foodId'])}"
+            f"&mealTypeId={int(entry['mealTypeId'])}&unitId={int(entry['unitId'])}"
+            f"&amount={float(entry['amount'])}&date={entry['date']}")
+
+def fetch_units(refresh=False, **request_args):
+    """Raw Fitbit units list, from the disk cache when it is fresh"""
+    if not refresh:
+        units_data = disk_cache().get('units')
+        if units_data is not None:
+            return units_data
+    units_data = make_fitbit_api_request(f"{API_URL}/foods/units.json", method='GET',
+                                         description="fetching units", **request_args)
+    if units_data:
+        disk_cache().set('units', units_data, timeout=UNITS_CACHE_DURATION)
+    return units_data
+
+# Unit ids each food can be logged in (foodId -> tuple), learned from searches
+# and food details so entries can be checked without asking Fitbit
+food_units = BoundedCache('food_units', max_entries=5000, ttl=FOOD_DETAILS_CACHE_DURATION)
+
+def remember_food_units(foods):
+    """Note the units of Fitbit food definitions or search results"""
+    for food in foods:
+        if food.get('foodId') is not None and food.get('units'):
+            food_units.set(int(food['foodId']), tuple(food['units']))
+
+def known_food_units(food_id):
+    """
+    Unit ids a food can be logged in, None if it was not seen in a search and its
+    details are not cached (never calls Fitbit)
+    """
+    unit_ids = food_units.get(food_id)
+    if unit_ids is None:
+        food_data = disk_cache().get(f'food:{food_id}')
+        if food_data:
+            remember_food_units([food_data.get('food') or {}])
+            unit_ids = food_units.get(food_id)
+    return unit_ids
+
+def fetch_food_search(query, **request_args):
+    """Raw Fitbit food search results for a query, from the disk cache when it is fresh"""
+    query = query.lower()
+    key = f'search:{query}'
+    foods_data = disk_cache().get(key)
+    if foods_data is not None:
+        remember_food_units(foods_data.get('foods', []))
+        return foods_data
+    foods_data = make_fitbit_api_request(f"{API_URL}/foods/search.json?query={query}",
+                                         method='GET', description="searching foods", **request_args)
+    if foods_data:
+        disk_cache().set(key, foods_data, timeout=FOOD_SEARCH_CACHE_DURATION)
+        remember_food_units(foods_data.get('foods', []))
+    return foods_data
+
+def fetch_personal_foods(kind, refresh=False, **request_args):
+    """Raw Fitbit recent, frequent or favorite foods list, from the disk cache when it is fresh"""
+    key = f'personal:{kind}'
+    if not refresh:
+        foods_data = disk_cache().get(key)
+        if foods_data is not None:
+            return foods_data
+    foods_data = make_fitbit_api_request(f"{API_URL}/user/-/foods/log/{kind}.json", method='GET',
+                                         description=f"fetching {kind} foods", **request_args)
+    if isinstance(foods_data, list):
+        disk_cache().set(key, foods_data, timeout=PERSONAL_FOODS_CACHE_DURATION)
+        remember_food_units(foods_data)
+    return foods_data
+
+def fetch_food_log(target_date, refresh=False, **request_args):
+    """Raw Fitbit food log for a day, from the disk cache when it is fresh"""
+    key = f'foods:{target_date}'
+    if not refresh:
+        foods_data = disk_cache().get(key)
+        if foods_data is not None:
+            return foods_data
+    foods_data = make_fitbit_api_request(f"{API_URL}/user/-/foods/log/date/{target_date}.json",
+                                         method='GET', description="fetching foods logged", **request_args)
+    if foods_data:
+        disk_cache().set(key, foods_data, timeout=FOOD_LOG_CACHE_DURATION)
+    return foods_data
+
+def fetch_food_details(food_id, refresh=False, **request_args):
+    """
+    Raw Fitbit food definition (nutrition, units and servings), from the disk cache when it is fresh
+    concurrent calls for the same food share one upstream request
+    """
+    key = f'food:{int(food_id)}'
+    if not refresh:
+        food_data = disk_cache().get(key)
+        if food_data is not None:
+            return food_data
+
+    def fetch():
+        food_data = make_fitbit_api_request(f"{API_URL}/foods/{int(food_id)}.json", method='GET',
+                                            description=f"fetching food {food_id}", **request_args)
+        if food_data:
+            disk_cache().set(key, food_data, timeout=FOOD_DETAILS_CACHE_DURATION)
+            remember_food_units([food_data.get('food') or {}])
+        return food_data
+
+    return coalesced(key, fetch)
+
+def forget_food_logs(dates):
+    """Drop cached day logs after a write"""
+    if dates:
+        disk_cache().delete_many(*(f'foods:{target_date}' for target_date in dates))
+
+def format_logged_foods(foods_data):
+    """FoodLogEntry records of a Fitbit day log"""
+    return [FoodLogEntry.from_fitbit(food) for food in foods_data.get('foods', [])]
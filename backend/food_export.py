@@ -0,0 +1,209 @@
+"""
+Streaming export of food logs over a date range
+
+Day logs are fetched concurrently with only a small window of days in flight,
+rows are written out in date order as soon as their day is ready, so memory
+stays constant however long the range is. An export stops at the first day
+that could not be fetched (usually the hourly rate limit), everything before
+it is complete and the export can be resumed from that day. Streams that have
+already sent their headers end with a marker row instead: its date is that day
+and its name NEXT_START_MARKER.
+
+CSV and JSONL are always available, Parquet needs the optional pyarrow package.
+"""
+
+import csv
+import io
+from collections import deque
+from datetime import datetime, timedelta
+
+from serialization import dumps
+
+_pyarrow = None
+
+EXPORT_FIELDS = ('date', 'id', 'foodId', 'name', 'mealType', 'amount', 'unit', 'unitId', 'calories')
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Days fetched ahead of the one being written
+EXPORT_WINDOW = 8
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP = 5000
+
+# Longest range a single export may cover
+MAX_EXPORT_DAYS = 3660
+
+# Name of the last row of an export that stopped early, its date is the start to resume from
+NEXT_START_MARKER = '#next_start'
+
+
+def load_pyarrow():
+    """Import pyarrow on first use, returns None when it is not installed"""
+    global _pyarrow
+    if _pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            _pyarrow = pyarrow
+        except ImportError:  # pyarrow is optional
+            _pyarrow = False
+    return _pyarrow or None
+
+
+def export_dates(start, end):
+    """Every date from start to end (YYYY-MM-DD, inclusive)"""
+    day = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    if last < day:
+        raise ValueError("end must not be before start")
+    if (last - day).days >= MAX_EXPORT_DAYS:
+        raise ValueError(f"An export covers at most {MAX_EXPORT_DAYS} days")
+    dates = []
+    while day <= last:
+        dates.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    return dates
+
+
+def iter_day_foods(dates, fetch_day, submit):
+    """
+    Yield (date, foods) in date order, foods is None for a day that could not be fetched
+    fetch_day(date) returns the FoodLogEntry records of a day, submit(fn, *args) returns a Future
+    """
+    dates = iter(dates)
+    pending = deque()
+    for target_date in dates:
+        pending.append((target_date, submit(fetch_day, target_date)))
+        if len(pending) >= EXPORT_WINDOW:
+            break
+    while pending:
+        target_date, future = pending.popleft()
+        next_date = next(dates, None)
+        if next_date is not None:
+            pending.append((next_date, submit(fetch_day, next_date)))
+        yield target_date, future.result()
+
+
+def export_rows(day_foods, state, marker=False):
+    """
+    Flat rows from iter_day_foods(), stopping at the first day that failed
+    state['next_start'] is set to that day, and stays None if every day was exported
+    marker ends a stopped export with a NEXT_START_MARKER row for that day
+    """
+    state.setdefault('next_start', None)
+    for target_date, foods in day_foods:
+        if foods is None:
+            state['next_start'] = target_date
+            if marker:
+                yield {'date': target_date, 'name': NEXT_START_MARKER}
+            return
+        for food in foods:
+            yield dict(food.as_dict(), date=target_date)
+        state['last_date'] = target_date
+
+
+def csv_chunks(rows, header=True):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 16384:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def jsonl_chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(dumps({field: row.get(field) for field in EXPORT_FIELDS}))
+        if len(chunk) >= 200:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+
+class _ChunkSink:
+    """Write-only file collecting what pyarrow writes so it can be yielded in pieces"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_chunks(rows):
+    pyarrow = load_pyarrow()
+    schema = pyarrow.schema([
+        ('date', pyarrow.string()),
+        ('id', pyarrow.int64()),
+        ('foodId', pyarrow.int64()),
+        ('name', pyarrow.string()),
+        ('mealType', pyarrow.int64()),
+        ('amount', pyarrow.float64()),
+        ('unit', pyarrow.string()),
+        ('unitId', pyarrow.int64()),
+        ('calories', pyarrow.float64()),
+    ])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+
+    def row_group(batch):
+        return pyarrow.Table.from_pylist([{field: row.get(field) for field in EXPORT_FIELDS} for row in batch],
+                                         schema=schema)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP:
+            writer.write_table(row_group(batch))
+            batch = []
+            yield sink.take()
+    if batch:
+        writer.write_table(row_group(batch))
+    writer.close()
+    yield sink.take()
+
+
+def export_chunks(rows, fmt, header=True):
+    """Encoded chunks of rows in an export format, header only applies to CSV"""
+    if fmt == 'csv':
+        return csv_chunks(rows, header=header)
+    if fmt == 'jsonl':
+        return jsonl_chunks(rows)
+    if fmt == 'parquet':
+        return parquet_chunks(rows)
+    raise ValueError(f"Unsupported export format: {fmt}")
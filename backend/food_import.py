@@ -0,0 +1,367 @@
+"""
+Streaming, resumable bulk import of food logs from CSV or JSONL
+
+Rows are read one at a time from the file, resolved to Fitbit entries (food
+names through the local food index, unit names through the units catalog)
+and logged in waves sized to what is left of the hourly rate limit budget.
+After every wave the position in the file is written to a checkpoint, when
+the budget runs out or Fitbit's circuit is open the import pauses and running
+it again with the same checkpoint continues from the first row that was not sent.
+
+Accepted columns / keys (case sensitive, unknown ones are ignored):
+    date                 YYYY-MM-DD or MM/DD/YYYY
+    foodId or food/name  Fitbit food id, or a food name
+    unitId or unit       Fitbit unit id, or a unit name or plural
+    amount
+    mealTypeId, mealType or meal
+                         meal type id or name (Breakfast, Lunch...), optional
+"""
+
+import csv
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from circuit_breaker import UpstreamUnavailable
+from fitbit_client import (fitbit_scheduler, submit_fitbit_api_request, food_log_create_url,
+                           fetch_food_search, log)
+from food_index import normalize_food_name
+from meal_templates import MEAL_TYPES
+from scheduler import DeadlineExceeded, BACKGROUND, PREFETCH
+from serialization import dump_file, load_file, dumps, loads
+
+# Rows logged per wave when the budget is not known yet, and at most otherwise
+WAVE_SIZE = 25
+
+# Imports must not starve interactive users, they only use what the background reserve leaves
+IMPORT_PRIORITY = BACKGROUND
+
+# Seconds a row may wait in the upstream queue, rows that expire are retried on the next run
+IMPORT_DEADLINE = 120
+
+DEFAULT_MEAL_TYPE = 7  # Anytime
+
+# Import states
+RUNNING = 'running'
+PAUSED = 'paused'      # rate limit budget used up or Fitbit unavailable, run again to resume
+DONE = 'done'
+
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y')
+MEAL_TYPE_IDS = {normalize_food_name(name): meal_type for meal_type, name in MEAL_TYPES.items()}
+
+
+class ImportRowError(ValueError):
+    """A row that cannot be turned into a food log entry"""
+
+
+def detect_format(file_name):
+    """jsonl for .jsonl/.ndjson files, csv otherwise"""
+    return 'jsonl' if os.path.splitext(file_name or '')[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+
+def read_rows(file, fmt='csv'):
+    """
+    Yield (line number, row dict) from a text file without reading it all
+    a JSONL line that is not valid JSON is yielded as None so it is reported as a failed row
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def parse_import_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ImportRowError(f"Invalid date: {value!r}")
+
+
+class EntryResolver:
+    """Turns import rows into food log entries, names are resolved locally whenever possible"""
+
+    def __init__(self, catalog, food_index, default_meal_type=DEFAULT_MEAL_TYPE):
+        self.catalog = catalog
+        self.food_index = food_index
+        self.default_meal_type = default_meal_type
+
+    def resolve_food(self, name):
+        """foodId for a food name, from the index or a single Fitbit search"""
+        food_id = self.food_index.get(name)
+        if food_id is not None:
+            return food_id
+        foods_data = fetch_food_search(name, priority=PREFETCH, user='import') or {}
+        foods = foods_data.get('foods', [])
+        # Prefer an exact name match over Fitbit's first result
+        key = normalize_food_name(name)
+        match = next((food for food in foods if normalize_food_name(food.get('name', '')) == key),
+                     foods[0] if foods else None)
+        if match is None:
+            return None
+        self.food_index.add(name, match.get('foodId'))
+        self.food_index.save()
+        return match.get('foodId')
+
+    def resolve_unit(self, row):
+        if row.get('unitId') not in (None, ''):
+            return int(row['unitId'])
+        name = row.get('unit')
+        if not name:
+            raise ImportRowError("unitId or unit is required")
+        unit = self.catalog.resolve_name(name) if self.catalog else None
+        if unit is None:
+            raise ImportRowError(f"Unknown unit: {name}")
+        return unit.id
+
+    def resolve_meal_type(self, row):
+        value = row.get('mealTypeId') or row.get('mealType') or row.get('meal')
+        if value in (None, ''):
+            return self.default_meal_type
+        try:
+            meal_type = int(value)
+        except (TypeError, ValueError):
+            meal_type = MEAL_TYPE_IDS.get(normalize_food_name(value))
+        if meal_type not in MEAL_TYPES:
+            raise ImportRowError(f"Unknown meal type: {value}")
+        return meal_type
+
+    def __call__(self, row):
+        if not isinstance(row, dict):
+            raise ImportRowError("Row is not a JSON object")
+        if not row.get('date'):
+            raise ImportRowError("date is required")
+        try:
+            amount = float(row.get('amount'))
+        except (TypeError, ValueError):
+            raise ImportRowError(f"Invalid amount: {row.get('amount')!r}")
+        try:
+            unit_id = self.resolve_unit(row)
+        except ValueError as e:
+            raise ImportRowError(str(e))
+
+        name = row.get('food') or row.get('name')
+        if row.get('foodId') not in (None, ''):
+            try:
+                food_id = int(row['foodId'])
+            except (TypeError, ValueError):
+                raise ImportRowError(f"Invalid foodId: {row['foodId']!r}")
+        elif name:
+            food_id = self.resolve_food(name)
+            if food_id is None:
+                raise ImportRowError(f"Unknown food: {name}")
+        else:
+            raise ImportRowError("foodId or food is required")
+
+        return {
+            'name': name or f'food {food_id}',
+            'foodId': food_id,
+            'unitId': unit_id,
+            'amount': amount,
+            'mealTypeId': self.resolve_meal_type(row),
+            'date': parse_import_date(row['date']),
+        }
+
+
+class ImportCheckpoint:
+    """
+    Progress of one import, written after every wave
+    the checkpoint only counts logged and failed rows, the rows themselves are appended
+    to <name>.logged.jsonl and <name>.failed.jsonl next to it, so a save costs the same
+    at row 100 000 as at row 100
+    """
+
+    def __init__(self, path, source=None):
+        self.path = path
+        name = os.path.splitext(path)[0]
+        self.logged_path = f"{name}.logged.jsonl"
+        self.failed_path = f"{name}.failed.jsonl"
+        if os.path.exists(path):
+            self.state = load_file(path)
+            if isinstance(self.state['logged'], list):
+                # Checkpoints written before the rows moved out of it
+                self._migrate()
+        else:
+            for side_path in (self.logged_path, self.failed_path):
+                if os.path.exists(side_path):
+                    os.remove(side_path)
+            self.state = {
+                'source': source,
+                'status': RUNNING,
+                'rows_done': 0,
+                'logged': 0,
+                'failed': 0,
+                'retry': [],
+                'updated_at': None,
+            }
+
+    def _migrate(self):
+        logged, failed = self.state['logged'], self.state['failed']
+        self.state['logged'] = self.state['failed'] = 0
+        self.record(logged, failed)
+        self.save()
+
+    @property
+    def rows_done(self):
+        return self.state['rows_done']
+
+    @property
+    def status(self):
+        return self.state['status']
+
+    def record(self, logged, failed):
+        """Append the logged entries and failed rows of a wave"""
+        for side_path, rows, key in ((self.logged_path, logged, 'logged'), (self.failed_path, failed, 'failed')):
+            if rows:
+                with open(side_path, 'ab') as file:
+                    file.write(b''.join(dumps(row) + b'\n' for row in rows))
+            self.state[key] += len(rows)
+
+    def _read(self, side_path):
+        if not os.path.exists(side_path):
+            return []
+        with open(side_path, 'rb') as file:
+            # A line without its newline is still being written by the import thread
+            return [loads(line) for line in file if line.endswith(b'\n')]
+
+    def logged_entries(self):
+        """Entries logged so far, {logId, name, date, mealTypeId}"""
+        return self._read(self.logged_path)
+
+    def failed_rows(self):
+        """Rows that failed so far, {row, error}"""
+        return self._read(self.failed_path)
+
+    def save(self):
+        self.state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        tmp_path = f"{self.path}.tmp"
+        dump_file(self.state, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        return {
+            'source': self.state['source'],
+            'status': self.state['status'],
+            'rows_done': self.state['rows_done'],
+            'logged': self.state['logged'],
+            'failed': self.state['failed'],
+            'retry': len(self.state.get('retry', [])),
+            'updated_at': self.state['updated_at'],
+        }
+
+
+def log_wave(entries):
+    """
+    Log a wave of (line number, entry) concurrently, returns (logged, failed, expired, retry_in)
+    expired holds the (line number, entry) pairs that were never sent because the
+    budget ran out while they were queued or the circuit was open, retry_in is
+    the seconds until the circuit lets calls through again, None if it is closed
+    """
+    deadline = time.monotonic() + IMPORT_DEADLINE
+    pending = [(line_no, entry, submit_fitbit_api_request(food_log_create_url(entry), method='POST',
+                                                          description=f"importing {entry['name']}",
+                                                          priority=IMPORT_PRIORITY, user='import',
+                                                          deadline=deadline))
+               for line_no, entry in entries]
+    logged = []
+    failed = []
+    expired = []
+    retry_in = None
+    for line_no, entry, future in pending:
+        try:
+            result = future.result()
+        except UpstreamUnavailable as e:
+            # Subclass of DeadlineExceeded, but retrying before the circuit closes only spins
+            expired.append((line_no, entry))
+            retry_in = max(retry_in or 0, e.retry_in or 0)
+            continue
+        except DeadlineExceeded:
+            expired.append((line_no, entry))
+            continue
+        if result:
+            logged.append({
+                'logId': result.get('foodLog', {}).get('logId'),
+                'name': entry['name'],
+                'date': entry['date'],
+                'mealTypeId': entry['mealTypeId'],
+            })
+        else:
+            failed.append({'row': line_no, 'error': f"{entry['name']}: Request failed"})
+    return logged, failed, expired, retry_in
+
+
+def run_import(rows, checkpoint, resolve_entry, wave_size=WAVE_SIZE, wait=False, on_wave=None):
+    """
+    Import rows from read_rows() into Fitbit, starting after the rows the checkpoint has done
+    stops with the checkpoint PAUSED when the budget is used up or Fitbit's circuit is
+    open (state['retry_in'] is then set), unless wait is set, in which case it sleeps
+    until the rate limit window resets or the circuit closes and carries on
+    on_wave(logged, failed) is called after every wave
+    """
+    rows = islice(rows, checkpoint.rows_done, None)
+    state = checkpoint.state
+    state['status'] = RUNNING
+    state.setdefault('retry', [])
+    state.pop('retry_in', None)
+
+    while True:
+        headroom = fitbit_scheduler.headroom(IMPORT_PRIORITY)
+        # Until Fitbit has reported the budget a single row is sent to learn it
+        size = 1 if headroom is None else min(wave_size, headroom)
+        if size <= 0:
+            reset_in = fitbit_scheduler.reset_in()
+            if not wait or reset_in is None:
+                state['status'] = PAUSED
+                checkpoint.save()
+                return checkpoint
+            log(f"[Import] Rate limit budget used, waiting {reset_in}s for the next window")
+            time.sleep(reset_in + 1)
+            continue
+
+        # Rows that expired in the queue last time go first
+        entries = [(retry['row'], retry['entry']) for retry in state['retry'][:size]]
+        retried = len(entries)
+        wave = list(islice(rows, size - retried))
+        if not entries and not wave:
+            break
+
+        failed = []
+        for line_no, row in wave:
+            try:
+                entries.append((line_no, resolve_entry(row)))
+            except ImportRowError as e:
+                failed.append({'row': line_no, 'error': str(e)})
+
+        logged, upstream_failed, expired, retry_in = log_wave(entries)
+        failed.extend(upstream_failed)
+
+        state['retry'] = [{'row': line_no, 'entry': entry} for line_no, entry in expired] + state['retry'][retried:]
+        state['rows_done'] += len(wave)
+        checkpoint.record(logged, failed)
+        checkpoint.save()
+        if on_wave is not None:
+            on_wave(logged, failed)
+
+        if retry_in is not None:
+            if not wait:
+                state['status'] = PAUSED
+                state['retry_in'] = retry_in
+                checkpoint.save()
+                return checkpoint
+            log(f"[Import] Fitbit is unavailable, waiting {retry_in}s before retrying")
+            time.sleep(retry_in + 1)
+
+    state['status'] = DONE
+    checkpoint.save()
+    return checkpoint
@@ -0,0 +1,71 @@
+"""
+Local index of food names to Fitbit foodIds
+
+Imports only have food names, resolving each one with a Fitbit search would
+spend the hourly budget on lookups. The index is seeded from the meal
+templates, learns every food seen in a day log and remembers names resolved
+through search, so a name costs at most one upstream search ever.
+"""
+
+import os
+import threading
+
+from meal_templates import MEALS
+from serialization import dump_file, load_file
+from units_catalog import normalize_unit_name as normalize_food_name
+
+DEFAULT_PATH = os.getenv('FOOD_INDEX_PATH',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_index.json'))
+
+
+class FoodIndex:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._foods = None
+        self._dirty = False
+
+    def _load(self):
+        if self._foods is None:
+            foods = {}
+            for meal in MEALS.values():
+                for food in meal:
+                    foods[normalize_food_name(food['name'])] = food['foodId']
+            if os.path.exists(self.path):
+                foods.update(load_file(self.path))
+            self._foods = foods
+        return self._foods
+
+    def get(self, name):
+        """foodId for a food name, None if the name is not known"""
+        with self._lock:
+            return self._load().get(normalize_food_name(name))
+
+    def add(self, name, food_id):
+        key = normalize_food_name(name)
+        if not key or food_id is None:
+            return
+        with self._lock:
+            foods = self._load()
+            if foods.get(key) != food_id:
+                foods[key] = food_id
+                self._dirty = True
+
+    def learn(self, foods):
+        """Add the FoodLogEntry records of a day log, saved if anything was new"""
+        for food in foods:
+            self.add(food.name, food.foodId)
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            dump_file(self._foods, tmp_path)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
@@ -0,0 +1,431 @@
+"""
+Local SQLite mirror of the Fitbit food log
+
+Past days almost never change, yet every read used to go to Fitbit (or a five
+minute cache of it). The mirror keeps every entry keyed by its logId together
+with a checksum per day, and MirrorSync keeps it current:
+
+- days written through the server or the CLI are marked dirty and fetched again
+- today and yesterday are refreshed once they are older than HOT_DAY_TTL
+- a periodic reconciliation fetches the last RECONCILE_DAYS days and compares
+  checksums, picking up changes made from the Fitbit app
+
+Fitbit has no changes feed for food logs. The write paths and, when a
+subscription is set up, Fitbit's webhook notifications are what mark days dirty.
+
+The mirror keeps one instead: every entry added, removed or updated, by a write
+through the server (applied right away) or found by a sync (the difference
+between the stored and the fetched day), gets the next version number in a
+changelog of the last CHANGELOG_SIZE changes, and each day remembers the version
+of its last change. Clients that poll with the last version they saw get only
+what changed since, or a resync when the changelog no longer reaches back that far.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import FoodLogEntry
+from serialization import dumps, loads
+
+DEFAULT_PATH = os.getenv('FOOD_MIRROR_PATH',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_mirror.sqlite3'))
+
+SYNC_INTERVAL = 60              # seconds between sync passes
+HOT_DAY_TTL = 300               # today and yesterday are re-fetched after 5 minutes
+WEBHOOK_HOT_DAY_TTL = 3600      # when Fitbit notifies changes the hot days can be kept much longer
+RECONCILE_INTERVAL = 6 * 3600   # full checksum reconciliation every 6 hours
+RECONCILE_DAYS = 30
+
+CHANGELOG_SIZE = 10000          # changes kept, older versions get a resync
+CHANGES_PAGE = 500              # changes returned at most per request
+
+# Changelog operations
+ADDED = 'added'
+REMOVED = 'removed'
+UPDATED = 'updated'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS food_logs (
+    log_id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    food_id INTEGER,
+    name TEXT,
+    meal_type INTEGER,
+    amount,
+    unit TEXT,
+    unit_id INTEGER,
+    calories,
+    time TEXT
+);
+CREATE INDEX IF NOT EXISTS food_logs_date ON food_logs (date);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    checksum TEXT,
+    synced_at REAL,
+    dirty_since REAL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    op TEXT NOT NULL,
+    log_id INTEGER,
+    entry TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_date ON changes (date, version);
+CREATE TABLE IF NOT EXISTS day_versions (
+    date TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def day_checksum(foods):
+    """Checksum of a day's FoodLogEntry records, independent of their order"""
+    foods = sorted(foods, key=lambda food: str(food.id))
+    return hashlib.sha1(dumps([food.as_dict() for food in foods], sort_keys=True)).hexdigest()
+
+
+def day_changes(target_date, stored, foods):
+    """(date, op, log_id, entry) changes turning the stored {log_id: entry} of a day into foods"""
+    changes = []
+    for food in foods:
+        previous = stored.get(food.id)
+        if previous is None:
+            changes.append((target_date, ADDED, food.id, food))
+        elif previous != food:
+            changes.append((target_date, UPDATED, food.id, food))
+    fetched = {food.id for food in foods}
+    changes.extend((target_date, REMOVED, log_id, None) for log_id in stored if log_id not in fetched)
+    return changes
+
+
+def food_row(target_date, food):
+    """food_logs row of a FoodLogEntry"""
+    return (food.id, target_date, food.foodId, food.name, food.mealType, food.amount,
+            food.unit, food.unitId, food.calories, food.time)
+
+
+def hot_dates():
+    """Days that still change often, today and yesterday"""
+    today = datetime.now()
+    return (today.strftime('%Y-%m-%d'), (today - timedelta(days=1)).strftime('%Y-%m-%d'))
+
+
+def timestamp(value):
+    return datetime.fromtimestamp(value).isoformat(timespec='seconds') if value else None
+
+
+class FoodMirror:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def day_foods(self, target_date, max_age=None, stale_ok=False):
+        """
+        Mirrored FoodLogEntry records of a day, None if the day is not mirrored, dirty,
+        or was synced more than max_age seconds ago
+        stale_ok returns the last synced copy even if it is dirty or old
+        """
+        with self._lock:
+            db = self._connect()
+            day = db.execute('SELECT synced_at, dirty_since FROM days WHERE date = ?', (target_date,)).fetchone()
+            if day is None or day[0] is None:
+                return None
+            if not stale_ok and day[1] is not None:
+                return None
+            if not stale_ok and max_age is not None and time.time() - day[0] > max_age:
+                return None
+            rows = self._day_rows(db, target_date)
+        return [FoodLogEntry(*row) for row in rows]
+
+    def _day_rows(self, db, target_date):
+        # Columns in the field order of FoodLogEntry
+        return db.execute('SELECT log_id, food_id, name, meal_type, amount, unit, unit_id, calories, time '
+                          'FROM food_logs WHERE date = ? ORDER BY rowid', (target_date,)).fetchall()
+
+    def store_day(self, target_date, foods):
+        """Replace a day with freshly fetched foods, returns True if its content changed"""
+        checksum = day_checksum(foods)
+        with self._lock:
+            db = self._connect()
+            with db:
+                day = db.execute('SELECT checksum FROM days WHERE date = ?', (target_date,)).fetchone()
+                changed = day is None or day[0] != checksum
+                if changed:
+                    # Entries written through the server are stored already, only the rest is a change
+                    stored = {row[0]: FoodLogEntry(*row) for row in self._day_rows(db, target_date)}
+                    db.execute('DELETE FROM food_logs WHERE date = ?', (target_date,))
+                    db.executemany('INSERT OR REPLACE INTO food_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   [food_row(target_date, food) for food in foods])
+                    self._record(db, day_changes(target_date, stored, foods))
+                db.execute('INSERT OR REPLACE INTO days (date, checksum, synced_at, dirty_since) '
+                           'VALUES (?, ?, ?, NULL)', (target_date, checksum, time.time()))
+        return changed
+
+    def _record(self, db, changes):
+        """Append (date, op, log_id, entry) changes to the changelog, inside the caller's transaction"""
+        version = None
+        for target_date, op, log_id, entry in changes:
+            version = db.execute('INSERT INTO changes (date, op, log_id, entry) VALUES (?, ?, ?, ?)',
+                                 (target_date, op, log_id,
+                                  dumps(entry.as_dict()).decode('utf-8') if entry is not None else None)).lastrowid
+            db.execute('INSERT OR REPLACE INTO day_versions VALUES (?, ?)', (target_date, version))
+        if version is not None and version > CHANGELOG_SIZE:
+            db.execute('DELETE FROM changes WHERE version <= ?', (version - CHANGELOG_SIZE,))
+
+    def apply_added(self, target_date, food):
+        """An entry logged through the server, stored and recorded before a sync fetches its day"""
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('INSERT OR REPLACE INTO food_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           food_row(target_date, food))
+                self._record(db, [(target_date, ADDED, food.id, food)])
+
+    def entry_date(self, log_id):
+        """Date of a mirrored entry, None when the mirror does not have it"""
+        with self._lock:
+            row = self._connect().execute('SELECT date FROM food_logs WHERE log_id = ?', (log_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def apply_removed(self, target_date, log_id):
+        """An entry deleted through the server, target_date may be None when the mirror knows the entry"""
+        with self._lock:
+            db = self._connect()
+            with db:
+                row = db.execute('SELECT date FROM food_logs WHERE log_id = ?', (log_id,)).fetchone()
+                if row is not None:
+                    target_date = row[0]
+                    db.execute('DELETE FROM food_logs WHERE log_id = ?', (log_id,))
+                if target_date:
+                    self._record(db, [(target_date, REMOVED, log_id, None)])
+
+    def apply_replaced(self, target_date, log_id, new_date, food):
+        """
+        An entry replaced by an edit under a new logId, an update on the same day,
+        a removal and an addition when the edit moved it to another day
+        """
+        with self._lock:
+            db = self._connect()
+            with db:
+                row = db.execute('SELECT date FROM food_logs WHERE log_id = ?', (log_id,)).fetchone()
+                target_date = row[0] if row is not None else target_date or new_date
+                db.execute('DELETE FROM food_logs WHERE log_id = ?', (log_id,))
+                db.execute('INSERT OR REPLACE INTO food_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           food_row(new_date, food))
+                if target_date == new_date:
+                    self._record(db, [(new_date, UPDATED, log_id, food)])
+                else:
+                    self._record(db, [(target_date, REMOVED, log_id, None), (new_date, ADDED, food.id, food)])
+
+    def changes(self, since, target_date=None, limit=CHANGES_PAGE):
+        """
+        (version, changes, more) for the changes after version since, oldest first,
+        changes is None when the changelog no longer reaches back to since or since
+        is from another mirror, the client then has to fetch its days again
+        """
+        with self._lock:
+            db = self._connect()
+            version = self._version(db)
+            first = db.execute('SELECT MIN(version) FROM changes').fetchone()[0]
+            if since > version or (since < version and (first is None or since < first - 1)):
+                return version, None, False
+            query = 'SELECT version, date, op, log_id, entry FROM changes WHERE version > ? AND version <= ?'
+            params = [since, version]
+            if target_date:
+                query += ' AND date = ?'
+                params.append(target_date)
+            rows = db.execute(f'{query} ORDER BY version LIMIT ?', (*params, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [{'version': row[0], 'date': row[1], 'op': row[2], 'id': row[3],
+                    **({'entry': loads(row[4])} if row[4] else {})} for row in rows]
+        # A partial page ends at its last change, the client asks again from there
+        return (rows[-1][0] if more else version), changes, more
+
+    def _version(self, db):
+        # The last version handed out, even once its change has been dropped
+        row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def version(self):
+        with self._lock:
+            return self._version(self._connect())
+
+    def day_versions(self, dates):
+        """Version of the last change of each date, 0 for days without one"""
+        with self._lock:
+            versions = dict(self._connect().execute(
+                f"SELECT date, version FROM day_versions WHERE date IN ({','.join('?' * len(dates))})",
+                tuple(dates)).fetchall())
+        return {target_date: versions.get(target_date, 0) for target_date in dates}
+
+    def food_history(self):
+        """
+        (food_id, name, times logged, last date, unit_id, amount) per mirrored food,
+        the name, unit and amount are those of its most recent entry
+        """
+        with self._lock:
+            # With a single max() SQLite takes the bare columns from the row holding it
+            return self._connect().execute(
+                'SELECT food_id, name, COUNT(*), MAX(date), unit_id, amount FROM food_logs '
+                'WHERE food_id IS NOT NULL GROUP BY food_id').fetchall()
+
+    def mark_dirty(self, dates):
+        """Days changed upstream, they are fetched again before being served"""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with db:
+                for target_date in dates:
+                    db.execute('INSERT INTO days (date, dirty_since) VALUES (?, ?) '
+                               'ON CONFLICT (date) DO UPDATE SET dirty_since = COALESCE(dirty_since, excluded.dirty_since)',
+                               (target_date, now))
+
+    def dirty_dates(self):
+        with self._lock:
+            rows = self._connect().execute('SELECT date FROM days WHERE dirty_since IS NOT NULL ORDER BY date DESC').fetchall()
+        return [row[0] for row in rows]
+
+    def stale_dates(self, dates, max_age):
+        """The dates that are not mirrored or were synced more than max_age seconds ago"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            db = self._connect()
+            fresh = {row[0] for row in db.execute(
+                f"SELECT date FROM days WHERE synced_at >= ? AND dirty_since IS NULL "
+                f"AND date IN ({','.join('?' * len(dates))})", (cutoff, *dates))}
+        return [target_date for target_date in dates if target_date not in fresh]
+
+    def set_state(self, key, value):
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (key, value))
+
+    def get_state(self, key):
+        with self._lock:
+            row = self._connect().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def status(self):
+        with self._lock:
+            db = self._connect()
+            days, dirty, oldest_dirty, last_day_sync = db.execute(
+                'SELECT COUNT(*), COUNT(dirty_since), MIN(dirty_since), MAX(synced_at) FROM days').fetchone()
+            entries = db.execute('SELECT COUNT(*) FROM food_logs').fetchone()[0]
+            state = dict(db.execute('SELECT key, value FROM sync_state').fetchall())
+            changes, first_version, version = db.execute('SELECT COUNT(*), MIN(version), MAX(version) FROM changes').fetchone()
+        return {
+            'days': days,
+            'entries': entries,
+            'dirty_days': dirty,
+            # Age of the oldest change that is not mirrored yet
+            'lag_seconds': round(time.time() - oldest_dirty, 1) if oldest_dirty else 0,
+            'last_sync': timestamp(state.get('last_sync')),
+            'last_day_synced': timestamp(last_day_sync),
+            'last_reconcile': timestamp(state.get('last_reconcile')),
+            'changed_on_last_reconcile': int(state.get('changed_on_last_reconcile') or 0),
+            'changelog': {'changes': changes, 'first_version': first_version, 'version': version or 0},
+        }
+
+
+class MirrorSync:
+    """
+    Incremental sync engine for a FoodMirror
+    fetch_day(date) returns the FoodLogEntry records of a day or None if it failed,
+    on_change(dates) is called with the days whose content changed
+    """
+
+    def __init__(self, mirror, fetch_day, on_change=None, interval=SYNC_INTERVAL,
+                 reconcile_interval=RECONCILE_INTERVAL, reconcile_days=RECONCILE_DAYS, hot_ttl=HOT_DAY_TTL):
+        self.mirror = mirror
+        self.fetch_day = fetch_day
+        self.on_change = on_change
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self.reconcile_days = reconcile_days
+        self.hot_ttl = hot_ttl
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+
+    def sync_dates(self, dates):
+        """Fetch and store days, returns the ones that changed"""
+        changed = []
+        for target_date in dates:
+            foods = self.fetch_day(target_date)
+            if foods is None:
+                continue
+            if self.mirror.store_day(target_date, foods):
+                changed.append(target_date)
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+        return changed
+
+    def reconcile(self, days=None):
+        """Fetch every day in the reconciliation window and compare checksums"""
+        today = datetime.now()
+        dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days or self.reconcile_days)]
+        changed = self.sync_dates(dates)
+        self.mirror.set_state('last_reconcile', time.time())
+        self.mirror.set_state('changed_on_last_reconcile', len(changed))
+        return changed
+
+    def run_once(self):
+        """One sync pass: dirty days, stale hot days, and the reconciliation when it is due"""
+        with self._run_lock:
+            dates = self.mirror.dirty_dates()
+            dates += [d for d in self.mirror.stale_dates(list(hot_dates()), self.hot_ttl) if d not in dates]
+            changed = self.sync_dates(dates)
+            last_reconcile = self.mirror.get_state('last_reconcile') or 0
+            if time.time() - last_reconcile >= self.reconcile_interval:
+                changed += self.reconcile()
+            self.mirror.set_state('last_sync', time.time())
+            return changed
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        """Run the next pass now instead of waiting for the interval"""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='food-mirror-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                changed = self.run_once()
+                if changed:
+                    print(f"[Backend] Mirror sync updated {len(changed)} days")
+            except Exception as e:
+                print(f"[Backend] Mirror sync failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,207 @@
+"""
+Meal templates shared by the server and the CLI
+
+Each template is a list of foods logged together. mealTypeId and date are
+filled in when a template is logged, see build_meal_entries().
+"""
+
+MEAL_NAMES = {
+    1: 'Morning Shake',
+    2: 'Oatmeal Pie',
+    3: 'Yogurt/Blueberries',
+    4: 'Grapes/Carrots',
+    5: 'Celery/Peanut Butter',
+    6: 'Nuts/Banana',
+    7: 'Granola/Preworkout',
+    8: 'Post Workout',
+    9: 'Chicken and Pasta',
+    10: 'Evening Shake',
+}
+
+MEAL_TYPES = {
+    1: 'Breakfast',
+    2: 'Morning Snack',
+    3: 'Lunch',
+    4: 'Afternoon Snack',
+    5: 'Dinner',
+    7: 'Anytime',
+}
+
+MEALS = {
+    1: [
+        {
+            "name": 'Protein Shake',
+            "foodId": 22788636, # Protein Shake
+            "unitId": 301,    # scoop
+            "amount": 1,
+        },
+    ],
+    2: [
+        {
+            "name": 'Oatmeal',
+            "foodId": 692777597,
+            "unitId": 91,    
+            "amount": .5,
+        },
+        {
+            "name": 'Raisins',
+            "foodId": 692772145, # Raisins
+            "unitId": 91,    # Cups
+            "amount": .25,
+        },
+        {
+            "name": 'Unsweetened Applesauce',
+            "foodId": 692772244, # Unsweetened Applesauce
+            "unitId": 91,    # Cups
+            "amount": .5,
+        },
+        {
+            "name": 'Healthy Grains, Peanut Butter Whole Grain Clusters',
+            "foodId": 767757700,
+            "unitId": 91,    # Cups
+            "amount": .5,
+        },
+        {
+            "name": 'Fish Oil Liquid Softgels',
+            "foodId": 692747679,
+            "unitId": 322,    # softgel
+            "amount": 2,
+        },
+        {
+            "name": 'MultiVites Gummy Vitamins',
+            "foodId": 17964282,
+            "unitId": 304,    # Serving
+            "amount": 2,
+        }
+    ],
+    3: [
+        {
+            "name": 'Zero Sugar Yogurt',
+            "foodId": 692045929,
+            "unitId": 69,    # Container
+            "amount": 1,
+        },
+        {
+            "name": 'blueberries',
+            "foodId": 82547,
+            "unitId": 91,    # Cups
+            "amount": .33,
+        }
+    ],
+    4: [
+        {
+            "name": 'Grapes',
+            "foodId": 751876808,
+            "unitId": 148,    # Grapes
+            "amount": 40,
+        },
+        {
+            "name": 'Carrots',
+            "foodId": 784706037,
+            "unitId": 226,    # oz
+            "amount": 6,
+        },
+    ],
+    5: [
+        {
+            "name": 'Peanut Butter',
+            "foodId": 692135088,
+            "unitId": 349,    # tbsp
+            "amount": 2,
+        },
+        {
+            "name": 'Celery',
+            "foodId": 721624116,
+            "unitId": 339,    # stick
+            "amount": 3,
+        },
+    ],
+    6: [
+        {
+            "name": 'Dry Roasted Peanuts, Unsalted',
+            "foodId": 692767466,
+            "unitId": 251,    # piece
+            "amount": 18,
+        },
+        {
+            "name": 'Banana',
+            "foodId": 8100,
+            "unitId": 147,    # Bar
+            "amount": 1,
+        }
+    ],
+    7: [
+        {
+            "name": 'Protein Bar',
+            "foodId": 725735405,
+            "unitId": 17,    # Bar
+            "amount": 1,
+        },
+        {
+            "name": 'Pre Workout',
+            "foodId": 798698937,
+            "unitId": 301,    # Container
+            "amount": 1,
+        },
+    ],
+    8: [
+        {
+            "name": 'Protein Shake',
+            "foodId": 22788636, # Protein Shake
+            "unitId": 301,    # Packets
+            "amount": 1,
+        },
+    ],
+    9: [
+        {
+            "name": 'Protein Pasta',
+            "foodId": 778450458,
+            "unitId": 226,    # Oz
+            "amount": 3,
+        },
+        {
+            "name": 'Chicken',
+            "foodId": 787982016,
+            "unitId": 226,    # Oz
+            "amount": 6,
+        },
+        {
+            "name": 'Parmasean Cheese',
+            "foodId": 752199077,
+            "unitId": 364,    # Tsp
+            "amount": 5,
+        },
+        {
+            "name": 'Brocolli',
+            "foodId": 82945,
+            "unitId": 304,    # serving
+            "amount": 1,
+        },
+    ],
+    10: [
+        {
+            "name": 'Milk (1%)',
+            "foodId": 692771571,
+            "unitId": 91,    # cups
+            "amount": 2,
+        },
+        {
+            "name": 'Casein',
+            "foodId": 807556543,
+            "unitId": 301,    # scoop
+            "amount": 2,
+        },
+    ],
+}
+
+
+def build_meal_entries(meal, meal_type, date):
+    """Food entries for a meal template on a date, None if the meal is unknown"""
+    if meal not in MEALS:
+        return None
+    return [dict(food, mealTypeId=meal_type, date=date) for food in MEALS[meal]]
+
+
+def template_food_ids():
+    """Every foodId used by a meal template"""
+    return sorted({food['foodId'] for foods in MEALS.values() for food in foods})
@@ -0,0 +1,152 @@
+"""
+Records for the Fitbit data the backend passes around
+
+Food log entries, food search hits, units, and calorie and weight chart points are
+parsed from Fitbit's JSON once, by the from_fitbit() of their record, and shared
+by the routes, the caches, the food mirror and the CLI. Records are slotted, so
+a cached day costs well under half the memory of the equivalent dicts. They are
+not frozen because a frozen __init__ makes parsing about three times slower, but
+cached records are shared between requests and must be treated as read only.
+Fields are named like the JSON keys the API has always used, orjson and Flask
+serialize the records as they are and as_dict() gives the same mapping for
+everything else.
+"""
+
+import sys
+from dataclasses import dataclass
+
+
+class _Record:
+    __slots__ = ()
+
+    def as_dict(self):
+        """The record as a plain dict with its JSON keys"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def cache_size(self):
+        """Bytes held by the record and its field values, for the bounded caches"""
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, name)) for name in self.__slots__)
+
+
+@dataclass(slots=True)
+class FoodLogEntry(_Record):
+    """A logged food as served by /api/foods"""
+    id: int
+    foodId: int
+    name: str
+    mealType: int
+    amount: float
+    unit: str
+    unitId: int
+    calories: int
+    time: str
+
+    @classmethod
+    def from_fitbit(cls, food):
+        """Entry of the foods list of a Fitbit day log"""
+        logged_food = food.get('loggedFood') or {}
+        unit = logged_food.get('unit') or {}
+        return cls(
+            food.get('logId'),
+            logged_food.get('foodId'),
+            logged_food.get('name', 'Unknown'),
+            logged_food.get('mealTypeId', 0),
+            logged_food.get('amount', 0),
+            unit.get('name', ''),
+            unit.get('id'),
+            logged_food.get('calories', 0),
+            logged_food.get('logDate', ''),
+        )
+
+
+@dataclass(slots=True)
+class FoodSearchHit(_Record):
+    """A food search result, units is the compact [{id, name}] list from the units catalog"""
+    id: int
+    name: str
+    brand: str
+    calories: int
+    units: tuple
+
+    @classmethod
+    def from_fitbit(cls, food, catalog=None):
+        """Food of a Fitbit search result, unit names come from the catalog when there is one"""
+        unit_ids = food.get('units')
+        return cls(
+            food.get('foodId'),
+            food.get('name', 'Unknown'),
+            food.get('brand', ''),
+            food.get('calories', 0),
+            catalog.details(unit_ids) if unit_ids and catalog else (),
+        )
+
+
+@dataclass(slots=True)
+class PersonalFoodHit(_Record):
+    """
+    A food from the personal foods ranked ahead of search results, with the unit
+    and amount it was last logged in
+    """
+    id: int
+    name: str
+    brand: str
+    calories: int
+    units: tuple
+    unitId: int
+    amount: float
+    timesLogged: int
+    favorite: bool
+    personal: bool = True
+
+
+@dataclass(slots=True)
+class Unit(_Record):
+    id: int
+    name: str
+    plural: str
+
+    @classmethod
+    def from_fitbit(cls, unit):
+        return cls(unit.get('id'), unit.get('name'), unit.get('plural'))
+
+
+@dataclass(slots=True)
+class DailyCalories(_Record):
+    date: str
+    calories_consumed: int
+    calories_burned: int
+    net_calories: int
+
+    @classmethod
+    def range_from_fitbit(cls, dates, calories_in_data, calories_out_data):
+        """
+        One record per date from Fitbit's caloriesIn and activities/calories time
+        series, a missing series or day counts as 0
+        """
+        if not isinstance(calories_in_data, dict):
+            calories_in_data = {}
+        if not isinstance(calories_out_data, dict):
+            calories_out_data = {}
+        consumed = {entry.get('dateTime'): entry.get('value', 0)
+                    for entry in calories_in_data.get('foods-log-caloriesIn', [])}
+        burned = {entry.get('dateTime'): entry.get('value', 0)
+                  for entry in calories_out_data.get('activities-calories', [])}
+        days = []
+        for target_date in dates:
+            calories_consumed = consumed.get(target_date, 0)
+            calories_burned = burned.get(target_date, 0)
+            days.append(cls(target_date, calories_consumed, calories_burned,
+                            int(calories_consumed) - int(calories_burned)))
+        return days
+
+
+@dataclass(slots=True)
+class WeightPoint(_Record):
+    date: str
+    weight: float
+
+    @classmethod
+    def from_fitbit(cls, target_date, weight_data):
+        """Weight of a day from a Fitbit body/log/weight response, None when nothing was logged"""
+        weights = weight_data.get('weight') if isinstance(weight_data, dict) else None
+        return cls(target_date, weights[0].get('value') if weights else None)
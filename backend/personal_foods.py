@@ -0,0 +1,147 @@
+"""
+Personal foods ranked ahead of Fitbit's food search
+
+Most of what is logged is the same few dozen foods, yet every search went to
+Fitbit. PersonalFoods merges Fitbit's recent, frequent and favorite lists with
+how often each food was logged here (counted from the food mirror, and counted
+again whenever it changes) and ranks them locally:
+
+    score = times logged + FAVORITE_BONUS if a favorite + RECENT_BONUS if recent
+            + up to FREQUENT_BONUS by the position in Fitbit's frequent list,
+            times PREFIX_FACTOR when the name starts with the query
+
+The search route answers from these first and only asks Fitbit when fewer than
+ENOUGH_MATCHES personal foods match. With no query the top foods are the quick
+picks. Logging expires the recent and frequent lists, they are fetched again
+the next time they are needed.
+"""
+
+import threading
+
+from fitbit_client import PERSONAL_FOOD_LISTS
+from food_index import normalize_food_name
+from models import PersonalFoodHit
+
+ENOUGH_MATCHES = 5
+MAX_RESULTS = 20
+
+FAVORITE_BONUS = 10
+FREQUENT_BONUS = 8
+RECENT_BONUS = 3
+PREFIX_FACTOR = 2
+
+
+class PersonalFoods:
+    """
+    load_history() returns (food_id, name, times logged, last date, unit_id, amount)
+    rows like FoodMirror.food_history(), food_units(food_id) the known unit ids of a food
+    """
+
+    def __init__(self, load_history, food_units=None):
+        self.load_history = load_history
+        self.food_units = food_units
+        self._lock = threading.Lock()
+        self._history = None
+        self._lists = {}
+        self._expired = set(PERSONAL_FOOD_LISTS)
+        self._ranked = None
+
+    def _load_history(self):
+        if self._history is None:
+            self._history = {row[0]: {'name': row[1], 'count': row[2], 'last': row[3],
+                                      'unitId': row[4], 'amount': row[5]}
+                             for row in self.load_history()}
+        return self._history
+
+    def set_list(self, kind, foods):
+        """Fitbit's recent, frequent or favorite foods as fetched"""
+        with self._lock:
+            self._lists[kind] = [food for food in foods if isinstance(food, dict) and food.get('foodId')]
+            self._expired.discard(kind)
+            self._ranked = None
+
+    def expire(self, kinds=PERSONAL_FOOD_LISTS):
+        with self._lock:
+            self._expired.update(kinds)
+
+    def expired(self):
+        """Lists to fetch (again) from Fitbit"""
+        with self._lock:
+            return [kind for kind in PERSONAL_FOOD_LISTS if kind in self._expired]
+
+    def forget_history(self):
+        """The mirror changed, count again on next use"""
+        with self._lock:
+            self._history = None
+            self._ranked = None
+
+    def _candidates(self):
+        """Every personal food with its base score, best first"""
+        if self._ranked is not None:
+            return self._ranked
+        foods = {}
+        for food_id, logged in self._load_history().items():
+            foods[food_id] = {'id': food_id, 'name': logged['name'] or f'Food {food_id}', 'brand': '',
+                              'calories': 0, 'units': (), 'unitId': logged.get('unitId'),
+                              'amount': logged.get('amount'), 'timesLogged': logged['count'],
+                              'favorite': False, 'score': logged['count']}
+        for kind in PERSONAL_FOOD_LISTS:
+            listed = self._lists.get(kind, [])
+            for rank, food in enumerate(listed):
+                food_id = int(food['foodId'])
+                unit = food.get('unit') or food.get('defaultUnit') or {}
+                candidate = foods.setdefault(food_id, {
+                    'id': food_id, 'name': food.get('name') or f'Food {food_id}', 'brand': '', 'calories': 0,
+                    'units': (), 'unitId': unit.get('id'), 'amount': food.get('amount', food.get('defaultServingSize')),
+                    'timesLogged': 0, 'favorite': False, 'score': 0})
+                candidate['brand'] = candidate['brand'] or food.get('brand', '')
+                candidate['calories'] = candidate['calories'] or food.get('calories', 0)
+                candidate['units'] = candidate['units'] or tuple(food.get('units') or ())
+                if kind == 'favorite':
+                    candidate['favorite'] = True
+                    candidate['score'] += FAVORITE_BONUS
+                elif kind == 'frequent':
+                    candidate['score'] += FREQUENT_BONUS * (1 - rank / len(listed))
+                else:
+                    candidate['score'] += RECENT_BONUS
+        for candidate in foods.values():
+            candidate['key'] = normalize_food_name(candidate['name'])
+        self._ranked = sorted(foods.values(), key=lambda food: (-food['score'], food['key']))
+        return self._ranked
+
+    def search(self, query='', catalog=None, limit=MAX_RESULTS):
+        """PersonalFoodHit records matching every word of the query, best first, the quick picks without one"""
+        key = normalize_food_name(query)
+        words = key.split()
+        with self._lock:
+            candidates = self._candidates()
+        if words:
+            matches = [food for food in candidates if all(word in food['key'] for word in words)]
+            # Sorting is stable, so equal scores keep the base order
+            matches.sort(key=lambda food: -food['score'] * (PREFIX_FACTOR if food['key'].startswith(key) else 1))
+        else:
+            matches = candidates
+        return [self._hit(food, catalog) for food in matches[:limit]]
+
+    def _hit(self, food, catalog):
+        unit_ids = food['units'] or (self.food_units(food['id']) if self.food_units else None) or \
+            ((food['unitId'],) if food['unitId'] is not None else ())
+        return PersonalFoodHit(
+            food['id'],
+            food['name'],
+            food['brand'],
+            food['calories'],
+            catalog.details(unit_ids) if catalog else (),
+            food['unitId'],
+            food['amount'],
+            food['timesLogged'],
+            food['favorite'],
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'history_foods': len(self._history) if self._history is not None else None,
+                'lists': {kind: len(foods) for kind, foods in self._lists.items()},
+                'expired': [kind for kind in PERSONAL_FOOD_LISTS if kind in self._expired],
+            }
@@ -0,0 +1,192 @@
+"""
+Opt-in per-request profiling
+
+When profiling is enabled, a request sent with an `X-Profile: 1` header, or
+picked at random with the configured sample rate, runs under cProfile while
+tracemalloc traces its allocations, and every upstream call it queues is put on
+a timeline (queued, started, finished). That shows whether a slow request spent
+its time waiting on Fitbit, encoding JSON or in the caches.
+
+cProfile and tracemalloc are process wide, so one request is profiled at a time,
+requests arriving meanwhile run normally. Finished profiles are kept in a ring
+buffer of the last MAX_PROFILES. Nothing is recorded when profiling is off.
+"""
+
+import contextvars
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from datetime import datetime
+
+from upstream_timing import endpoint_key
+
+MAX_PROFILES = 50
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# Profile of the request being served, copied to the tasks a route fans out so
+# their upstream calls land on its timeline
+active_profile = contextvars.ContextVar('active_profile', default=None)
+
+_profiling = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, method, path, trigger):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.upstream = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._profiler = None
+        self._baseline = None
+        self._tracing = False
+
+    def _offset_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 2)
+
+    def start(self):
+        self._profiler = cProfile.Profile()
+        try:
+            self._profiler.enable()
+        except ValueError:  # another profiling tool is active, keep the timeline and allocations
+            self._profiler = None
+        if tracemalloc.is_tracing():
+            # Someone else is tracing, only count what this request adds
+            self._baseline = tracemalloc.take_snapshot()
+        else:
+            tracemalloc.start()
+            self._tracing = True
+        tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+
+    def upstream_call(self, fn, description, method, url):
+        """Wrap a scheduler job so its queueing delay and call time end up on the timeline"""
+        call = {
+            'description': description,
+            'method': method,
+            'endpoint': endpoint_key(url),
+            'queued_ms': self._offset_ms(),
+        }
+        with self._lock:
+            self.upstream.append(call)
+
+        def run(*args, **kwargs):
+            call['started_ms'] = self._offset_ms()
+            try:
+                result = fn(*args, **kwargs)
+                call['ok'] = result is not None
+                return result
+            finally:
+                call['finished_ms'] = self._offset_ms()
+
+        return run
+
+    def _functions(self):
+        if self._profiler is None:
+            return None, None
+        self._profiler.disable()
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        return stream.getvalue(), marshal.dumps(stats.stats)
+
+    def _allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        if self._tracing:
+            tracemalloc.stop()
+        if self._baseline is not None:
+            top = snapshot.compare_to(self._baseline, 'lineno')[:TOP_ALLOCATIONS]
+            lines = [{'line': str(stat.traceback), 'size_kb': round(stat.size_diff / 1024, 1),
+                      'count': stat.count_diff} for stat in top]
+        else:
+            top = snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            lines = [{'line': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1),
+                      'count': stat.count} for stat in top]
+        return {
+            'current_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top': lines,
+        }
+
+    def finish(self, status):
+        """Stop profiling and return the profile as a dict, the raw pstats data under 'pstats'"""
+        duration = self._offset_ms()
+        functions, raw_stats = self._functions()
+        allocations = self._allocations()
+        with self._lock:
+            upstream = [dict(call, dropped='started_ms' not in call) for call in self.upstream]
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'trigger': self.trigger,
+            'started_at': self.started_at,
+            'duration_ms': duration,
+            'upstream_calls': len(upstream),
+            'upstream_ms': round(sum(call['finished_ms'] - call['started_ms']
+                                     for call in upstream if 'finished_ms' in call), 2),
+            'upstream': upstream,
+            'functions': functions,
+            'allocations': allocations,
+            'pstats': raw_stats,
+        }
+
+
+def begin_profile(method, path, trigger):
+    """Start profiling a request, None if another request is being profiled"""
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        profile = RequestProfile(method, path, trigger)
+        profile.start()
+        return profile
+    except Exception:
+        _profiling.release()
+        raise
+
+
+def end_profile(profile, status):
+    try:
+        return profile.finish(status)
+    finally:
+        _profiling.release()
+
+
+class ProfileStore:
+    """Ring buffer of finished profiles"""
+
+    def __init__(self, max_profiles=MAX_PROFILES):
+        self._lock = threading.Lock()
+        self._profiles = deque(maxlen=max_profiles)
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+    def summaries(self):
+        """Most recent first, without the profile data"""
+        keys = ('id', 'method', 'path', 'status', 'trigger', 'started_at', 'duration_ms', 'upstream_calls', 'upstream_ms')
+        with self._lock:
+            return [{key: profile[key] for key in keys} for profile in reversed(self._profiles)]
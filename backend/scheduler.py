@@ -0,0 +1,302 @@
+"""
+Priority-aware scheduler for upstream Fitbit API calls
+
+Every call to Fitbit goes through a single UpstreamScheduler so that interactive
+work (showing today's log, saving an edit) is never stuck behind a long batch or
+a 90 day weight load. Jobs are grouped into priority classes, users inside a
+class share the workers through weighted fair queuing, and lower classes are
+held back when the hourly rate limit budget gets tight.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+
+# Priority classes, lowest number is served first
+INTERACTIVE_READ = 0
+INTERACTIVE_WRITE = 1
+PREFETCH = 2
+BACKGROUND = 3
+
+PRIORITY_NAMES = {
+    INTERACTIVE_READ: 'interactive_read',
+    INTERACTIVE_WRITE: 'interactive_write',
+    PREFETCH: 'prefetch',
+    BACKGROUND: 'background',
+}
+
+# Default time (seconds) a job may wait in the queue before it is dropped
+DEFAULT_DEADLINES = {
+    INTERACTIVE_READ: 30,
+    INTERACTIVE_WRITE: 60,
+    PREFETCH: 300,
+    BACKGROUND: None,
+}
+
+# Fraction of the hourly budget that must remain before a class is dispatched.
+# Interactive work can use the whole budget, prefetch and background work stop
+# early so there is always something left for the user.
+DEFAULT_RESERVES = {
+    INTERACTIVE_READ: 0.0,
+    INTERACTIVE_WRITE: 0.0,
+    PREFETCH: 0.2,
+    BACKGROUND: 0.4,
+}
+
+
+class DeadlineExceeded(Exception):
+    """Raised on a job's future when it could not be dispatched before its deadline"""
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'priority', 'user', 'deadline', 'enqueued_at', 'future')
+
+    def __init__(self, fn, args, kwargs, priority, user, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.user = user
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+
+class UpstreamScheduler:
+    def __init__(self, workers=4, reserves=None, user_weights=None, deadlines=None):
+        self.workers = max(1, workers)
+        # Priority classes are int keys, so they cannot be passed as keywords to dict()
+        self.reserves = {**DEFAULT_RESERVES, **(reserves or {})}
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self.user_weights = dict(user_weights or {})
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Per class heap of (finish tag, seq, job) for weighted fair queuing
+        self._queues = {priority: [] for priority in PRIORITY_NAMES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._last_finish = {priority: defaultdict(float) for priority in PRIORITY_NAMES}
+        self._threads = []
+        self._in_flight = 0
+        self._in_flight_low = 0
+
+        # Rate limit budget as last reported by Fitbit (None until the first response)
+        self._budget_limit = None
+        self._budget_remaining = None
+        self._budget_reset_at = None
+
+        self._stats = {priority: {
+            'submitted': 0,
+            'dispatched': 0,
+            'expired': 0,
+            'held': 0,
+            'delays': deque(maxlen=500),
+        } for priority in PRIORITY_NAMES}
+
+    def submit(self, fn, *args, priority=INTERACTIVE_READ, user='-', deadline=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) and return a Future for its result
+        deadline is an absolute time.monotonic() value, defaults to the class deadline
+        """
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        if deadline is None and self.deadlines.get(priority) is not None:
+            deadline = time.monotonic() + self.deadlines[priority]
+
+        job = _Job(fn, args, kwargs, priority, user, deadline)
+        weight = self.user_weights.get(user, 1.0)
+
+        with self._cond:
+            self._ensure_workers()
+            start = max(self._virtual_time[priority], self._last_finish[priority][user])
+            finish = start + 1.0 / weight
+            self._last_finish[priority][user] = finish
+            heapq.heappush(self._queues[priority], (finish, next(self._seq), job))
+            self._stats[priority]['submitted'] += 1
+            self._cond.notify()
+
+        return job.future
+
+    def run(self, fn, *args, **kwargs):
+        """Submit a job and block until it finishes"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def update_budget(self, limit=None, remaining=None, reset=None):
+        """Record the rate limit headers returned by Fitbit"""
+        with self._cond:
+            try:
+                if limit is not None:
+                    self._budget_limit = int(limit)
+                if remaining is not None:
+                    self._budget_remaining = int(remaining)
+                if reset is not None:
+                    self._budget_reset_at = time.monotonic() + int(reset)
+            except (TypeError, ValueError):
+                return
+            self._cond.notify_all()
+
+    def headroom(self, priority):
+        """
+        Calls a class can still make before it is held back for this rate limit
+        window, None while the budget is unknown
+        """
+        with self._cond:
+            self._refresh_budget()
+            return self._headroom(priority)
+
+    def spend(self, priority):
+        """
+        Count a call made outside the queue (a hedged read) against the budget,
+        returns False without counting it if the class has no headroom left
+        """
+        with self._cond:
+            self._refresh_budget()
+            if not self._headroom(priority):
+                return False
+            self._budget_remaining -= 1
+            return True
+
+    def reset_in(self):
+        """Seconds until the rate limit window resets, None if unknown"""
+        with self._cond:
+            if self._budget_reset_at is None:
+                return None
+            return max(0, int(self._budget_reset_at - time.monotonic()))
+
+    def stats(self):
+        """Queue depth and queueing delay per priority class"""
+        with self._cond:
+            self._refresh_budget()
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                stats = self._stats[priority]
+                delays = sorted(stats['delays'])
+                classes[name] = {
+                    'queued': len(self._queues[priority]),
+                    'submitted': stats['submitted'],
+                    'dispatched': stats['dispatched'],
+                    'expired': stats['expired'],
+                    'held': stats['held'],
+                    'avg_delay_ms': round(sum(delays) / len(delays) * 1000, 2) if delays else 0,
+                    'p95_delay_ms': round(delays[min(len(delays) - 1, int(len(delays) * 0.95))] * 1000, 2) if delays else 0,
+                    'max_delay_ms': round(delays[-1] * 1000, 2) if delays else 0,
+                }
+            reset_in = None
+            if self._budget_reset_at is not None:
+                reset_in = max(0, int(self._budget_reset_at - time.monotonic()))
+            return {
+                'workers': self.workers,
+                'in_flight': self._in_flight,
+                'budget': {
+                    'limit': self._budget_limit,
+                    'remaining': self._budget_remaining,
+                    'reset_in': reset_in,
+                },
+                'classes': classes,
+            }
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'fitbit-upstream-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _refresh_budget(self):
+        # Once the reset time has passed Fitbit hands out a fresh hourly budget
+        if self._budget_reset_at is not None and time.monotonic() >= self._budget_reset_at:
+            self._budget_remaining = self._budget_limit
+            self._budget_reset_at = None
+
+    def _headroom(self, priority):
+        if self._budget_remaining is None or self._budget_limit is None:
+            return None
+        reserve = 0 if priority <= INTERACTIVE_WRITE else self._budget_limit * self.reserves[priority]
+        return max(0, int(self._budget_remaining - self._in_flight - reserve))
+
+    def _allowed(self, priority):
+        """Whether a class may be dispatched with the current budget"""
+        if priority >= PREFETCH and self._in_flight_low >= self.workers - 1 and self.workers > 1:
+            # Always keep one worker free for interactive work
+            return False
+        if self._budget_remaining is None or self._budget_limit is None:
+            return True
+        if priority <= INTERACTIVE_WRITE:
+            # Interactive work always goes out, if the budget is gone Fitbit
+            # answers 429 and the route reports it to the user
+            return True
+        available = self._budget_remaining - self._in_flight
+        return available > self._budget_limit * self.reserves[priority]
+
+    def _expire(self, now):
+        for priority, queue in self._queues.items():
+            if not any(job.deadline is not None and job.deadline <= now for _, _, job in queue):
+                continue
+            kept = []
+            for item in queue:
+                job = item[2]
+                if job.deadline is not None and job.deadline <= now:
+                    self._stats[priority]['expired'] += 1
+                    job.future.set_exception(DeadlineExceeded(
+                        f"{PRIORITY_NAMES[priority]} job waited {now - job.enqueued_at:.1f}s without being dispatched"))
+                else:
+                    kept.append(item)
+            heapq.heapify(kept)
+            self._queues[priority] = kept
+
+    def _next_job(self):
+        """Pick the next job, returns (job, wait) where wait is how long to sleep if nothing is ready"""
+        now = time.monotonic()
+        self._refresh_budget()
+        self._expire(now)
+
+        for priority in sorted(PRIORITY_NAMES):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            if not self._allowed(priority):
+                # Higher classes preempt everything below them while the budget is tight
+                self._stats[priority]['held'] += 1
+                continue
+            finish, _, job = heapq.heappop(queue)
+            self._virtual_time[priority] = finish
+            return job, None
+
+        # Nothing dispatchable, wake up for the next deadline or budget reset
+        wake_times = [job.deadline for queue in self._queues.values() for _, _, job in queue if job.deadline]
+        if self._budget_reset_at is not None:
+            wake_times.append(self._budget_reset_at)
+        wait = min(wake_times) - now if wake_times else None
+        return None, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=max(0.05, min(wait, 60)) if wait is not None else None)
+                    job, wait = self._next_job()
+                self._in_flight += 1
+                if job.priority >= PREFETCH:
+                    self._in_flight_low += 1
+                stats = self._stats[job.priority]
+                stats['dispatched'] += 1
+                stats['delays'].append(time.monotonic() - job.enqueued_at)
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn(*job.args, **job.kwargs))
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    if job.priority >= PREFETCH:
+                        self._in_flight_low -= 1
+                    self._cond.notify_all()
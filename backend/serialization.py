@@ -0,0 +1,98 @@
+"""
+JSON serialization used for responses and files persisted by the backend
+
+orjson is used when it is installed, otherwise the standard library json module.
+Both produce the same JSON for the plain dicts, lists, strings and numbers the
+backend works with.
+"""
+
+import dataclasses
+import hashlib
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _records_as_dicts(obj):
+    """Default for the json module, the records in models.py by their fields (orjson does this natively)"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return obj.as_dict() if hasattr(obj, 'as_dict') else dataclasses.asdict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj, sort_keys=False, default=None, indent=False):
+    """Serialize obj to JSON bytes, compact unless indent is set"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    default = default or _records_as_dicts
+    if indent:
+        return json.dumps(obj, sort_keys=sort_keys, default=default, indent=2).encode('utf-8')
+    return json.dumps(obj, sort_keys=sort_keys, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_payload(data):
+    """
+    A response body encoded once: the data, its JSON bytes and their ETag in a plain
+    dict, so any cache backend can store it and a hit is written out as is
+    """
+    body = dumps(data)
+    return {'data': data, 'json': body, 'etag': hashlib.sha1(body).hexdigest()}
+
+
+def payload_size(payload):
+    """Approximate bytes held by an encoded payload, for the bounded caches: its JSON and the data it encodes"""
+    return 2 * len(payload['json'])
+
+
+def dump_file(obj, file_path):
+    """Write obj as JSON to a file"""
+    with open(file_path, 'wb') as file:
+        file.write(dumps(obj))
+
+
+def load_file(file_path):
+    """Read JSON from a file"""
+    with open(file_path, 'rb') as file:
+        return loads(file.read())
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes through dumps() so jsonify uses orjson when available"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=self.sort_keys, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Same rule as Flask, pretty print in debug mode unless compact is set
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps(obj, sort_keys=self.sort_keys, default=self.default, indent=indent)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
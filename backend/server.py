@@ -1,197 +1,552 @@
-from flask import Flask, request, jsonify
-import requests
-import json
+from flask import (Flask, Blueprint, Response, current_app, g, request, jsonify, has_request_context,
+                   stream_with_context)
 import os
-import base64
-from dotenv import load_dotenv
+import contextvars
+import random
+import io
+import re
+import shutil
+import uuid
+import hashlib
+import threading
+import time
 from flask_cors import CORS
 from flask_caching import Cache
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from edit_journal import EditJournal, PENDING, DELETED, UPDATED, RESTORED, FAILED, ORPHANED, QUEUED
+from batch_registry import BatchRegistry
+from serialization import FastJSONProvider, encode_payload, payload_size
+from bounded_cache import BoundedCache
+from units_catalog import UnitsCatalog
+from compression import COMPRESS_MIN_SIZE, COMPRESSIBLE_MIMETYPES, choose_encoding, compress
+from meal_templates import MEALS, MEAL_NAMES, build_meal_entries, template_food_ids
+from food_index import FoodIndex
+from entry_validation import EntryValidator
+from personal_foods import PersonalFoods, ENOUGH_MATCHES, MAX_RESULTS
+from models import FoodLogEntry, FoodSearchHit, DailyCalories, WeightPoint
+from events import EventBus, RETRY_MS, format_event
+from write_queue import WriteQueue
+from profiling import ProfileStore, active_profile, begin_profile, end_profile
+from food_mirror import FoodMirror, MirrorSync, HOT_DAY_TTL, WEBHOOK_HOT_DAY_TTL, CHANGES_PAGE, hot_dates
+from webhooks import FOODS, BODY, WebhookStats, verify_signature, parse_notifications
+from food_export import (EXPORT_FORMATS, export_dates, iter_day_foods, export_rows, export_chunks,
+                         load_pyarrow)
+from food_import import (EntryResolver, ImportCheckpoint, read_rows, run_import, detect_format,
+                         DEFAULT_MEAL_TYPE, RUNNING, PAUSED, DONE)
+from circuit_breaker import UpstreamUnavailable
+from scheduler import DeadlineExceeded, INTERACTIVE_READ, INTERACTIVE_WRITE, PREFETCH, BACKGROUND
+import fitbit_client
+from fitbit_client import (fitbit_scheduler, submit_fitbit_api_request, load_credentials, OutcomeUnknown,
+                           set_user_key_func, food_log_create_url,
+                           fetch_units, fetch_food_search, fetch_food_log, fetch_food_details, forget_food_logs,
+                           fetch_personal_foods,
+                           known_food_units, format_logged_foods, disk_cache, request_deadline, upstream_stats)
 
-app = Flask(__name__)
-CORS(app)
+# Importing this module does no I/O, the app is built by create_app() at the
+# bottom of the file, which loads .env and starts background work
 
-# Configure Flask-Caching
+api = Blueprint('api', __name__)
+
+# Configure Flask-Caching, bound to the app in create_app(). Cached values are
+# plain data and encoded payloads, so CACHE_TYPE can be any backend (e.g.
+# FileSystemCache with CACHE_DIR, or RedisCache with CACHE_REDIS_URL)
 cache_config = {
     "DEBUG": True,
-    "CACHE_TYPE": "SimpleCache",
+    "CACHE_TYPE": os.getenv('CACHE_TYPE', 'SimpleCache'),
     "CACHE_DEFAULT_TIMEOUT": 300  # 5 minutes default
 }
-app.config.from_mapping(cache_config)
-cache = Cache(app)
+cache = Cache()
+
+# Pool used by routes to fan out independent pieces of work, the upstream
+# calls themselves are still queued through fitbit_scheduler
+task_pool = ThreadPoolExecutor(max_workers=int(os.getenv('TASK_WORKERS', 8)))
 
-def make_fitbit_api_request(url, method='GET', headers=None, data=None, description=''):
+def submit_task(fn, *args, **kwargs):
     """
-    Centralized function to make Fitbit API requests
-    after a request is made, the function will check the response headers for rate limiting information
+    Run fn on the task pool inside the current app context (the caches need one)
+    and with the request deadline of the caller
     """
-    global access_token, refresh_token
+    app = current_app._get_current_object()
+    context = contextvars.copy_context()
     
-    if headers is None:
-        headers = {}
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
     
-    # Add authorization header
-    headers['Authorization'] = f'Bearer {access_token}'
-    if 'Content-Type' not in headers:
-        headers['Content-Type'] = 'application/json'
-    
-    # Make the request
-    if method.upper() == 'GET':
-        response = requests.get(url, headers=headers)
-    elif method.upper() == 'POST':
-        response = requests.post(url, headers=headers, data=data)
-    elif method.upper() == 'PUT':
-        response = requests.put(url, headers=headers, data=data)
-    elif method.upper() == 'DELETE':
-        response = requests.delete(url, headers=headers)
+    return task_pool.submit(context.run, run)
+
+def view_name():
+    """Name of the view handling the current request, without the blueprint prefix"""
+    return request.endpoint.rsplit('.', 1)[-1] if request.endpoint else None
+
+def payload_response(payload, status=200):
+    """Response writing a payload from encode_payload() as is, add_etag reuses its ETag"""
+    g.payload_etag = payload['etag']
+    return current_app.response_class(payload['json'], status=status, mimetype=current_app.json.mimetype)
+
+def current_user_key():
+    """Key used to share the upstream workers fairly between users"""
+    if has_request_context():
+        return request.headers.get('X-User-Id') or request.remote_addr or '-'
+    return 'background'
+
+# Opt-in request profiling (PROFILING=1): requests with an X-Profile: 1 header, and a
+# PROFILE_SAMPLE_RATE fraction of all requests, are profiled and kept in profile_store
+profile_store = ProfileStore()
+PROFILE_ENDPOINTS = {'list_profiles', 'get_profile', 'download_profile'}
+
+@api.before_app_request
+def start_profile():
+    if not current_app.config['PROFILING'] or view_name() in PROFILE_ENDPOINTS:
+        return None
+    if request.headers.get('X-Profile') == '1':
+        trigger = 'header'
+    elif random.random() < current_app.config['PROFILE_SAMPLE_RATE']:
+        trigger = 'sampled'
     else:
-        raise ValueError(f"Unsupported HTTP method: {method}")
-    
-    # Log rate limiting information
-    rate_limit = response.headers.get('Fitbit-Rate-Limit-Limit')
-    rate_remaining = response.headers.get('Fitbit-Rate-Limit-Remaining')
-    rate_reset = response.headers.get('Fitbit-Rate-Limit-Reset')
-    
-    print(f"[Fitbit API] {description}")
-    print(f"  Rate limit: {rate_limit}")
-    print(f"  Remaining: {rate_remaining}")
-    print(f"  Reset time: {rate_reset}")
-    print(f"  Status: {response.status_code}")
-    
-    # Handle different response status codes
-    if response.status_code in [200, 201, 204]:
-        if response.status_code == 204:  # No content for DELETE
-            return True
-        return response.json()
-    elif response.status_code == 401:
-        # Token expired, try to refresh
-        print(f"[Fitbit API] Token expired, attempting refresh...")
-        access_token, refresh_token = refresh_access_token(refresh_token)
-        if access_token and refresh_token:
-            # Retry the request with new token
-            headers['Authorization'] = f'Bearer {access_token}'
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=headers, data=data)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=headers, data=data)
-            elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=headers)
-            
-            # Log rate limiting info for retry
-            rate_limit = response.headers.get('Fitbit-Rate-Limit-Limit')
-            rate_remaining = response.headers.get('Fitbit-Rate-Limit-Remaining')
-            rate_reset = response.headers.get('Fitbit-Rate-Limit-Reset')
-            
-            print(f"[Fitbit API] Retry {description}")
-            print(f"  Rate limit: {rate_limit}")
-            print(f"  Remaining: {rate_remaining}")
-            print(f"  Reset time: {rate_reset}")
-            print(f"  Status: {response.status_code}")
-            
-            if response.status_code in [200, 201, 204]:
-                if response.status_code == 204:
-                    return True
-                return response.json()
-    
-    # If we get here, the request failed
-    print(f"[Fitbit API] Request failed: {response.status_code} - {response.text}")
+        return None
+    profile = begin_profile(request.method, request.full_path, trigger)
+    if profile is not None:  # None while another request is being profiled
+        g.profile = profile
+        g.profile_token = active_profile.set(profile)
     return None
 
+# Registered before the other after_request hooks so it runs after them and
+# includes compression and ETags in the profile
+@api.after_app_request
+def finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    profile_store.add(end_profile(profile, response.status_code))
+    response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@api.teardown_app_request
+def discard_profile(exception=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        # The request failed before a response was built
+        profile_store.add(end_profile(profile, 500))
+    token = g.pop('profile_token', None)
+    if token is not None:
+        active_profile.reset(token)
+
+# Seconds a request may spend waiting on Fitbit (REQUEST_DEADLINE), every upstream
+# call a route makes is dropped or cut short once it has passed. Clients can ask
+# for less with an X-Request-Timeout header. Long running routes pace themselves.
+NO_DEADLINE_ENDPOINTS = {'import_foods', 'export_foods', 'mirror_sync_now', 'stream_events'}
+
+@api.before_app_request
+def start_request_deadline():
+    seconds = current_app.config['REQUEST_DEADLINE']
+    if not seconds or view_name() in NO_DEADLINE_ENDPOINTS:
+        return None
+    try:
+        requested = float(request.headers.get('X-Request-Timeout', seconds))
+    except ValueError:
+        requested = seconds
+    if 0 < requested < seconds:
+        seconds = requested
+    g.deadline_token = request_deadline.set(time.monotonic() + seconds)
+    return None
+
+@api.teardown_app_request
+def end_request_deadline(exception=None):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        request_deadline.reset(token)
+
+@api.after_app_request
+def compress_response(response):
+    """Compress large JSON bodies with gzip or brotli when the client accepts it"""
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+        # Streamed bodies (exports) are never buffered here
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    
+    encoding = choose_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Read endpoints that answer conditional GETs: Cache-Control header sent to the
+# browser and how long (seconds) a remembered ETag may answer If-None-Match
+# without running the view, matching the timeout of the data cache behind it
+CONDITIONAL_ENDPOINTS = {
+    'get_foods': ('private, no-cache', 300),
+    'get_calories': ('private, no-cache', 300),
+    'get_weight': ('private, no-cache', 300),
+    'get_dashboard': ('private, no-cache', 300),
+    'search_units': ('private, max-age=600', 600),
+    'get_unit': ('private, max-age=3600', 3600),
+    'search_foods': ('private, no-cache', 300),
+    'quick_picks': ('private, no-cache', 300),
+    'get_food_details': ('private, max-age=86400', 86400),
+    'get_foods_details': ('private, max-age=86400', 86400),
+    'list_meals': ('private, no-cache', 3600),
+}
+
+# ETags of recent read responses keyed by request path and query string, entries
+# expire with the TTL of their endpoint and the least recently used are evicted
+etag_index = BoundedCache('etags', max_entries=int(os.getenv('ETAG_INDEX_ENTRIES', 2000)))
+
+def request_etag_key():
+    return request.full_path
+
+def forget_etags(endpoints=None, dates=None):
+    """
+    Drop remembered ETags for the given endpoints (all when None), optionally only
+    for responses about the given dates, so the next request runs the view again
+    """
+    def matches(key, entry):
+        if endpoints is not None and entry['endpoint'] not in endpoints:
+            return False
+        return dates is None or entry['date'] is None or entry['date'] in dates
+    
+    etag_index.delete_where(matches)
+
+@api.before_app_request
+def answer_conditional_get():
+    """Answer If-None-Match with 304 straight from the ETag index, the view is never run"""
+    if request.method != 'GET' or view_name() not in CONDITIONAL_ENDPOINTS:
+        return None
+    if not request.if_none_match:
+        return None
+    
+    entry = etag_index.get(request_etag_key())
+    if not entry:
+        return None
+    
+    if request.if_none_match.contains_weak(entry['etag']):
+        response = current_app.response_class(status=304)
+        response.set_etag(entry['etag'], weak=True)
+        response.headers['Cache-Control'] = CONDITIONAL_ENDPOINTS[view_name()][0]
+        return response
+    return None
+
+@api.after_app_request
+def add_etag(response):
+    """Tag successful read responses with a content hash ETag and remember it"""
+    if request.method != 'GET' or view_name() not in CONDITIONAL_ENDPOINTS:
+        return response
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+    if g.get('stale'):
+        # Stale copies must not be revalidated once Fitbit is back
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    cache_control, ttl = CONDITIONAL_ENDPOINTS[view_name()]
+    # Weak because the same content may go out gzip, brotli or uncompressed
+    etag = g.get('payload_etag') or hashlib.sha1(response.get_data()).hexdigest()
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    
+    etag_index.set(request_etag_key(), {
+        'etag': etag,
+        'endpoint': view_name(),
+        'date': request.args.get('date') or (datetime.now().strftime('%Y-%m-%d') if view_name() in ('get_foods', 'get_dashboard') else None)
+    }, ttl=ttl)
+    
+    # Same content the client already holds, send 304 without the body
+    return response.make_conditional(request)
+
 def clear_food_related_caches():
     """Clear caches related to food data when food logs are modified"""
     cache.delete_memoized(get_foods_cached)
-    cache.delete_memoized(get_calories)
+    cache.delete_memoized(fetch_calories)
+    forget_etags(('get_foods', 'get_calories', 'get_dashboard'))
+
+def clear_food_caches_for_dates(dates):
+    """
+    Clear the day log cache for the given dates only and mark them dirty in the mirror
+    a date of None means it is unknown (see entry_date()), in which case every food cache
+    is cleared and the mirror is left to the reconciliation pass to find the day
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    if None in dates:
+        dates.discard(None)
+        food_mirror.mark_dirty(dates)
+        clear_food_related_caches()
+        return
+    food_mirror.mark_dirty(dates)
+    clear_day_caches(dates)
+
+def clear_day_caches(dates):
+    """Clear the cached day logs (memoized, on disk and their etags) for the given dates"""
+    for target_date in dates:
+        cache.delete_memoized(get_foods_cached, target_date)
+    forget_food_logs(dates)
+    # The calorie ranges of every date are cleared, so is every dashboard holding one
+    cache.delete_memoized(fetch_calories)
+    forget_etags(('get_foods',), dates=dates)
+    forget_etags(('get_calories', 'get_dashboard'))
+
+def clear_weight_caches():
+    """Clear the cached weight data"""
+    cache.delete_memoized(fetch_weight)
+    forget_etags(('get_weight', 'get_dashboard'))
 
 def clear_all_caches():
     """Clear all caches - useful for debugging or when tokens are refreshed"""
     cache.clear()
-
-# Load environment variables
-load_dotenv()
-client_id = os.getenv('CLIENTID')
-client_secret = os.getenv('CLIENTSECRET')
-
-basic_token = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    units_cache.clear()
+    units_search_cache.clear()
+    food_search_cache.clear()
+    disk_cache().clear()
+    forget_etags()
 
 # Global cache for units to reduce API calls
-units_cache = None
-units_cache_timestamp = None
 CACHE_DURATION = 3600  # Cache for 1 hour
+units_cache = BoundedCache('units', max_entries=1, ttl=CACHE_DURATION)
+units_search_cache = BoundedCache('units_search', max_entries=200, max_bytes=2 * 1024 * 1024, ttl=CACHE_DURATION)
 
-# Global cache for food search results
-food_search_cache = {}
+# Global cache for food search results, bounded by entry count and approximate size
 FOOD_SEARCH_CACHE_DURATION = 300  # Cache for 5 minutes
+food_search_cache = BoundedCache('food_search',
+                                 max_entries=int(os.getenv('FOOD_SEARCH_CACHE_ENTRIES', 500)),
+                                 max_bytes=int(os.getenv('FOOD_SEARCH_CACHE_BYTES', 8 * 1024 * 1024)),
+                                 ttl=FOOD_SEARCH_CACHE_DURATION)
+
+# Last good units catalog and chart ranges, served (marked stale) while Fitbit is failing.
+# Day logs fall back to the food mirror instead.
+LAST_GOOD_DURATION = 7 * 24 * 3600
+last_good = BoundedCache('last_good', max_entries=200, max_bytes=16 * 1024 * 1024, ttl=LAST_GOOD_DURATION)
 
 def get_cached_units():
-    """Get units from cache or fetch from API if cache is expired"""
-    global units_cache, units_cache_timestamp
-    
-    current_time = datetime.now().timestamp()
-    
+    """
+    Get the units catalog from cache or fetch from API if cache is expired
+    the lookup structures are built once per refresh, see units_catalog.py
+    """
     # Return cached units if still valid
-    if (units_cache and units_cache_timestamp and 
-        current_time - units_cache_timestamp < CACHE_DURATION):
-        return units_cache
+    catalog = units_cache.get('units')
+    if catalog:
+        return catalog
     
-    # Fetch fresh units from API
-    units_data = make_fitbit_api_request("https://api.fitbit.com/1/foods/units.json", method='GET', description="fetching units")
+    # Fetch fresh units from the disk cache shared with the CLI, or the API
+    units_data = fetch_units()
     
     if units_data:
-        units_cache = units_data
-        units_cache_timestamp = current_time
-        return units_data
+        catalog = UnitsCatalog(units_data)
+        units_cache.set('units', catalog)
+        last_good.set('units', catalog)
+        return catalog
     
-    return None
+    # Fitbit is failing, units hardly ever change so the last catalog is still good
+    return last_good.get('units')
 
-def load_token(file_path, osvar):
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            token_data = json.load(file)
-            return token_data
-    return os.getenv(osvar) or None
-
-def save_token(file_path, token):
-    with open(file_path, 'w') as file:
-        json.dump(token, file)
-
-# Load token data from json files
-access_token = load_token('access_token.json', 'ACCESSTOKEN')['access_token']
-refresh_token = load_token('refresh_token.json', 'REFRESHTOKEN')['refresh_token']
-
-# todo how do we ask users to do this
-# todo might be easier to ask for this on the frontend
-if not access_token or not refresh_token:
-    raise Exception("Tokens are missing. Please provide valid access and refresh tokens.")
-
-def refresh_access_token(refresh_token):
-    url = "https://api.fitbit.com/oauth2/token"
-    payload = {
-        'grant_type': 'refresh_token',
-        'refresh_token': refresh_token,
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
-    headers = {
-        'Authorization': f'Basic {basic_token}',
-        'Content-Type': 'application/x-www-form-urlencoded'
+# Journal of in-flight edits so a failed replacement can be undone
+edit_journal = EditJournal(os.getenv('EDIT_JOURNAL_PATH', 'edit_journal.json'))
+CREATE_ATTEMPTS = 2  # attempts at logging the replacement entry before restoring the original
+
+# Logged batches and the logIds they created, used to undo a batch
+batch_registry = BatchRegistry(os.getenv('BATCH_REGISTRY_PATH', 'batches.json'))
+
+# Food names to foodIds, learned from day logs and used to resolve imported rows
+food_index = FoodIndex()
+
+# Local mirror of the food log, kept current by the sync engine started in create_app()
+food_mirror = FoodMirror()
+
+# Food log changes pushed to open pages over /api/events
+event_bus = EventBus()
+
+# Recent, frequent and favorite foods and what is logged most here, ranked ahead of Fitbit's search
+personal_foods = PersonalFoods(food_mirror.food_history, known_food_units)
+_personal_refresh = None
+_personal_refresh_lock = threading.Lock()
+
+def load_personal_foods(**request_args):
+    """Fetch the expired personal food lists, None if one of them could not be fetched"""
+    ok = True
+    for kind in personal_foods.expired():
+        foods = fetch_personal_foods(kind, **request_args)
+        if isinstance(foods, list):
+            personal_foods.set_list(kind, foods)
+        else:
+            ok = False
+    forget_etags(('search_foods', 'quick_picks'))
+    return personal_foods if ok else None
+
+def refresh_personal_foods():
+    """Load the expired personal food lists in the background, one refresh at a time"""
+    global _personal_refresh
+    with _personal_refresh_lock:
+        if not personal_foods.expired() or (_personal_refresh is not None and not _personal_refresh.done()):
+            return
+        _personal_refresh = submit_task(load_personal_foods, priority=PREFETCH)
+
+def forget_personal_history():
+    """The mirror's entries changed, personal foods are counted again from it on next use"""
+    personal_foods.forget_history()
+    forget_etags(('search_foods', 'quick_picks'))
+
+def personal_foods_logged(entries):
+    """
+    Foods were logged, the mirror already holds them (publish_entry_added) so they are
+    counted again from it, Fitbit's recent and frequent lists are fetched again when next needed
+    """
+    if not entries:
+        return
+    forget_personal_history()
+    personal_foods.expire(('recent', 'frequent'))
+    disk_cache().delete_many('personal:recent', 'personal:frequent')
+
+def publish_entry_added(target_date, result):
+    """
+    Record an entry created by a food log POST in the mirror's changelog and push it,
+    result is Fitbit's answer holding the new foodLog
+    """
+    food_log = result.get('foodLog') if isinstance(result, dict) else None
+    if food_log:
+        entry = FoodLogEntry.from_fitbit(food_log)
+        food_mirror.apply_added(target_date, entry)
+        event_bus.publish('entry.added', date=target_date, entry=entry)
+
+def event_log_id(food_log_id):
+    """logIds arrive as path segments too, events carry them as numbers like /api/foods does"""
+    return int(food_log_id) if str(food_log_id).isdigit() else food_log_id
+
+def entry_date(target_date, food_log_id):
+    """The date of an entry, looked up in the mirror when the client did not send it"""
+    return target_date or food_mirror.entry_date(event_log_id(food_log_id))
+
+def publish_entry_removed(target_date, food_log_id):
+    """
+    Record a deleted entry in the mirror's changelog and push it, target_date is None
+    when the client did not say which day it was on
+    """
+    food_mirror.apply_removed(target_date, event_log_id(food_log_id))
+    forget_personal_history()
+    event_bus.publish('entry.removed', date=target_date, id=event_log_id(food_log_id))
+
+def publish_invalidated(dates):
+    """Push dates whose day log changed in ways only fetching it again shows, None means every date"""
+    dates = set(dates)
+    if dates:
+        event_bus.publish('date.invalidated', dates=None if None in dates else sorted(dates))
+
+def replay_write(write):
+    """Send a queued write, raises UpstreamUnavailable while its circuit is still open"""
+    return submit_fitbit_api_request(write['url'], method=write['method'], description=f"replaying {write['description']}",
+                                     priority=INTERACTIVE_WRITE, user='write-queue').result()
+
+# Writes made while Fitbit was unavailable, replayed by a background thread started in create_app()
+write_queue = WriteQueue(os.getenv('WRITE_QUEUE_PATH', 'write_queue.json'), send=replay_write)
+
+# Checkpoints of bulk imports, one file per import id
+IMPORT_DIR = os.getenv('IMPORT_DIR', 'imports')
+
+# Thread of every import started by this process, by import id
+import_runs = {}
+import_runs_lock = threading.Lock()
+
+def log_food_entries(entries, description='logging food', user=None, priority=None):
+    """
+    Log food entries concurrently under the upstream scheduler
+    returns (logged, failed, queued) where logged holds the created logIds and queued
+    the entries held in the write queue because Fitbit is unavailable
+    """
+    pending = [(entry, submit_fitbit_api_request(food_log_create_url(entry), method='POST',
+                                                 description=f"{description}: {entry['name']}",
+                                                 user=user, priority=priority))
+               for entry in entries]
+    
+    logged = []
+    failed = []
+    queued = []
+    logged_entries = []
+    for entry, future in pending:
+        try:
+            result = future.result()
+        except UpstreamUnavailable:
+            queued.append({
+                'writeId': write_queue.add('POST', food_log_create_url(entry), f"{description}: {entry['name']}",
+                                           date=entry['date']),
+                'name': entry['name'],
+                'date': entry['date']
+            })
+            continue
+        except DeadlineExceeded:
+            result = None
+        
+        if result is not None:
+            logged.append({
+                'logId': result.get('foodLog', {}).get('logId'),
+                'name': entry['name'],
+                'date': entry['date'],
+                'mealTypeId': entry['mealTypeId']
+            })
+            publish_entry_added(entry['date'], result)
+            logged_entries.append(entry)
+        else:
+            failed.append(f"{entry['name']}: Request failed")
+    
+    personal_foods_logged(logged_entries)
+    return logged, failed, queued
+
+def preflight_entries(entries):
+    """
+    (valid, rejected, fixed) for entries checked against the cached units catalog
+    and per-food units before any of them is sent, see entry_validation.py
+    """
+    return EntryValidator(get_cached_units(), known_food_units).validate(entries)
+
+def rejected_batch_response(rejected, fixed):
+    """Every entry of a batch failed preflight validation, nothing was sent"""
+    return jsonify({'error': 'No valid entries to log', 'rejected': rejected, 'fixed': fixed}), 400
+
+def logged_batch_response(source, logged, failed_foods, queued=(), rejected=(), fixed=(), **fields):
+    """
+    Record a logged batch, clear the affected day caches and build the response
+    entries rejected or fixed by preflight_entries() are reported with the rest,
+    extra keyword fields (such as date) are added to the response body
+    """
+    batch_id = None
+    if logged:
+        batch_id = batch_registry.record(source, logged)
+        # Clear caches once after all foods are logged
+        clear_food_caches_for_dates(entry['date'] for entry in logged)
+    
+    body = {
+        'logged_foods': [entry['name'] for entry in logged],
+        'logged_ids': [entry['logId'] for entry in logged],
+        'batch_id': batch_id,
+        **fields
     }
     
-    response = requests.post(url, data=payload, headers=headers)
+    if queued:
+        body['queued'] = list(queued)
+    if fixed:
+        body['fixed'] = list(fixed)
     
-    if response.status_code == 200:
-        new_tokens = response.json()
-        save_token('access_token.json', {'access_token': new_tokens['access_token']})
-        save_token('refresh_token.json', {'refresh_token': new_tokens['refresh_token']})
-        return new_tokens['access_token'], new_tokens['refresh_token']
+    # Return results
+    if failed_foods or rejected:
+        body['message'] = f"Logged {len(logged)} foods successfully. Failed: {len(failed_foods) + len(rejected)}"
+        body['failed_foods'] = failed_foods
+        if rejected:
+            body['rejected'] = list(rejected)
+        return jsonify(body), 207  # Multi-status
+    elif queued:
+        # Fitbit is unavailable, the rest is logged once it recovers
+        body['message'] = f"Logged {len(logged)} foods. Queued until Fitbit is available: {len(queued)}"
+        return jsonify(body), 202
     else:
-        return None, None
+        body['message'] = f"Successfully logged {len(logged)} foods"
+        return jsonify(body), 201
 
-@app.route('/api/log_food', methods=['POST'])
+@api.route('/api/log_food', methods=['POST'])
 def log_food():
-    global access_token, refresh_token
-    
     # Get request data
     data = request.json
     meal = int(data.get('meal', 0))
@@ -215,263 +570,21 @@ def log_food():
         else:
             current_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Define the meals dictionary (same as log_food.py)
-    meals = {
-        1: [
-            {
-                "name": 'Protein Shake',
-                "foodId": 22788636, # Protein Shake
-                "mealTypeId": meal_type,
-                "unitId": 301,    # scoop
-                "amount": 1,
-                "date": current_date
-            },
-        ],
-        2: [
-            {
-                "name": 'Oatmeal',
-                "foodId": 692777597,
-                "mealTypeId": meal_type,
-                "unitId": 91,    
-                "amount": .5,
-                "date": current_date
-            },
-            {
-                "name": 'Raisins',
-                "foodId": 692772145, # Raisins
-                "mealTypeId": meal_type,
-                "unitId": 91,    # Cups
-                "amount": .25,
-                "date": current_date
-            },
-            {
-                "name": 'Unsweetened Applesauce',
-                "foodId": 692772244, # Unsweetened Applesauce
-                "mealTypeId": meal_type,
-                "unitId": 91,    # Cups
-                "amount": .5,
-                "date": current_date
-            },
-            {
-                "name": 'Healthy Grains, Peanut Butter Whole Grain Clusters',
-                "foodId": 767757700,
-                "mealTypeId": meal_type,
-                "unitId": 91,    # Cups
-                "amount": .5,
-                "date": current_date
-            },
-            {
-                "name": 'Fish Oil Liquid Softgels',
-                "foodId": 692747679,
-                "mealTypeId": meal_type,
-                "unitId": 322,    # softgel
-                "amount": 2,
-                "date": current_date
-            },
-            {
-                "name": 'MultiVites Gummy Vitamins',
-                "foodId": 17964282,
-                "mealTypeId": meal_type,
-                "unitId": 304,    # Serving
-                "amount": 2,
-                "date": current_date
-            }
-        ],
-        3: [
-            {
-                "name": 'Zero Sugar Yogurt',
-                "foodId": 692045929,
-                "mealTypeId": meal_type,
-                "unitId": 69,    # Container
-                "amount": 1,
-                "date": current_date
-            },
-            {
-                "name": 'blueberries',
-                "foodId": 82547,
-                "mealTypeId": meal_type,
-                "unitId": 91,    # Cups
-                "amount": .33,
-                "date": current_date
-            }
-        ],
-        4: [
-            {
-                "name": 'Grapes',
-                "foodId": 751876808,
-                "mealTypeId": meal_type,
-                "unitId": 148,    # Grapes
-                "amount": 40,
-                "date": current_date
-            },
-            {
-                "name": 'Carrots',
-                "foodId": 784706037,
-                "mealTypeId": meal_type,
-                "unitId": 226,    # oz
-                "amount": 6,
-                "date": current_date
-            },
-        ],
-        5: [
-            {
-                "name": 'Peanut Butter',
-                "foodId": 692135088,
-                "mealTypeId": meal_type,
-                "unitId": 349,    # tbsp
-                "amount": 2,
-                "date": current_date
-            },
-            {
-                "name": 'Celery',
-                "foodId": 721624116,
-                "mealTypeId": meal_type,
-                "unitId": 339,    # stick
-                "amount": 3,
-                "date": current_date
-            },
-        ],
-        6: [
-            {
-                "name": 'Dry Roasted Peanuts, Unsalted',
-                "foodId": 692767466,
-                "mealTypeId": meal_type,
-                "unitId": 251,    # piece
-                "amount": 18,
-                "date": current_date
-            },
-            {
-                "name": 'Banana',
-                "foodId": 8100,
-                "mealTypeId": meal_type,
-                "unitId": 147,    # Bar
-                "amount": 1,
-                "date": current_date
-            }
-        ],
-        7: [
-            {
-                "name": 'Protein Bar',
-                "foodId": 725735405,
-                "mealTypeId": meal_type,
-                "unitId": 17,    # Bar
-                "amount": 1,
-                "date": current_date
-            },
-            {
-                "name": 'Pre Workout',
-                "foodId": 798698937,
-                "mealTypeId": meal_type,
-                "unitId": 301,    # Container
-                "amount": 1,
-                "date": current_date
-            },
-        ],
-        8: [
-            {
-                "name": 'Protein Shake',
-                "foodId": 22788636, # Protein Shake
-                "mealTypeId": meal_type,
-                "unitId": 301,    # Packets
-                "amount": 1,
-                "date": current_date
-            },
-        ],
-        9: [
-            {
-                "name": 'Protein Pasta',
-                "foodId": 778450458,
-                "mealTypeId": meal_type,
-                "unitId": 226,    # Oz
-                "amount": 3,
-                "date": current_date
-            },
-            {
-                "name": 'Chicken',
-                "foodId": 787982016,
-                "mealTypeId": meal_type,
-                "unitId": 226,    # Oz
-                "amount": 6,
-                "date": current_date
-            },
-            {
-                "name": 'Parmasean Cheese',
-                "foodId": 752199077,
-                "mealTypeId": meal_type,
-                "unitId": 364,    # Tsp
-                "amount": 5,
-                "date": current_date
-            },
-            {
-                "name": 'Brocolli',
-                "foodId": 82945,
-                "mealTypeId": meal_type,
-                "unitId": 304,    # serving
-                "amount": 1,
-                "date": current_date
-            },
-        ],
-        10: [
-            {
-                "name": 'Milk (1%)',
-                "foodId": 692771571,
-                "mealTypeId": meal_type,
-                "unitId": 91,    # cups
-                "amount": 2,
-                "date": current_date
-            },
-            {
-                "name": 'Casein',
-                "foodId": 807556543,
-                "mealTypeId": meal_type,
-                "unitId": 301,    # scoop
-                "amount": 2,
-                "date": current_date
-            },
-        ],
-    }
-    
-    # Get the selected meal entries
-    if meal not in meals:
+    # Build the selected meal's entries from the shared templates
+    food_entries = build_meal_entries(meal, meal_type, current_date)
+    if food_entries is None:
         return jsonify({'error': f'Invalid meal selection: {meal}'}), 400
     
-    food_entries = meals[meal]
-    logged_foods = []
-    failed_foods = []
-    
-    # Log each food item in the meal
-    for entry in food_entries:
-        url = f"https://api.fitbit.com/1/user/-/foods/log.json?foodId={entry['foodId']}&mealTypeId={entry['mealTypeId']}&unitId={entry['unitId']}&amount={entry['amount']}&date={entry['date']}"
-        result = make_fitbit_api_request(url, method='POST', description=f"logging food: {entry['name']}")
-        
-        if result is not None:
-            logged_foods.append(entry['name'])
-        else:
-            failed_foods.append(f"{entry['name']}: Request failed")
+    food_entries, rejected, fixed = preflight_entries(food_entries)
+    if not food_entries:
+        return rejected_batch_response(rejected, fixed)
     
-    # Clear caches once after all foods are logged
-    if logged_foods:
-        clear_food_related_caches()
-    
-    # Return results
-    if failed_foods:
-        return jsonify({
-            'message': f"Logged {len(logged_foods)} foods successfully. Failed: {len(failed_foods)}",
-            'logged_foods': logged_foods,
-            'failed_foods': failed_foods,
-            'date': current_date
-        }), 207  # Multi-status
-    else:
-        return jsonify({
-            'message': f"Successfully logged {len(logged_foods)} foods",
-            'logged_foods': logged_foods,
-            'date': current_date
-        }), 201
+    # Log every food item in the meal
+    logged, failed_foods, queued = log_food_entries(food_entries, description='logging food')
+    return logged_batch_response(f'meal {meal}', logged, failed_foods, queued, rejected, fixed, date=current_date)
 
-@app.route('/api/foods', methods=['GET'])
+@api.route('/api/foods', methods=['GET'])
 def get_foods():
-    global access_token, refresh_token
-    
     # Get date from query parameter, default to today
     date_param = request.args.get('date')
     if date_param:
@@ -480,263 +593,871 @@ def get_foods():
         # If no date provided, use server's current date (fallback)
         target_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Call the cached function with the date parameter
-    return get_foods_cached(target_date)
+    payload = read_day_foods(target_date)
+    if payload is None:
+        return jsonify({'error': 'Failed to fetch foods data'}), 500
+    if payload['data'].get('stale'):
+        g.stale = True
+    return payload_response(payload)
+
+def read_day_foods(target_date):
+    """
+    Foods of a day as served by /api/foods (an encoded payload), None if Fitbit failed
+    and the day was never mirrored, while Fitbit is failing the last mirrored copy
+    is served with stale set
+    """
+    # Days in the mirror are served from it, today and yesterday only while fresh
+    max_age = current_app.config['MIRROR_HOT_TTL'] if target_date in hot_dates() else None
+    foods = food_mirror.day_foods(target_date, max_age=max_age)
+    if foods is not None:
+        return encode_payload({
+            'date': target_date,
+            'foods': foods,
+            'total_foods': len(foods)
+        })
+    
+    # Call the cached function with the date parameter, and mirror what it returns
+    payload = get_foods_cached(target_date)
+    if payload is not None:
+        food_mirror.store_day(target_date, payload['data']['foods'])
+        return payload
+    
+    # Failures are not memoized, the client keeps them out of Fitbit for a short while
+    foods = food_mirror.day_foods(target_date, stale_ok=True)
+    if foods is None:
+        return None
+    return encode_payload({
+        'date': target_date,
+        'foods': foods,
+        'total_foods': len(foods),
+        'stale': True
+    })
 
 @cache.memoize(timeout=300)  # Cache for 5 minutes based on function arguments
 def get_foods_cached(target_date):
-    global access_token, refresh_token
-    
-    # Get foods logged for the date
-    foods_url = f"https://api.fitbit.com/1/user/-/foods/log/date/{target_date}.json"
-    foods_data = make_fitbit_api_request(foods_url, method='GET', description="fetching foods logged")
+    """Day log as served by /api/foods (an encoded payload), None (never memoized) if Fitbit failed"""
+    # Get foods logged for the date, always from the API, the copy written to
+    # the disk cache is what the CLI reads
+    foods_data = fetch_food_log(target_date, refresh=True)
     
     if not foods_data:
-        return jsonify({'error': 'Failed to fetch foods data'}), 500
+        return None
     
     # Extract and format the foods
-    foods = []
-    if 'foods' in foods_data:
-        for food in foods_data['foods']:
-            foods.append({
-                'id': food.get('logId'),  # Add the log ID for deletion
-                'foodId': food.get('loggedFood', {}).get('foodId'),
-                'name': food.get('loggedFood', {}).get('name', 'Unknown'),
-                'mealType': food.get('loggedFood', {}).get('mealTypeId', 0),
-                'amount': food.get('loggedFood', {}).get('amount', 0),
-                'unit': food.get('loggedFood', {}).get('unit', {}).get('name', ''),
-                'unitId': food.get('loggedFood', {}).get('unit', {}).get('id'),
-                'calories': food.get('loggedFood', {}).get('calories', 0),
-                'time': food.get('loggedFood', {}).get('logDate', '')
-            })
+    foods = format_logged_foods(foods_data)
+    food_index.learn(foods)
     
-    return jsonify({
+    return encode_payload({
         'date': target_date,
         'foods': foods,
         'total_foods': len(foods)
-    }), 200
+    })
 
-@app.route('/api/foods/<food_log_id>', methods=['DELETE'])
+@api.route('/api/foods/<food_log_id>', methods=['DELETE'])
 def delete_food(food_log_id):
-    global access_token, refresh_token
-    
     # Delete the food entry
     delete_url = f"https://api.fitbit.com/1/user/-/foods/log/{food_log_id}.json"
-    success = make_fitbit_api_request(delete_url, method='DELETE', description="deleting food")
+    # Looked up before the delete, the mirror forgets the entry once it is gone
+    target_date = entry_date(request.args.get('date'), food_log_id)
+    try:
+        success = submit_fitbit_api_request(delete_url, method='DELETE', description="deleting food").result()
+    except UpstreamUnavailable:
+        write_id = write_queue.add('DELETE', delete_url, "deleting food", date=target_date)
+        return jsonify({'message': 'Fitbit is unavailable, the food is deleted once it recovers',
+                        'writeId': write_id}), 202
+    except DeadlineExceeded:
+        success = None
     
     if success:
-        clear_food_related_caches()  # Clear caches since food data changed
+        # Clear caches since food data changed, only for the entry's date when it is known
+        clear_food_caches_for_dates([target_date])
+        publish_entry_removed(target_date, food_log_id)
         return jsonify({'message': 'Food deleted successfully'}), 200
     else:
         return jsonify({'error': 'Failed to delete food'}), 500
 
-@app.route('/api/units/search', methods=['GET'])
-@cache.memoize(timeout=600)  # Cache for 10 minutes based on search query
+@api.route('/api/foods/bulk_delete', methods=['POST'])
+def bulk_delete_foods():
+    """
+    Delete many food log entries at once, selected by one of
+    - logIds: list of logIds (or {logId, date} objects), with an optional date for all of them
+    - batchId: every entry created by a logged batch
+    - date and mealTypeId: every entry of a meal on a date
+    """
+    data = request.json or {}
+    batch_id = data.get('batchId')
+    targets = []  # (logId, date or None)
+    
+    if data.get('logIds'):
+        for item in data['logIds']:
+            if isinstance(item, dict):
+                targets.append((item.get('logId'), item.get('date') or data.get('date')))
+            else:
+                targets.append((item, data.get('date')))
+    elif batch_id:
+        batch = batch_registry.get(batch_id)
+        if not batch:
+            return jsonify({'error': f'Unknown batch: {batch_id}'}), 404
+        targets = [(entry['logId'], entry['date']) for entry in batch['entries']]
+    elif data.get('date') and data.get('mealTypeId') is not None:
+        payload = get_foods_cached(data['date'])
+        if payload is None:
+            return jsonify({'error': 'Failed to fetch foods data'}), 500
+        meal_type_id = int(data['mealTypeId'])
+        targets = [(food.id, data['date']) for food in payload['data']['foods']
+                   if food.mealType == meal_type_id]
+    else:
+        return jsonify({'error': 'logIds, batchId, or date and mealTypeId are required'}), 400
+    
+    targets = [(log_id, entry_date(target_date, log_id)) for log_id, target_date in targets]
+    
+    # Send every delete at once, the scheduler decides how many go out in parallel
+    pending = [(log_id, target_date, submit_fitbit_api_request(
+        f"https://api.fitbit.com/1/user/-/foods/log/{log_id}.json", method='DELETE', description="bulk deleting food"))
+        for log_id, target_date in targets if log_id is not None]
+    
+    deleted = []
+    failed = []
+    queued = []
+    affected_dates = []
+    for log_id, target_date, future in pending:
+        try:
+            success = future.result()
+        except UpstreamUnavailable:
+            queued.append(log_id)
+            write_queue.add('DELETE', f"https://api.fitbit.com/1/user/-/foods/log/{log_id}.json",
+                            "bulk deleting food", date=target_date)
+            continue
+        except DeadlineExceeded:
+            success = None
+        
+        if success:
+            deleted.append(log_id)
+            affected_dates.append(target_date)
+            publish_entry_removed(target_date, log_id)
+        else:
+            failed.append(log_id)
+    
+    # Clear caches once per affected date
+    clear_food_caches_for_dates(affected_dates)
+    if deleted:
+        batch_registry.remove_entries(deleted)
+    
+    body = {'deleted': deleted, 'failed': failed}
+    if queued:
+        body['queued'] = queued
+    if failed:
+        body['message'] = f"Deleted {len(deleted)} foods successfully. Failed: {len(failed)}"
+        return jsonify(body), 207  # Multi-status
+    if queued:
+        body['message'] = f"Deleted {len(deleted)} foods. Queued until Fitbit is available: {len(queued)}"
+        return jsonify(body), 202
+    body['message'] = f"Successfully deleted {len(deleted)} foods"
+    return jsonify(body), 200
+
+@api.route('/api/batches', methods=['GET'])
+def list_batches():
+    """Recently logged batches that can still be undone through bulk delete"""
+    limit = int(request.args.get('limit', 20))
+    return jsonify({'batches': batch_registry.recent(limit)}), 200
+
+@api.route('/api/units/search', methods=['GET'])
 def search_units():
-    global access_token, refresh_token
-    
     # Get search query from request
     query = request.args.get('q', '').lower()
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
+    # Answers are kept encoded for as long as the catalog they came from
+    payload = units_search_cache.get(query)
+    if payload is not None:
+        return payload_response(payload)
+    
     # Get all units from cache or API
-    units_data = get_cached_units()
+    catalog = get_cached_units()
     
-    if not units_data:
+    if not catalog:
         return jsonify({'error': 'Failed to fetch units data'}), 500
     
     # Filter units by search query
-    matching_units = []
-    for unit in units_data:
-        if query in unit.get('name', '').lower() or query in unit.get('plural', '').lower():
-            matching_units.append({
-                'id': unit.get('id'),
-                'name': unit.get('name'),
-                'plural': unit.get('plural')
-            })
+    matching_units = catalog.search(query)
     
-    return jsonify({
+    payload = encode_payload({
         'query': query,
         'units': matching_units,
         'total': len(matching_units)
+    })
+    units_search_cache.set(query, payload, size=payload_size(payload))
+    return payload_response(payload)
+
+@api.route('/api/units/<int:unit_id>', methods=['GET'])
+def get_unit(unit_id):
+    """Single unit by id from the units catalog"""
+    catalog = get_cached_units()
+    
+    if not catalog:
+        return jsonify({'error': 'Failed to fetch units data'}), 500
+    
+    unit = catalog.get(unit_id)
+    if unit is None:
+        return jsonify({'error': f'Unknown unit: {unit_id}'}), 404
+    
+    return jsonify(unit), 200
+
+@api.route('/api/units/resolve', methods=['POST'])
+def resolve_units():
+    """
+    Resolve many units at once by id and/or by exact name or plural
+    unknown ids and names map to null
+    """
+    data = request.json or {}
+    catalog = get_cached_units()
+    
+    if not catalog:
+        return jsonify({'error': 'Failed to fetch units data'}), 500
+    
+    return jsonify({
+        'ids': {str(unit_id): catalog.get(unit_id) for unit_id in data.get('ids', [])},
+        'names': {name: catalog.resolve_name(name) for name in data.get('names', [])}
     }), 200
 
-@app.route('/api/foods/<food_log_id>', methods=['PUT'])
-def update_food(food_log_id):
-    global access_token, refresh_token
+def find_logged_food(target_date, food_log_id):
+    """Look up a logged food through the day log cache, returns it as a loggable entry"""
+    payload = get_foods_cached(target_date)
+    if payload is None:
+        return None
+    for food in payload['data']['foods']:
+        if str(food.id) == str(food_log_id):
+            return {
+                'foodId': food.foodId,
+                'mealTypeId': food.mealType,
+                'unitId': food.unitId,
+                'amount': food.amount,
+                'date': target_date
+            }
+    return None
+
+def fresh_day_foods(target_date):
+    """Raw foods of a day straight from Fitbit, raises OutcomeUnknown when they cannot be fetched"""
+    foods_data = fetch_food_log(target_date, refresh=True)
+    if not foods_data:
+        raise OutcomeUnknown(f"Food log of {target_date} could not be fetched")
+    return foods_data.get('foods', [])
+
+def logged_after(entry, food_log_id):
+    """
+    Fitbit's answer for an entry like entry (same food, meal, unit and amount) logged after
+    food_log_id, None if there is none, logIds only grow so a create whose answer was lost
+    shows up here, raises OutcomeUnknown when the day log cannot be fetched
+    """
+    for food in fresh_day_foods(entry['date']):
+        logged = food.get('loggedFood') or {}
+        if (int(food.get('logId') or 0) > int(food_log_id)
+                and logged.get('foodId') == int(entry['foodId'])
+                and logged.get('mealTypeId') == int(entry['mealTypeId'])
+                and (logged.get('unit') or {}).get('id') == int(entry['unitId'])
+                and round(float(logged.get('amount') or 0), 2) == round(float(entry['amount']), 2)):
+            return {'foodLog': food}
+    return None
+
+def send_edit_write(url, method, description, user=None):
+    """Send one write of an edit, raises OutcomeUnknown when its answer was lost after it was sent"""
+    return submit_fitbit_api_request(url, method=method, description=description, user=user,
+                                     raise_unknown=True).result()
+
+def queue_food_edit(journal_id, food_log_id, writes, restoring=False):
+    """
+    Hold the writes left of an edit in the write queue while Fitbit is unavailable,
+    restoring is set when the POST left logs the original again rather than the replacement
+    the edit is closed by queued_edit_written() or queued_edit_failed() once the queue gets to it
+    """
+    write_ids = [write_queue.add(method, url, description, date=target_date, journal_id=journal_id)
+                 for method, url, description, target_date in writes]
+    edit_journal.update(journal_id, QUEUED, writeIds=write_ids, restoring=restoring)
+    return {'logId': food_log_id, 'status': QUEUED, 'writeIds': write_ids}
+
+def queued_edit_written(write):
+    """A queued write of an edit went through, its POST closes the edit"""
+    entry = edit_journal.get(write['journalId'])
+    if write['method'] != 'POST' or entry is None or entry['state'] != QUEUED:
+        return
+    original = entry.get('original')
+    result = write['result'] if isinstance(write['result'], dict) else {}
+    new_log_id = result.get('foodLog', {}).get('logId')
+    if entry.get('restoring'):
+        edit_journal.update(entry['id'], RESTORED, newLogId=new_log_id,
+                            error='Failed to create new food log, original entry restored')
+        publish_entry_replaced(entry['logId'], original, original, result)
+    else:
+        edit_journal.update(entry['id'], UPDATED, newLogId=new_log_id)
+        publish_entry_replaced(entry['logId'], original, entry['new'], result)
+
+def queued_edit_failed(write):
+    """
+    A queued write of an edit failed MAX_ATTEMPTS times, the edit is closed the way a live
+    one would be: FAILED when the original was never deleted, otherwise the original is
+    restored, ORPHANED when that fails too
+    """
+    entry = edit_journal.get(write['journalId'])
+    if entry is None or entry['state'] != QUEUED:
+        return
+    original = entry.get('original')
+    print(f"[Backend] Queued edit of food log {entry['logId']} failed: {write['description']}")
+    try:
+        if write['method'] == 'DELETE':
+            # The answer of a replayed write may have been lost, the day log tells
+            if original and any(str(food.get('logId')) == str(entry['logId'])
+                                for food in fresh_day_foods(original['date'])):
+                edit_journal.update(entry['id'], FAILED, error='Failed to delete old food log')
+                return
+            edit_journal.update(entry['id'], DELETED)
+            finish_food_edit(entry['id'], entry['logId'], original, entry['new'])
+        elif settle_food_edit(entry):
+            return
+        elif entry.get('restoring'):
+            orphan_food_edit(entry['id'], entry['logId'], original)
+        else:
+            restore_food_edit(entry['id'], entry['logId'], original)
+    except OutcomeUnknown as e:
+        # recover_edit_journal() looks again on the next start, before sending anything
+        print(f"[Backend] Edit of food log {entry['logId']} left for the next start: {e}")
+
+def apply_food_edit(food_log_id, original, new, user=None, journal_id=None):
+    """
+    Replace a food log entry (DELETE then POST) under the edit journal
+    if the replacement cannot be created the original entry is logged again,
+    while Fitbit is unavailable the writes are queued instead
+    """
+    if journal_id is None:
+        journal_id = edit_journal.begin(food_log_id, original, new)
+    
+    # Step 1: Delete the old food log
+    delete_url = f"https://api.fitbit.com/1/user/-/foods/log/{food_log_id}.json"
+    try:
+        delete_success = send_edit_write(delete_url, 'DELETE', "deleting old food log for update", user=user)
+    except UpstreamUnavailable:
+        # Nothing was sent, the whole edit is replayed in order once Fitbit recovers
+        return queue_food_edit(journal_id, food_log_id, [
+            ('DELETE', delete_url, "deleting old food log for update", original.get('date') if original else None),
+            ('POST', food_log_create_url(new), "creating new food log for update", new['date'])])
+    except OutcomeUnknown:
+        # The answer was lost, the day log shows whether the delete went through
+        try:
+            delete_success = not original or not any(str(food.get('logId')) == str(food_log_id)
+                                                     for food in fresh_day_foods(original['date']))
+        except OutcomeUnknown:
+            error = 'Could not tell whether the old food log was deleted, the edit is finished on restart'
+            edit_journal.update(journal_id, PENDING, error=error)
+            return {'logId': food_log_id, 'status': FAILED, 'error': error}
+    except DeadlineExceeded:
+        delete_success = None
+    if not delete_success:
+        edit_journal.update(journal_id, FAILED, error='Failed to delete old food log')
+        return {'logId': food_log_id, 'status': FAILED, 'error': 'Failed to delete old food log'}
+    edit_journal.update(journal_id, DELETED)
     
+    # Step 2: Create the new food log
+    return finish_food_edit(journal_id, food_log_id, original, new, user=user)
+
+def finish_food_edit(journal_id, food_log_id, original, new, user=None):
+    """
+    Create the replacement for an already deleted entry, restoring the original if that fails
+    creates are only sent again when they never reached Fitbit or it refused them, after a
+    lost answer the day log is checked first so an edit never logs an entry twice
+    """
+    try:
+        for attempt in range(CREATE_ATTEMPTS):
+            try:
+                create_result = send_edit_write(food_log_create_url(new), 'POST', f"creating new food log for update (attempt {attempt + 1})", user=user)
+            except UpstreamUnavailable:
+                # The original is gone, the replacement is created once Fitbit recovers
+                publish_entry_removed(original.get('date') if original else None, food_log_id)
+                return queue_food_edit(journal_id, food_log_id, [
+                    ('POST', food_log_create_url(new), "creating new food log for update", new['date'])])
+            except OutcomeUnknown:
+                create_result = logged_after(new, food_log_id)
+            except DeadlineExceeded:
+                create_result = None
+            if create_result is not None:
+                new_log_id = create_result.get('foodLog', {}).get('logId')
+                edit_journal.update(journal_id, UPDATED, newLogId=new_log_id)
+                publish_entry_replaced(food_log_id, original, new, create_result)
+                return {'logId': food_log_id, 'status': UPDATED, 'newLogId': new_log_id, 'data': create_result}
+    except OutcomeUnknown:
+        # A create may have gone through but the day log could not be fetched to tell,
+        # recovery looks again before sending anything
+        return orphan_food_edit(journal_id, food_log_id, original)
+    
+    # The replacement could not be created, put the original back
+    return restore_food_edit(journal_id, food_log_id, original, user=user)
+
+def restore_food_edit(journal_id, food_log_id, original, user=None):
+    """Log the original of an edit again after its replacement failed, ORPHANED if that fails too"""
+    if not original:
+        return orphan_food_edit(journal_id, food_log_id, original)
+    try:
+        try:
+            restore_result = send_edit_write(food_log_create_url(original), 'POST', "restoring original food log", user=user)
+        except UpstreamUnavailable:
+            publish_entry_removed(original.get('date'), food_log_id)
+            return queue_food_edit(journal_id, food_log_id, [
+                ('POST', food_log_create_url(original), "restoring original food log", original.get('date'))],
+                restoring=True)
+        except OutcomeUnknown:
+            restore_result = logged_after(original, food_log_id)
+        except DeadlineExceeded:
+            restore_result = None
+    except OutcomeUnknown:
+        restore_result = None
+    if restore_result is None:
+        return orphan_food_edit(journal_id, food_log_id, original)
+    restored_log_id = restore_result.get('foodLog', {}).get('logId')
+    error = 'Failed to create new food log, original entry restored'
+    edit_journal.update(journal_id, RESTORED, newLogId=restored_log_id, error=error)
+    publish_entry_replaced(food_log_id, original, original, restore_result)
+    return {'logId': food_log_id, 'status': RESTORED, 'newLogId': restored_log_id, 'error': error}
+
+def orphan_food_edit(journal_id, food_log_id, original):
+    """Neither the replacement nor the original could be logged, recovery tries again on restart"""
+    error = 'Failed to create new food log and restore the original, will retry on restart'
+    edit_journal.update(journal_id, ORPHANED, error=error)
+    publish_entry_removed(original.get('date') if original else None, food_log_id)
+    return {'logId': food_log_id, 'status': ORPHANED, 'error': error}
+
+def publish_entry_replaced(food_log_id, original, new, result):
+    """
+    Record an edit in the mirror's changelog and push it, the entry under its new
+    logId replaces food_log_id (possibly on another date)
+    """
+    food_log = result.get('foodLog') if isinstance(result, dict) else None
+    if not food_log:
+        return
+    entry = FoodLogEntry.from_fitbit(food_log)
+    original_date = original.get('date') if original else None
+    food_mirror.apply_replaced(original_date, event_log_id(food_log_id), new['date'], entry)
+    forget_personal_history()
+    event_bus.publish('entry.updated', date=original_date, id=event_log_id(food_log_id),
+                      newDate=new['date'], entry=entry)
+
+def settle_food_edit(entry):
+    """
+    Close an interrupted edit whose replacement (or restored original) is already logged,
+    its create may have gone through without the answer arriving, returns True if it was
+    raises OutcomeUnknown when the day log cannot be fetched
+    """
+    original = entry.get('original')
+    created = logged_after(entry['new'], entry['logId'])
+    if created is not None:
+        edit_journal.update(entry['id'], UPDATED, newLogId=created['foodLog'].get('logId'))
+        publish_entry_replaced(entry['logId'], original, entry['new'], created)
+        return True
+    restored = logged_after(original, entry['logId']) if original else None
+    if restored is not None:
+        edit_journal.update(entry['id'], RESTORED, newLogId=restored['foodLog'].get('logId'),
+                            error='Failed to create new food log, original entry restored')
+        publish_entry_replaced(entry['logId'], original, original, restored)
+        return True
+    return False
+
+def recover_food_edit(entry):
+    """Finish one interrupted edit"""
+    original = entry.get('original')
+    print(f"[Backend] Recovering {entry['state']} edit of food log {entry['logId']}")
+    if entry['state'] in (DELETED, ORPHANED, QUEUED):
+        try:
+            if settle_food_edit(entry):
+                return
+        except OutcomeUnknown as e:
+            print(f"[Backend] Edit of food log {entry['logId']} left for the next start: {e}")
+            return
+    if entry['state'] in (DELETED, ORPHANED):
+        finish_food_edit(entry['id'], entry['logId'], original, entry['new'])
+    elif original and find_logged_food(original['date'], entry['logId']):
+        # The original was never deleted, run the whole edit again
+        apply_food_edit(entry['logId'], original, entry['new'], journal_id=entry['id'])
+    else:
+        finish_food_edit(entry['id'], entry['logId'], original, entry['new'])
+
+def recover_edit_journal():
+    """
+    Finish edits that were interrupted before reaching a final state, queued edits
+    are left to the write queue while it still holds one of their writes
+    """
+    queued_ids = {write['id'] for write in write_queue.pending()}
+    for entry in edit_journal.unresolved():
+        if entry['state'] == QUEUED and queued_ids.intersection(entry.get('writeIds') or []):
+            continue
+        recover_food_edit(entry)
+    clear_food_related_caches()
+
+def build_food_edit(food_log_id, data):
+    """
+    Work out the original and replacement entries for an edit request
+    fields missing from the request are taken from the original entry
+    """
+    date = data.get('date')
+    original_date = data.get('originalDate') or date
+    if original_date and len(original_date) > 10:
+        original_date = original_date[:10]
+    original = data.get('original') or (find_logged_food(original_date, food_log_id) if original_date else None)
+    
+    new = {}
+    for field in ('foodId', 'mealTypeId', 'unitId', 'amount', 'date'):
+        value = data.get(field)
+        if value is None and original:
+            value = original.get(field)
+        new[field] = value
+    
+    if new['date'] and len(new['date']) > 10:
+        new['date'] = new['date'][:10]  # Take only the date part if it includes time
+    
+    return original, new
+
+def edit_dates(original, new):
+    """Dates whose day log changes with an edit, None when the original date is unknown"""
+    return [original.get('date') if original else None, new['date']]
+
+@api.route('/api/foods/<food_log_id>', methods=['PUT'])
+def update_food(food_log_id):
     # Get update data from request
     data = request.json
     print(f"[Backend] Update food request data: {data}")
     
-    amount = data.get('amount')
-    unit_id = data.get('unitId')
-    food_id = data.get('foodId')
-    meal_type_id = data.get('mealTypeId')
-    date = data.get('date')
+    if None in (data.get('amount'), data.get('unitId'), data.get('foodId'), data.get('mealTypeId'), data.get('date')):
+        return jsonify({'error': 'amount, unitId, foodId, mealTypeId, and date are required'}), 400
     
-    print(f"[Backend] Parsed values - amount: {amount}, unit_id: {unit_id}, food_id: {food_id}, meal_type_id: {meal_type_id}, date: {date}")
+    original, new = build_food_edit(food_log_id, data)
+    print(f"[Backend] Parsed values - original: {original}, new: {new}")
     
-    if None in (amount, unit_id, food_id, meal_type_id, date):
-        return jsonify({'error': 'amount, unitId, foodId, mealTypeId, and date are required'}), 400
+    result = apply_food_edit(food_log_id, original, new)
+    print(f"[Backend] Update result: {result['status']}")
     
-    # Step 1: Delete the old food log
-    delete_url = f"https://api.fitbit.com/1/user/-/foods/log/{food_log_id}.json"
-    print(f"[Backend] Deleting food log: {delete_url}")
-    delete_success = make_fitbit_api_request(delete_url, method='DELETE', description="deleting old food log for update")
-    print(f"[Backend] Delete result: {delete_success}")
-    if not delete_success:
+    if result['status'] != FAILED:
+        clear_food_caches_for_dates(edit_dates(original, new))  # Clear caches since food data changed
+    
+    if result['status'] == UPDATED:
+        return jsonify({'message': 'Food updated (deleted and created) successfully', 'data': result['data']}), 200
+    elif result['status'] == QUEUED:
+        return jsonify({'message': 'Fitbit is unavailable, the food is updated once it recovers',
+                        'writeIds': result['writeIds']}), 202
+    elif result['status'] == FAILED:
         return jsonify({'error': 'Failed to delete old food log'}), 500
+    else:
+        return jsonify({'error': result['error']}), 500
+
+@api.route('/api/foods/bulk_edit', methods=['POST'])
+def bulk_edit_foods():
+    """
+    Edit many food log entries at once
+    each edit is a DELETE/POST pair, pairs run concurrently under the upstream scheduler
+    """
+    data = request.json or {}
+    edits = data.get('edits', [])
+    
+    if not edits:
+        return jsonify({'error': 'No edits provided'}), 400
     
-    # Step 2: Create a new food log
-    formatted_date = date
-    if date and len(date) > 10:
-        formatted_date = date[:10]  # Take only the date part if it includes time
+    user = current_user_key()
+    results = [None] * len(edits)
+    pending = []
+    affected_dates = []
     
-    create_url = f"https://api.fitbit.com/1/user/-/foods/log.json?foodId={int(food_id)}&mealTypeId={int(meal_type_id)}&unitId={int(unit_id)}&amount={float(amount)}&date={formatted_date}"
-    print(f"[Backend] Creating new food log: {create_url}")
+    for index, edit in enumerate(edits):
+        food_log_id = edit.get('logId')
+        if food_log_id is None:
+            results[index] = {'logId': None, 'status': FAILED, 'error': 'logId is required'}
+            continue
+        
+        original, new = build_food_edit(food_log_id, edit)
+        if None in new.values():
+            results[index] = {'logId': food_log_id, 'status': FAILED, 'error': 'Original entry not found, amount, unitId, foodId, mealTypeId, and date are required'}
+            continue
+        
+        pending.append((index, edit_dates(original, new), submit_task(apply_food_edit, food_log_id, original, new, user=user)))
     
-    create_result = make_fitbit_api_request(create_url, method='POST', description="creating new food log for update")
-    print(f"[Backend] Create result: {create_result}")
-    if create_result is not None:
-        clear_food_related_caches()  # Clear caches since food data changed
-        return jsonify({'message': 'Food updated (deleted and created) successfully', 'data': create_result}), 200
+    for index, dates, future in pending:
+        results[index] = future.result()
+        if results[index]['status'] != FAILED:
+            affected_dates.extend(dates)
+    
+    # Clear caches once per affected date after all edits ran
+    clear_food_caches_for_dates(affected_dates)
+    
+    updated = sum(1 for result in results if result['status'] == UPDATED)
+    queued = sum(1 for result in results if result['status'] == QUEUED)
+    for result in results:
+        result.pop('data', None)
+    
+    if updated == len(results):
+        return jsonify({
+            'message': f"Successfully updated {updated} foods",
+            'results': results
+        }), 200
+    elif updated + queued == len(results):
+        return jsonify({
+            'message': f"Updated {updated} foods. Queued until Fitbit is available: {queued}",
+            'results': results
+        }), 202
     else:
-        return jsonify({'error': 'Failed to create new food log'}), 500
+        return jsonify({
+            'message': f"Updated {updated} foods successfully. Failed: {len(results) - updated}",
+            'results': results
+        }), 207  # Multi-status
 
-@app.route('/api/calories', methods=['GET'])
-@cache.memoize(timeout=300)  # Cache for 5 minutes based on function arguments (days parameter)
+@api.route('/api/foods/bulk_edit/journal', methods=['GET'])
+def edit_journal_status():
+    """Edits that were interrupted and have not reached a final state"""
+    unresolved = edit_journal.unresolved()
+    return jsonify({'unresolved': unresolved, 'total': len(unresolved)}), 200
+
+@api.route('/api/calories', methods=['GET'])
 def get_calories():
-    global access_token, refresh_token
-    
     # Get number of days from query parameter, default to 7
     days = int(request.args.get('days', 7))
     
+    calories = calories_range(days)
+    if calories is None:
+        return jsonify({'error': 'Failed to fetch calories data'}), 500
+    if calories['data'].get('stale'):
+        g.stale = True
+    
+    return payload_response(calories)
+
+def calories_range(days):
+    """fetch_calories(), or the last good range marked stale while Fitbit is failing"""
+    calories = fetch_calories(days)
+    if calories is not None:
+        last_good.set(('calories', days), calories, size=payload_size(calories))
+        return calories
+    stale = last_good.get(('calories', days))
+    return encode_payload(dict(stale['data'], stale=True)) if stale is not None else None
+
+@cache.memoize(timeout=300)  # Cache for 5 minutes based on function arguments (days parameter)
+def fetch_calories(days):
+    """
+    Calories consumed, burned and net per day for the last `days` days as an encoded
+    payload, None if Fitbit failed
+    """
     # Calculate date range
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days-1)
     start_str = start_date.strftime('%Y-%m-%d')
     end_str = end_date.strftime('%Y-%m-%d')
     
-    # Fetch calories in and burned for the range
+    # Fetch calories in and burned for the range, both requests go out together
     calories_in_url = f"https://api.fitbit.com/1/user/-/foods/log/caloriesIn/date/{start_str}/{end_str}.json"
-    calories_in_data = make_fitbit_api_request(calories_in_url, method='GET', description=f"calories consumed from {start_str} to {end_str}")
-    print(f"DEBUG: calories_in_data for {start_str} to {end_str}: {calories_in_data}")
-    
     calories_out_url = f"https://api.fitbit.com/1/user/-/activities/calories/date/{start_str}/{end_str}.json"
-    calories_out_data = make_fitbit_api_request(calories_out_url, method='GET', description=f"calories burned from {start_str} to {end_str}")
-    print(f"DEBUG: calories_out_data for {start_str} to {end_str}: {calories_out_data}")
+    calories_in_future = submit_fitbit_api_request(calories_in_url, method='GET', description=f"calories consumed from {start_str} to {end_str}")
+    calories_out_future = submit_fitbit_api_request(calories_out_url, method='GET', description=f"calories burned from {start_str} to {end_str}")
     
-    # Build a date-indexed dict for calories in
-    calories_in_dict = {}
-    if calories_in_data and isinstance(calories_in_data, dict):
-        for entry in calories_in_data.get('foods-log-caloriesIn', []):
-            calories_in_dict[entry.get('dateTime')] = entry.get('value', 0)
+    try:
+        calories_in_data = calories_in_future.result()
+    except DeadlineExceeded:
+        calories_in_data = None
+    try:
+        calories_out_data = calories_out_future.result()
+    except DeadlineExceeded:
+        calories_out_data = None
+    print(f"DEBUG: calories_in_data for {start_str} to {end_str}: {calories_in_data}")
+    print(f"DEBUG: calories_out_data for {start_str} to {end_str}: {calories_out_data}")
     
-    # Build a date-indexed dict for calories burned
-    calories_out_dict = {}
-    if calories_out_data and isinstance(calories_out_data, dict):
-        for entry in calories_out_data.get('activities-calories', []):
-            calories_out_dict[entry.get('dateTime')] = entry.get('value', 0)
+    if calories_in_data is None and calories_out_data is None:
+        return None
     
     # Build the result for each day in the range
-    calories_data = []
-    for i in range(days):
-        target_date = (start_date + timedelta(days=i)).strftime('%Y-%m-%d')
-        calories_consumed = calories_in_dict.get(target_date, 0)
-        calories_burned = calories_out_dict.get(target_date, 0)
-        net_calories = int(calories_consumed) - int(calories_burned)
-        calories_data.append({
-            'date': target_date,
-            'calories_consumed': calories_consumed,
-            'calories_burned': calories_burned,
-            'net_calories': net_calories
-        })
+    dates = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    calories_data = DailyCalories.range_from_fitbit(dates, calories_in_data, calories_out_data)
     
-    return jsonify({
+    return encode_payload({
         'days': days,
         'data': calories_data,
         'unit': 'calories'
-    }), 200
+    })
 
-@app.route('/api/foods/search', methods=['GET'])
-@cache.memoize(timeout=300)  # Cache for 5 minutes based on search query
+@api.route('/api/foods/search', methods=['GET'])
 def search_foods():
-    global access_token, refresh_token, food_search_cache
-    
     # Get search query from request
     query = request.args.get('q', '').lower()
     
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
-    # Check cache first
-    current_time = datetime.now().timestamp()
-    if query in food_search_cache:
-        cached_data, cache_time = food_search_cache[query]
-        if current_time - cache_time < FOOD_SEARCH_CACHE_DURATION:
-            return jsonify({
-                'query': query,
-                'foods': cached_data,
-                'total': len(cached_data),
-                'cached': True
-            }), 200
-    
-    # Search for foods using Fitbit API
-    foods_url = f"https://api.fitbit.com/1/foods/search.json?query={query}"
-    foods_data = make_fitbit_api_request(foods_url, method='GET', description="searching foods")
+    # Personal foods come first, Fitbit is only searched when too few of them match
+    # (?remote=1 always searches it, ?remote=0 never does)
+    remote = request.args.get('remote')
+    refresh_personal_foods()
+    personal = personal_foods.search(query, get_cached_units())
+    if remote == '0' or (remote != '1' and len(personal) >= ENOUGH_MATCHES):
+        return jsonify({'query': query, 'foods': personal, 'total': len(personal), 'personal': len(personal)}), 200
+    
+    payload = remote_food_search(query)
+    if payload is None:
+        if personal:
+            return jsonify({'query': query, 'foods': personal, 'total': len(personal), 'personal': len(personal),
+                            'remote_failed': True}), 200
+        return jsonify({'error': 'Failed to fetch foods data'}), 500
+    if not personal:
+        return payload_response(payload)
+    
+    # Fitbit's results follow, without the foods already listed
+    listed = {hit.id for hit in personal}
+    foods = personal + [hit for hit in payload['data']['foods'] if hit.id not in listed]
+    return jsonify({'query': query, 'foods': foods, 'total': len(foods), 'personal': len(personal)}), 200
+
+def remote_food_search(query):
+    """Fitbit's search results for a query as an encoded payload, None if Fitbit failed"""
+    # Check cache first, hits are kept encoded
+    payload = food_search_cache.get(query)
+    if payload is not None:
+        return payload
+    
+    # Search for foods using Fitbit API, through the disk cache shared with the CLI
+    foods_data = fetch_food_search(query)
     
     if not foods_data:
-        return jsonify({'error': 'Failed to fetch foods data'}), 500
+        return None
     
     # Extract and format the foods
     foods = []
     if 'foods' in foods_data:
-        # Get cached units once for all foods
-        all_units = get_cached_units()
-        units_map = {}
-        if all_units:
-            units_map = {unit['id']: unit for unit in all_units}
+        # Get the cached units catalog once for all foods
+        catalog = get_cached_units()
         
         for food in foods_data['foods']:
+            hit = FoodSearchHit.from_fitbit(food, catalog)
             # Print food ID to console like search_food.py
-            food_id = food.get('foodId')
-            food_name = food.get('name', 'Unknown')
-            print(f"Food ID: {food_id} - {food_name}")
-            
-            # Get unit details for this food using cached data
-            unit_details = []
-            if 'units' in food and units_map:
-                for unit_id in food['units']:
-                    if unit_id in units_map:
-                        unit_details.append({
-                            'id': unit_id,
-                            'name': units_map[unit_id]['name']
-                        })
-            
-            foods.append({
-                'id': food_id,
-                'name': food_name,
-                'brand': food.get('brand', ''),
-                'calories': food.get('calories', 0),
-                'units': unit_details
-            })
+            print(f"Food ID: {hit.id} - {hit.name}")
+            foods.append(hit)
     
-    # Cache the results
-    food_search_cache[query] = (foods, current_time)
-    
-    return jsonify({
+    # Cache the results as the body later hits are answered with
+    body = {
         'query': query,
         'foods': foods,
-        'total': len(foods)
-    }), 200
+        'total': len(foods),
+        'personal': 0
+    }
+    payload = encode_payload(dict(body, cached=True))
+    food_search_cache.set(query, payload, size=payload_size(payload))
+    
+    return encode_payload(body)
 
-@app.route('/api/log_food_batch', methods=['POST'])
-def log_food_batch():
-    global access_token, refresh_token
+@api.route('/api/foods/quick_picks', methods=['GET'])
+def quick_picks():
+    """The top personal foods for an empty search, ?limit=N (at most 50)"""
+    try:
+        limit = min(int(request.args.get('limit', MAX_RESULTS)), 50)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
     
+    refresh_personal_foods()
+    foods = personal_foods.search('', get_cached_units(), limit=limit)
+    return jsonify({'foods': foods, 'total': len(foods)}), 200
+
+# Most foods a single details request may ask for
+MAX_DETAILS_IDS = 100
+
+def food_details(food_id, **request_args):
+    """Nutrition, units and servings of a food from the details cache or Fitbit, None if Fitbit failed"""
+    food_data = fetch_food_details(food_id, **request_args)
+    if not food_data or 'food' not in food_data:
+        return None
+    
+    food = food_data['food']
+    catalog = get_cached_units()
+    return {
+        'id': food.get('foodId'),
+        'name': food.get('name', 'Unknown'),
+        'brand': food.get('brand', ''),
+        'calories': food.get('calories', 0),
+        'defaultServingSize': food.get('defaultServingSize'),
+        'defaultUnit': food.get('defaultUnit'),
+        'units': catalog.details(food.get('units', [])) if catalog else [],
+        'servings': [{
+            'unitId': serving.get('unitId'),
+            'unit': serving.get('unit', {}).get('name', ''),
+            'servingSize': serving.get('servingSize'),
+            'multiplier': serving.get('multiplier'),
+        } for serving in food.get('servings', [])],
+        'nutrition': food.get('nutritionalValues', {}),
+    }
+
+def food_details_many(food_ids, **request_args):
+    """food_details() of several foods fetched concurrently, {foodId: details or None}"""
+    futures = {food_id: submit_task(food_details, food_id, **request_args) for food_id in food_ids}
+    details = {}
+    for food_id, future in futures.items():
+        try:
+            details[food_id] = future.result()
+        except Exception as e:
+            print(f"[Backend] Food details for {food_id} failed: {e}")
+            details[food_id] = None
+    return details
+
+def serving_calories(details, unit_id, amount):
+    """Estimated calories of an amount of a food in a unit, None if the food has no serving in that unit"""
+    if not details:
+        return None
+    for serving in details['servings']:
+        if serving['unitId'] == unit_id and serving['servingSize'] and serving['multiplier'] is not None:
+            # Fitbit's calories are per default serving, a serving's multiplier converts to it
+            return round(details['calories'] * serving['multiplier'] * amount / serving['servingSize'])
+    return None
+
+def warm_template_details():
+    """Fetch the details of every food in the meal templates, None if some could not be fetched"""
+    details = food_details_many(template_food_ids(), priority=PREFETCH)
+    return None if None in details.values() else details
+
+@api.route('/api/foods/<int:food_id>/details', methods=['GET'])
+def get_food_details(food_id):
+    """Nutrition, units and servings of a food, cached for a week"""
+    details = food_details(food_id)
+    if details is None:
+        return jsonify({'error': f'Failed to fetch details for food {food_id}'}), 500
+    return jsonify(details), 200
+
+@api.route('/api/foods/details', methods=['GET'])
+def get_foods_details():
+    """Details of several foods at once, ?ids=1,2,3"""
+    try:
+        food_ids = list(dict.fromkeys(int(food_id) for food_id in request.args.get('ids', '').split(',') if food_id.strip()))
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of foodIds'}), 400
+    if not food_ids:
+        return jsonify({'error': 'ids is required'}), 400
+    if len(food_ids) > MAX_DETAILS_IDS:
+        return jsonify({'error': f'At most {MAX_DETAILS_IDS} foods per request'}), 400
+    
+    details = food_details_many(food_ids)
+    foods = [food for food in details.values() if food is not None]
+    missing = [food_id for food_id, food in details.items() if food is None]
+    body = {'foods': foods, 'missing': missing, 'total': len(foods)}
+    if not foods:
+        body['error'] = 'Failed to fetch food details'
+        return jsonify(body), 500
+    return jsonify(body), 207 if missing else 200
+
+@api.route('/api/meals', methods=['GET'])
+def list_meals():
+    """Meal templates with the details of their foods, warmed at startup so this needs no upstream calls"""
+    details = food_details_many(template_food_ids())
+    meals = []
+    for meal, foods in MEALS.items():
+        entries = [dict(food, calories=serving_calories(details.get(food['foodId']), food['unitId'], food['amount']),
+                        details=details.get(food['foodId']))
+                   for food in foods]
+        calories = [entry['calories'] for entry in entries]
+        meals.append({
+            'id': meal,
+            'name': MEAL_NAMES.get(meal),
+            'foods': entries,
+            'calories': sum(calories) if None not in calories else None,
+        })
+    return jsonify({'meals': meals}), 200
+
+@api.route('/api/log_food_batch', methods=['POST'])
+def log_food_batch():
     # Get request data
     data = request.json
     foods = data.get('foods', [])  # Array of food objects
@@ -762,51 +1483,255 @@ def log_food_batch():
         else:
             current_date = datetime.now().strftime('%Y-%m-%d')
     
-    logged_foods = []
-    failed_foods = []
+    # Check every food item in the batch before anything is sent
+    entries, rejected, fixed = preflight_entries([{
+        'name': food.get('name', f"Food {food.get('foodId')}"),
+        'foodId': food.get('foodId'),
+        'mealTypeId': food.get('mealTypeId', 1),
+        'unitId': food.get('unitId'),
+        'unit': food.get('unit'),
+        'amount': food.get('amount'),
+        'date': current_date
+    } for food in foods])
+    if not entries:
+        return rejected_batch_response(rejected, fixed)
+    
+    logged, failed_foods, queued = log_food_entries(entries, description='logging batch food')
+    return logged_batch_response('batch', logged, failed_foods, queued, rejected, fixed, date=current_date)
+
+@api.route('/api/foods/copy', methods=['POST'])
+def copy_foods():
+    """
+    Copy every entry, or one meal type, from a source date to one or more target dates
+    the source day is read through the day log cache and the copies are logged concurrently
+    """
+    data = request.json or {}
+    source_date = data.get('sourceDate')
+    target_dates = data.get('targetDates') or ([data['targetDate']] if data.get('targetDate') else [])
+    meal_type_id = data.get('mealTypeId')
+    target_meal_type_id = data.get('targetMealTypeId')
     
-    # Log each food item in the batch
-    for food in foods:
-        food_id = food.get('foodId')
-        meal_type = food.get('mealTypeId', 1)
-        unit_id = food.get('unitId')
-        amount = food.get('amount')
-        
-        if not all([food_id, unit_id, amount]):
-            failed_foods.append(f"Invalid food data: {food}")
-            continue
-        
-        url = f"https://api.fitbit.com/1/user/-/foods/log.json?foodId={food_id}&mealTypeId={meal_type}&unitId={unit_id}&amount={amount}&date={current_date}"
-        result = make_fitbit_api_request(url, method='POST', description=f"logging batch food: {food.get('name', f'Food {food_id}')}")
-        
-        if result is not None:
-            logged_foods.append(food.get('name', f'Food {food_id}'))
-        else:
-            failed_foods.append(f"{food.get('name', f'Food {food_id}')}: Request failed")
+    if not source_date or not target_dates:
+        return jsonify({'error': 'sourceDate and targetDates are required'}), 400
     
-    # Clear caches once after all foods are logged
-    if logged_foods:
-        clear_food_related_caches()
+    # Read the source day once, from cache when possible
+    payload = get_foods_cached(source_date)
+    if payload is None:
+        return jsonify({'error': 'Failed to fetch foods data'}), 500
     
-    # Return results
-    if failed_foods:
-        return jsonify({
-            'message': f"Logged {len(logged_foods)} foods successfully. Failed: {len(failed_foods)}",
-            'logged_foods': logged_foods,
-            'failed_foods': failed_foods,
-            'date': current_date
-        }), 207  # Multi-status
+    source_foods = payload['data']['foods']
+    if meal_type_id is not None:
+        source_foods = [food for food in source_foods if food.mealType == int(meal_type_id)]
+    
+    if not source_foods:
+        return jsonify({'error': f'No foods to copy from {source_date}'}), 404
+    
+    entries = []
+    for target_date in target_dates:
+        for food in source_foods:
+            entries.append({
+                'name': food.name,
+                'foodId': food.foodId,
+                'mealTypeId': target_meal_type_id if target_meal_type_id is not None else food.mealType,
+                'unitId': food.unitId,
+                'amount': food.amount,
+                'date': target_date
+            })
+    
+    entries, rejected, fixed = preflight_entries(entries)
+    if not entries:
+        return rejected_batch_response(rejected, fixed)
+    
+    logged, failed_foods, queued = log_food_entries(entries, description=f"copying food from {source_date}")
+    return logged_batch_response(f'copy {source_date}', logged, failed_foods, queued, rejected, fixed,
+                                 source_date=source_date, target_dates=target_dates)
+
+def import_running(import_id):
+    run = import_runs.get(import_id)
+    return run is not None and run.is_alive()
+
+def import_response(import_id, checkpoint):
+    """Progress of an import, with the failed rows"""
+    body = {'importId': import_id, **checkpoint.summary(), 'failed_rows': checkpoint.failed_rows()}
+    if checkpoint.status == PAUSED:
+        retry_in = checkpoint.state.get('retry_in')
+        if retry_in is not None:
+            body['reset_in'] = retry_in
+            body['message'] = f"Fitbit is unavailable, resend the file with importId={import_id} in {retry_in}s to resume"
+        else:
+            body['reset_in'] = fitbit_scheduler.reset_in()
+            body['message'] = f"Rate limit budget used, resend the file with importId={import_id} to resume"
+        return jsonify(body), 202
+    if checkpoint.status == DONE:
+        body['batch_id'] = checkpoint.state.get('batch_id')
+        body['message'] = f"Imported {body['logged']} foods. Failed: {body['failed']}"
+        return jsonify(body), 207 if body['failed'] else 201
+    if import_running(import_id):
+        body['message'] = f"Importing, progress at /api/import/{import_id}"
+        return jsonify(body), 202
+    # RUNNING in the checkpoint but no thread, the server stopped during the import
+    body['message'] = f"Import stopped at row {body['rows_done']}, resend the file with importId={import_id} to resume"
+    return jsonify(body), 200
+
+def run_import_task(app, import_id, checkpoint, rows_path, fmt, resolver):
+    """Body of an import thread, logs the spooled rows and records the batch when done"""
+    def clear_wave_dates(logged, failed):
+        clear_food_caches_for_dates(entry['date'] for entry in logged)
+    
+    try:
+        with app.app_context(), open(rows_path, encoding='utf-8-sig', newline='') as file:
+            print(f"[Import] {import_id} starting at row {checkpoint.rows_done}")
+            run_import(read_rows(file, fmt), checkpoint, resolver, on_wave=clear_wave_dates)
+            if checkpoint.status == DONE and checkpoint.state['logged']:
+                # The whole import can be undone like any other batch
+                checkpoint.state['batch_id'] = batch_registry.record(f'import {import_id}',
+                                                                     checkpoint.logged_entries())
+                checkpoint.save()
+            print(f"[Import] {import_id} {checkpoint.status} after row {checkpoint.rows_done}")
+    except Exception as e:
+        print(f"[Import] {import_id} stopped: {e}")
+    finally:
+        os.remove(rows_path)
+
+@api.route('/api/import', methods=['POST'])
+def import_foods():
+    """
+    Import food logs from a CSV or JSONL file, sent as the multipart field "file" or as the body
+    the file is spooled to disk and imported in the background, the answer is a 202 with the
+    importId whose progress GET /api/import/<importId> reports, rows are logged in waves sized
+    to the rate limit budget and when it runs out the import pauses, sending the same file
+    with ?importId= resumes it
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    file_name = upload.filename if upload else None
+    
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'jsonl' if request.mimetype == 'application/x-ndjson' else detect_format(file_name)
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    import_id = request.args.get('importId')
+    if import_id is not None:
+        if not re.fullmatch(r'[0-9a-f]{12}', import_id):
+            return jsonify({'error': 'Invalid importId'}), 400
+        if not os.path.exists(os.path.join(IMPORT_DIR, f'{import_id}.json')):
+            return jsonify({'error': f'Import {import_id} not found'}), 404
     else:
-        return jsonify({
-            'message': f"Successfully logged {len(logged_foods)} foods",
-            'logged_foods': logged_foods,
-            'date': current_date
-        }), 201
+        import_id = uuid.uuid4().hex[:12]
+    
+    try:
+        default_meal_type = int(request.args.get('mealTypeId', DEFAULT_MEAL_TYPE))
+    except ValueError:
+        return jsonify({'error': 'mealTypeId must be a number'}), 400
+    
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    checkpoint_path = os.path.join(IMPORT_DIR, f'{import_id}.json')
+    with import_runs_lock:
+        if import_running(import_id):
+            return import_response(import_id, ImportCheckpoint(checkpoint_path))
+        checkpoint = ImportCheckpoint(checkpoint_path, source=file_name)
+        if checkpoint.status == DONE:
+            return import_response(import_id, checkpoint)
+        
+        # The upload is gone once the request ends, the thread reads the rows from disk
+        rows_path = os.path.join(IMPORT_DIR, f'{import_id}.rows')
+        with open(rows_path, 'wb') as file:
+            shutil.copyfileobj(stream, file)
+        
+        checkpoint.state['status'] = RUNNING
+        checkpoint.save()
+        resolver = EntryResolver(get_cached_units(), food_index, default_meal_type=default_meal_type)
+        import_runs[import_id] = threading.Thread(
+            target=run_import_task, name=f'import-{import_id}', daemon=True,
+            args=(current_app._get_current_object(), import_id, checkpoint, rows_path, fmt, resolver))
+        import_runs[import_id].start()
+    
+    return import_response(import_id, checkpoint)
 
-@app.route('/api/log_individual_food', methods=['POST'])
+@api.route('/api/import/<import_id>', methods=['GET'])
+def get_import(import_id):
+    """Progress of an import"""
+    path = os.path.join(IMPORT_DIR, f'{import_id}.json')
+    if not re.fullmatch(r'[0-9a-f]{12}', import_id) or not os.path.exists(path):
+        return jsonify({'error': f'Import {import_id} not found'}), 404
+    return import_response(import_id, ImportCheckpoint(path))
+
+def cached_day_foods(target_date):
+    """Foods of a day from the day log cache, None if the day is not cached"""
+    payload = cache.get(get_foods_cached.make_cache_key(get_foods_cached.uncached, target_date))
+    return payload['data']['foods'] if payload is not None else None
+
+def stored_day_foods(target_date):
+    """Foods of a day from the mirror or the day log cache, None if neither has it"""
+    # Today and yesterday only while fresh, like /api/foods
+    max_age = current_app.config['MIRROR_HOT_TTL'] if target_date in hot_dates() else None
+    foods = food_mirror.day_foods(target_date, max_age=max_age)
+    if foods is not None:
+        return foods
+    return cached_day_foods(target_date)
+
+def export_day_foods(target_date):
+    """Foods of a day for an export, from the mirror or the day cache when possible"""
+    foods = stored_day_foods(target_date)
+    if foods is not None:
+        return foods
+    foods_data = fetch_food_log(target_date, refresh=True, priority=PREFETCH)
+    if not foods_data:
+        return None
+    foods = format_logged_foods(foods_data)
+    food_mirror.store_day(target_date, foods)
+    return foods
+
+@api.route('/api/export', methods=['GET'])
+def export_foods():
+    """
+    Stream the food logs of a date range as CSV, JSONL or Parquet
+    ?start=&end= (default the last ?days=30 days), ?format=csv|jsonl|parquet
+    days that are neither mirrored nor in the day cache cost one upstream call each,
+    when the rate limit budget cannot cover the range it is cut short and
+    X-Export-Next-Start gives the start to request next, a day failing while the
+    export streams ends it with a NEXT_START_MARKER row for that day instead
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    if fmt == 'parquet' and load_pyarrow() is None:
+        return jsonify({'error': 'Parquet export needs the pyarrow package'}), 501
+    
+    end = request.args.get('end') or datetime.now().strftime('%Y-%m-%d')
+    start = request.args.get('start')
+    try:
+        if not start:
+            days = int(request.args.get('days', 30))
+            start = (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        dates = export_dates(start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Cut the range where the uncached days would exceed the prefetch budget
+    headers = {'Content-Disposition': f'attachment; filename=foods_{start}_{end}.{fmt}'}
+    headroom = fitbit_scheduler.headroom(PREFETCH)
+    if headroom is not None:
+        for i, target_date in enumerate(dates):
+            if stored_day_foods(target_date) is None:
+                if headroom == 0:
+                    headers['X-Export-Next-Start'] = target_date
+                    dates = dates[:i]
+                    break
+                headroom -= 1
+    headers['X-Export-End'] = dates[-1] if dates else start
+    
+    print(f"[Backend] Exporting {len(dates)} days from {start} as {fmt}")
+    state = {}
+    # The headers are sent before the days are fetched, a day failing later is marked in the body
+    rows = export_rows(iter_day_foods(dates, export_day_foods, submit_task), state, marker=True)
+    return Response(stream_with_context(export_chunks(rows, fmt)), mimetype=EXPORT_FORMATS[fmt],
+                    headers=headers)
+
+@api.route('/api/log_individual_food', methods=['POST'])
 def log_individual_food():
-    global access_token, refresh_token
-    
     # Get request data
     data = request.json
     food_id = data.get('foodId')
@@ -835,58 +1760,150 @@ def log_individual_food():
         else:
             current_date = datetime.now().strftime('%Y-%m-%d')
     
+    # Check the entry against the cached catalogs before it is sent
+    entries, rejected, fixed = preflight_entries([{
+        'name': data.get('name', f'Food {food_id}'),
+        'foodId': food_id,
+        'mealTypeId': meal_type,
+        'unitId': unit_id,
+        'amount': amount,
+        'date': current_date
+    }])
+    if not entries:
+        return jsonify({'error': '; '.join(rejected[0]['errors']), 'rejected': rejected}), 400
+    current_date = entries[0]['date']
+    
     # Log the individual food
-    url = f"https://api.fitbit.com/1/user/-/foods/log.json?foodId={food_id}&mealTypeId={meal_type}&unitId={unit_id}&amount={amount}&date={current_date}"
-    result = make_fitbit_api_request(url, method='POST', description="logging individual food")
+    url = food_log_create_url(entries[0])
+    try:
+        result = submit_fitbit_api_request(url, method='POST', description="logging individual food").result()
+    except UpstreamUnavailable:
+        write_id = write_queue.add('POST', url, "logging individual food", date=current_date)
+        return jsonify({'message': 'Fitbit is unavailable, the food is logged once it recovers',
+                        'writeId': write_id}), 202
+    except DeadlineExceeded:
+        result = None
     
     if result is not None:
-        clear_food_related_caches()  # Clear caches since food data changed
-        return jsonify({
+        clear_food_caches_for_dates([current_date])  # Clear caches since food data changed
+        publish_entry_added(current_date, result)
+        personal_foods_logged(entries)
+        body = {
             'message': 'Food logged successfully',
             'data': result
-        }), 201
+        }
+        if fixed:
+            body['fixed'] = fixed
+        return jsonify(body), 201
     else:
         return jsonify({'error': 'Failed to log food'}), 500
 
-@app.route('/api/weight', methods=['GET'])
-@cache.cached(timeout=300, key_prefix='weight')  # Cache for 5 minutes
+@api.route('/api/weight', methods=['GET'])
 def get_weight():
-    global access_token, refresh_token
-    
     # Get number of days from query parameter, default to 7
     days = int(request.args.get('days', 7))
     
-    # Get weight data for the specified number of days
-    weight_data = []
-    
+    weight = weight_range(days)
+    if weight['data'].get('stale'):
+        g.stale = True
+    return payload_response(weight)
+
+def weight_range(days):
+    """
+    fetch_weight(), dropped from the cache again when some days could not be fetched
+    if none could, the last complete range is returned marked stale
+    """
+    weight = fetch_weight(days)
+    if not weight['data']['missing']:
+        last_good.set(('weight', days), weight, size=payload_size(weight))
+        return weight
+    
+    # Usually days cut off by the request deadline, they are fetched on the next request
+    cache.delete_memoized(fetch_weight, days)
+    if weight['data']['missing'] == days:
+        stale = last_good.get(('weight', days))
+        if stale is not None:
+            return encode_payload(dict(stale['data'], stale=True))
+    return weight
+
+@cache.memoize(timeout=300)  # Cache for 5 minutes based on function arguments (days parameter)
+def fetch_weight(days):
+    """Weight per day for the last `days` days as an encoded payload, most recent date last"""
+    # Queue one request per day, the most recent week is what the chart shows first
+    # so anything older goes out as prefetch and yields to interactive requests
+    pending = []
     for i in range(days):
         # Calculate date for each day (0 = today, 1 = yesterday, etc.)
         target_date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-        
-        # Get weight for this date
         weight_url = f"https://api.fitbit.com/1/user/-/body/log/weight/date/{target_date}/1d.json"
-        weight_response = make_fitbit_api_request(weight_url, method='GET', description=f"weight for {target_date}")
-        
-        weight_value = None
-        if weight_response and isinstance(weight_response, dict):
-            weight_list = weight_response.get('weight', [])
-            if weight_list:
-                weight_value = weight_list[0].get('value', None)
+        priority = INTERACTIVE_READ if i < 7 else PREFETCH
+        future = submit_fitbit_api_request(weight_url, method='GET', description=f"weight for {target_date}", priority=priority)
+        pending.append((target_date, future))
+    
+    # Get weight data for the specified number of days
+    weight_data = []
+    missing = 0
+    
+    for target_date, future in pending:
+        try:
+            weight_response = future.result()
+        except DeadlineExceeded:
+            weight_response = None
+        if weight_response is None:
+            missing += 1
         
-        weight_data.append({
-            'date': target_date,
-            'weight': weight_value
-        })
+        weight_data.append(WeightPoint.from_fitbit(target_date, weight_response))
     
     # Reverse the list so most recent date is last
     weight_data.reverse()
     
-    return jsonify({
+    return encode_payload({
         'days': days,
-        'data': weight_data
-    }), 200
+        'data': weight_data,
+        'missing': missing
+    })
+
+@api.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Food log for a date plus the calories and weight charts in one response
+    the three sections are resolved in parallel, each with its own status so a
+    failing section does not fail the whole page
+    """
+    target_date = request.args.get('date') or datetime.now().strftime('%Y-%m-%d')
+    days = int(request.args.get('days', 7))
+    
+    sections = {
+        'foods': submit_task(read_day_foods, target_date),
+        'calories': submit_task(calories_range, days),
+        'weight': submit_task(weight_range, days),
+    }
+    
+    body = {'date': target_date, 'days': days}
+    failed = 0
+    for name, future in sections.items():
+        try:
+            payload = future.result()
+        except Exception as e:
+            print(f"[Backend] Dashboard section {name} failed: {e}")
+            payload = None
+        data = payload['data'] if payload is not None else None
+        
+        if data is None:
+            failed += 1
+            body[name] = {'status': 'error', 'error': f'Failed to fetch {name} data'}
+        elif data.get('stale'):
+            # Last good copy while Fitbit is failing
+            g.stale = True
+            body[name] = {'status': 'stale', 'data': data}
+        else:
+            body[name] = {'status': 'ok', 'data': data}
+    
+    if failed == len(sections):
+        return jsonify(body), 500
+    return jsonify(body), 207 if failed else 200
 
-@app.route('/api/cache/clear', methods=['POST'])
+@api.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
     """Clear all caches - useful for debugging or when data is stale"""
     try:
@@ -895,18 +1912,315 @@ def clear_cache():
     except Exception as e:
         return jsonify({'error': f'Failed to clear caches: {str(e)}'}), 500
 
-@app.route('/api/cache/status', methods=['GET'])
+@api.route('/api/cache/status', methods=['GET'])
 def cache_status():
     """Get cache status information"""
     try:
         # This is a simple status check - in a real implementation you might want more details
         return jsonify({
             'message': 'Cache is active',
-            'cache_type': app.config.get('CACHE_TYPE', 'Unknown'),
-            'default_timeout': app.config.get('CACHE_DEFAULT_TIMEOUT', 'Unknown')
+            'cache_type': current_app.config.get('CACHE_TYPE', 'Unknown'),
+            'default_timeout': current_app.config.get('CACHE_DEFAULT_TIMEOUT', 'Unknown'),
+            'caches': [units_cache.stats(), units_search_cache.stats(), food_search_cache.stats(), etag_index.stats()],
+            'personal_foods': personal_foods.stats()
         }), 200
     except Exception as e:
         return jsonify({'error': f'Failed to get cache status: {str(e)}'}), 500
 
+@api.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Recently profiled requests, most recent first"""
+    if not current_app.config['PROFILING']:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    return jsonify({'profiles': profile_store.summaries()}), 200
+
+@api.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """A profile with its upstream timeline, top functions and allocations"""
+    profile = profile_store.get(profile_id) if current_app.config['PROFILING'] else None
+    if profile is None:
+        return jsonify({'error': f'Unknown profile: {profile_id}'}), 404
+    return jsonify({key: value for key, value in profile.items() if key != 'pstats'}), 200
+
+@api.route('/api/admin/profiles/<profile_id>/pstats', methods=['GET'])
+def download_profile(profile_id):
+    """Raw cProfile data of a profile, for pstats or snakeviz"""
+    profile = profile_store.get(profile_id) if current_app.config['PROFILING'] else None
+    if profile is None or profile['pstats'] is None:
+        return jsonify({'error': f'Unknown profile: {profile_id}'}), 404
+    return Response(profile['pstats'], mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename=profile-{profile_id}.pstats'})
+
+@api.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events with the food log changes (entry.added, entry.removed,
+    entry.updated, date.invalidated, resync), a rate_limit event when the Fitbit
+    budget moved and a heartbeat comment otherwise every EVENT_HEARTBEAT seconds
+    """
+    client = event_bus.subscribe(request.headers.get('Last-Event-ID') or request.args.get('lastEventId'))
+    if client is None:
+        return jsonify({'error': 'Too many event streams open'}), 503
+    heartbeat = current_app.config['EVENT_HEARTBEAT']
+    
+    def stream():
+        budget = None
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            event = None
+            while True:
+                if event is None:
+                    # Just connected or quiet for a heartbeat
+                    status = fitbit_scheduler.stats()['budget']
+                    if (status['limit'], status['remaining']) != budget:
+                        budget = (status['limit'], status['remaining'])
+                        yield format_event({'id': None, 'type': 'rate_limit', 'data': status})
+                    else:
+                        yield ": heartbeat\n\n"
+                else:
+                    yield format_event(event)
+                event = client.get(heartbeat)
+        finally:
+            event_bus.unsubscribe(client)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/api/events/status', methods=['GET'])
+def events_status():
+    return jsonify(event_bus.stats()), 200
+
+@api.route('/api/foods/changes', methods=['GET'])
+def food_changes():
+    """
+    Entries added, removed or updated after ?since=<version> (optionally on one ?date=),
+    or resync when the changelog no longer reaches back that far. Without since only
+    the current version is returned, ?dates=a,b adds the version of each of those days
+    """
+    try:
+        since = int(request.args['since']) if request.args.get('since') else None
+        limit = min(int(request.args.get('limit', CHANGES_PAGE)), CHANGES_PAGE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be numbers'}), 400
+    if limit < 1 or (since is not None and since < 0):
+        return jsonify({'error': 'since must not be negative and limit must be positive'}), 400
+    
+    if since is None:
+        body = {'version': food_mirror.version()}
+    else:
+        version, changes, more = food_mirror.changes(since, request.args.get('date'), limit)
+        body = {'version': version, 'resync': True} if changes is None else \
+            {'version': version, 'changes': changes, 'more': more}
+    dates = [target_date for target_date in request.args.get('dates', '').split(',') if target_date]
+    if dates:
+        body['days'] = food_mirror.day_versions(dates)
+    return jsonify(body), 200
+
+@api.route('/api/write_queue', methods=['GET'])
+def write_queue_status():
+    """Writes waiting for Fitbit to recover, and the ones that failed on replay"""
+    status = write_queue.status()
+    status['writes'] = write_queue.pending()
+    return jsonify(status), 200
+
+@api.route('/api/write_queue/replay', methods=['POST'])
+def replay_write_queue():
+    """Replay the queued writes now instead of waiting for the next pass"""
+    written = write_queue.replay_once()
+    return jsonify({'replayed': len(written), **write_queue.status()}), 200
+
+@api.route('/api/scheduler/status', methods=['GET'])
+def scheduler_status():
+    """
+    Upstream queue depth, queueing delay per priority class and the rate limit budget,
+    plus upstream timeouts, latency per endpoint and how often hedged reads won
+    """
+    status = fitbit_scheduler.stats()
+    status['upstream'] = upstream_stats()
+    return jsonify(status), 200
+
+# Startup prewarm: each step fills a cache the first page load would otherwise
+# wait for. PREWARM_STEPS picks the steps (comma separated), PREWARM=0 skips them
+PREWARM_STEPS = {
+    'units': lambda: get_cached_units(),
+    'today': lambda: get_foods_cached(datetime.now().strftime('%Y-%m-%d')),
+    'yesterday': lambda: get_foods_cached((datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')),
+    'calories': lambda: fetch_calories(int(current_app.config['PREWARM_DAYS'])),
+    'weight': lambda: fetch_weight(int(current_app.config['PREWARM_DAYS'])),
+    'templates': lambda: warm_template_details(),
+    'personal': lambda: load_personal_foods(priority=PREFETCH),
+}
+
+prewarm_status = {'state': 'pending', 'steps': [], 'total_ms': None}
+
+def prewarm(app):
+    """Finish interrupted edits, then fill the caches a first page load needs, timing each step"""
+    prewarm_status['state'] = 'running'
+    started = time.perf_counter()
+    with app.app_context():
+        recover_edit_journal()
+        for name in (app.config['PREWARM_STEPS'] if app.config['PREWARM'] else []):
+            step = PREWARM_STEPS.get(name)
+            if step is None:
+                print(f"[Backend] Unknown prewarm step: {name}")
+                continue
+            step_started = time.perf_counter()
+            try:
+                ok = step() is not None
+            except Exception as e:
+                print(f"[Backend] Prewarm step {name} failed: {e}")
+                ok = False
+            elapsed = round((time.perf_counter() - step_started) * 1000, 1)
+            prewarm_status['steps'].append({'step': name, 'ok': ok, 'ms': elapsed})
+            print(f"[Backend] Prewarm {name}: {'ok' if ok else 'failed'} in {elapsed} ms")
+    prewarm_status['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    prewarm_status['state'] = 'ready'
+
+def mirror_fetch_day(target_date):
+    """Foods of a day for the mirror sync engine"""
+    foods_data = fetch_food_log(target_date, refresh=True, priority=BACKGROUND, user='mirror')
+    return format_logged_foods(foods_data) if foods_data else None
+
+# Sync engine of the food mirror, built in create_app()
+mirror_sync = None
+
+@api.route('/api/mirror/status', methods=['GET'])
+def mirror_status():
+    """Size of the food mirror, days waiting to be synced, sync lag and last sync times"""
+    status = food_mirror.status()
+    status['sync_running'] = bool(mirror_sync and mirror_sync.running)
+    status['hot_day_ttl'] = current_app.config['MIRROR_HOT_TTL']
+    status['webhooks'] = webhook_stats.as_dict()
+    return jsonify(status), 200
+
+@api.route('/api/mirror/sync', methods=['POST'])
+def mirror_sync_now():
+    """Run a sync pass now, ?days=N reconciles the last N days instead"""
+    days = request.args.get('days')
+    if days is not None:
+        try:
+            days = int(days)
+        except ValueError:
+            return jsonify({'error': 'days must be a number'}), 400
+        submit_task(mirror_sync.reconcile, days)
+        return jsonify({'message': f'Reconciling the last {days} days'}), 202
+    submit_task(mirror_sync.run_once)
+    return jsonify({'message': 'Sync started'}), 202
+
+# Fitbit subscription notifications received
+webhook_stats = WebhookStats()
+
+@api.route('/api/fitbit/webhook', methods=['GET'])
+def verify_webhook():
+    """Subscriber verification, Fitbit expects 204 for the configured code and 404 otherwise"""
+    code = os.getenv('FITBIT_SUBSCRIBER_VERIFY')
+    if code and request.args.get('verify') == code:
+        return '', 204
+    return '', 404
+
+@api.route('/api/fitbit/webhook', methods=['POST'])
+def receive_webhook():
+    """
+    Fitbit subscription notifications: clear the caches of the notified dates only
+    and mark them dirty in the mirror so the sync engine fetches them again
+    """
+    body = request.get_data()
+    if not verify_signature(body, request.headers.get('X-Fitbit-Signature'), fitbit_client.client_secret):
+        print("[Backend] Webhook rejected: invalid signature")
+        webhook_stats.record(None)
+        return '', 404
+    try:
+        changed = parse_notifications(body)
+    except ValueError as e:
+        print(f"[Backend] Webhook rejected: {e}")
+        webhook_stats.record(None)
+        return '', 400
+    
+    webhook_stats.record(changed)
+    print(f"[Backend] Webhook: foods {sorted(changed[FOODS])}, body {sorted(changed[BODY])}")
+    if changed[FOODS]:
+        clear_food_caches_for_dates(changed[FOODS])
+        publish_invalidated(changed[FOODS])
+        mirror_sync.wake()
+    if changed[BODY]:
+        clear_weight_caches()
+    return '', 204
+
+@api.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness check, 503 until the startup prewarm has finished"""
+    status = 200 if prewarm_status['state'] == 'ready' else 503
+    return jsonify(prewarm_status), status
+
+def create_app(config=None, start_background=True):
+    """
+    Build the Flask app
+    start_background runs edit journal recovery and the cache prewarm in a
+    background thread, /api/ready reports when they are done
+    """
+    global mirror_sync
+    load_credentials()
+    set_user_key_func(current_user_key)
+    
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app)
+    
+    app.config.from_mapping(cache_config)
+    for key in ('CACHE_DIR', 'CACHE_REDIS_URL'):
+        if os.getenv(key):
+            app.config[key] = os.getenv(key)
+    app.config['PREWARM'] = os.getenv('PREWARM', '1') != '0'
+    app.config['PREWARM_STEPS'] = [step.strip() for step in os.getenv('PREWARM_STEPS', ','.join(PREWARM_STEPS)).split(',') if step.strip()]
+    app.config['PREWARM_DAYS'] = int(os.getenv('PREWARM_DAYS', 7))
+    # With a Fitbit subscription changes are pushed, so today and yesterday can be kept much longer
+    app.config['MIRROR_HOT_TTL'] = int(os.getenv('MIRROR_HOT_TTL', WEBHOOK_HOT_DAY_TTL if os.getenv('FITBIT_SUBSCRIBER_VERIFY') else HOT_DAY_TTL))
+    app.config['REQUEST_DEADLINE'] = float(os.getenv('REQUEST_DEADLINE', 25))
+    app.config['PROFILING'] = os.getenv('PROFILING', '0') == '1'
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['EVENT_HEARTBEAT'] = float(os.getenv('EVENT_HEARTBEAT', 15))
+    app.config.from_mapping(config or {})
+    cache.init_app(app)
+    app.register_blueprint(api)
+    
+    def mirror_changed(dates):
+        personal_foods.forget_history()
+        with app.app_context():
+            clear_day_caches(dates)
+            forget_etags(('search_foods', 'quick_picks'))
+        publish_invalidated(dates)
+    
+    def writes_replayed(writes):
+        with app.app_context():
+            clear_food_caches_for_dates([write['date'] for write in writes])
+            for write in writes:
+                if write.get('journalId'):
+                    queued_edit_written(write)
+        publish_invalidated([write['date'] for write in writes])
+    
+    def write_failed(write):
+        if write.get('journalId'):
+            with app.app_context():
+                queued_edit_failed(write)
+    
+    write_queue.on_written = writes_replayed
+    write_queue.on_failed = write_failed
+    
+    mirror_sync = MirrorSync(food_mirror, mirror_fetch_day, on_change=mirror_changed,
+                             interval=int(os.getenv('MIRROR_SYNC_INTERVAL', 60)),
+                             hot_ttl=app.config['MIRROR_HOT_TTL'])
+    
+    if start_background:
+        threading.Thread(target=prewarm, args=(app,), name='prewarm', daemon=True).start()
+        if os.getenv('MIRROR_SYNC', '1') != '0':
+            mirror_sync.start()
+        write_queue.start()
+    else:
+        prewarm_status['state'] = 'ready'
+    
+    return app
+
 if __name__ == '__main__':
+    # The debug reloader runs this file twice, only start background work in the serving process
+    app = create_app(start_background=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     app.run(debug=True)
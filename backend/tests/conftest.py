@@ -0,0 +1,139 @@
+import itertools
+import os
+import sys
+import tempfile
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+# The server keeps its state in module globals created on import, so every file
+# it writes is pointed at a scratch directory before the first test imports it
+STATE_DIR = tempfile.mkdtemp(prefix='fitbit-logger-tests-')
+os.environ.update({
+    'CLIENTID': 'test-client',
+    'CLIENTSECRET': 'test-secret',
+    'ACCESSTOKEN': 'test-access-token',
+    'REFRESHTOKEN': 'test-refresh-token',
+    'FITBIT_TOKEN_DIR': STATE_DIR,
+    'FITBIT_CACHE_DIR': os.path.join(STATE_DIR, 'cache'),
+    'FOOD_MIRROR_PATH': os.path.join(STATE_DIR, 'food_mirror.sqlite3'),
+    'FOOD_INDEX_PATH': os.path.join(STATE_DIR, 'food_index.json'),
+    'EDIT_JOURNAL_PATH': os.path.join(STATE_DIR, 'edit_journal.json'),
+    'BATCH_REGISTRY_PATH': os.path.join(STATE_DIR, 'batches.json'),
+    'WRITE_QUEUE_PATH': os.path.join(STATE_DIR, 'write_queue.json'),
+    'IMPORT_DIR': os.path.join(STATE_DIR, 'imports'),
+    'CACHE_TYPE': 'SimpleCache',
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {}
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeFitbit:
+    """
+    In-memory stand-in for the food log endpoints, fail() makes the next matching
+    calls answer with a status code, or lose the answer of a call Fitbit applied
+    """
+
+    def __init__(self):
+        self.logs = {}
+        self.calls = []
+        self.failures = []
+        self._ids = itertools.count(1000)
+
+    def add(self, target_date, food_id, unit_id=91, amount=1.0, meal_type=1):
+        """Log an entry directly, returns its logId"""
+        log_id = next(self._ids)
+        self.logs.setdefault(target_date, []).append({
+            'logId': log_id,
+            'logDate': target_date,
+            'loggedFood': {'foodId': food_id, 'name': f'Food {food_id}', 'mealTypeId': meal_type,
+                           'amount': amount, 'unit': {'id': unit_id, 'name': 'cup', 'plural': 'cups'},
+                           'calories': 100, 'logDate': target_date},
+        })
+        return log_id
+
+    def entries(self, target_date):
+        return [(food['loggedFood']['foodId'], food['loggedFood']['amount']) for food in self.logs.get(target_date, [])]
+
+    def fail(self, method, path, outcome, times=1):
+        """outcome is a status code, or 'lost' to apply the call and time out reading the answer"""
+        self.failures.extend([(method, path, outcome)] * times)
+
+    def request(self, method, url, headers=None, data=None, timeout=None):
+        parts = urlsplit(url)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        self.calls.append((method, path))
+        outcome = None
+        for failure in self.failures:
+            if failure[0] == method and failure[1] in path:
+                self.failures.remove(failure)
+                outcome = failure[2]
+                break
+        if isinstance(outcome, int):
+            return FakeResponse(outcome, {'errors': [{'message': 'failed'}]})
+        response = self._answer(method, path, query)
+        if outcome == 'lost':
+            raise requests.ReadTimeout('read timed out')
+        return response
+
+    def _answer(self, method, path, query):
+        if method == 'GET' and '/foods/log/date/' in path:
+            target_date = path.rsplit('/', 1)[1][:-len('.json')]
+            return FakeResponse(200, {'foods': list(self.logs.get(target_date, [])), 'summary': {}})
+        if method == 'POST' and path.endswith('/foods/log.json'):
+            self.add(query['date'], int(query['foodId']), int(query['unitId']),
+                     float(query['amount']), int(query['mealTypeId']))
+            return FakeResponse(201, {'foodLog': self.logs[query['date']][-1]})
+        if method == 'DELETE' and '/foods/log/' in path:
+            log_id = int(path.rsplit('/', 1)[1][:-len('.json')])
+            for foods in self.logs.values():
+                for food in foods:
+                    if food['logId'] == log_id:
+                        foods.remove(food)
+                        return FakeResponse(204)
+            return FakeResponse(404, {'errors': [{'message': 'not found'}]})
+        return FakeResponse(404, {'errors': [{'message': f'{method} {path} is not faked'}]})
+
+
+@pytest.fixture
+def fitbit(monkeypatch, tmp_path):
+    """Fitbit faked in memory, with fresh circuits, an empty mirror, write queue and edit journal"""
+    import fitbit_client
+    import server
+    from circuit_breaker import CircuitBreakers
+    from food_mirror import FoodMirror
+
+    fake = FakeFitbit()
+    monkeypatch.setattr(fitbit_client, '_request', fake.request)
+    monkeypatch.setattr(fitbit_client, 'circuit_breakers', CircuitBreakers())
+    fitbit_client.failed_reads.clear()
+    fitbit_client.disk_cache().clear()
+    for path in (server.write_queue.path, server.edit_journal.path):
+        if os.path.exists(path):
+            os.remove(path)
+    monkeypatch.setattr(server.write_queue, '_state', None)
+    monkeypatch.setattr(server.edit_journal, '_entries', None)
+    monkeypatch.setattr(server, 'food_mirror', FoodMirror(str(tmp_path / 'food_mirror.sqlite3')))
+    return fake
+
+
+@pytest.fixture
+def app(fitbit):
+    import server
+    app = server.create_app({'TESTING': True}, start_background=False)
+    with app.app_context():
+        server.cache.clear()
+        yield app
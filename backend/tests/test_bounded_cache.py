@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+from bounded_cache import BoundedCache, estimate_size
+from models import FoodLogEntry
+from serialization import encode_payload, payload_size
+from units_catalog import UnitsCatalog
+
+UNITS = [{'id': unit_id, 'name': f'unit {unit_id}', 'plural': f'units {unit_id}'} for unit_id in range(500)]
+
+
+def test_catalog_size_covers_its_units():
+    catalog = UnitsCatalog(UNITS)
+    # getsizeof only sees the slots of the catalog itself
+    assert estimate_size(catalog) > 100 * sys.getsizeof(catalog)
+    assert estimate_size(catalog) > sum(len(unit['name']) + len(unit['plural']) for unit in UNITS)
+
+
+def test_records_and_containers_are_sized_without_encoding():
+    entry = FoodLogEntry(1, 101, 'Oatmeal', 1, 1.0, 'cup', 91, 150, '')
+    assert estimate_size(entry) > sys.getsizeof(entry)
+    assert estimate_size([entry, entry]) == 2 * estimate_size(entry)
+    assert estimate_size({'etag': 'abc', 'date': None}) == len('etag') + 3 + len('date') + 8
+
+
+def test_unknown_values_are_refused():
+    with pytest.raises(TypeError):
+        estimate_size(object())
+    with pytest.raises(TypeError):
+        BoundedCache('test').set('key', object())
+
+
+def test_byte_budget_uses_the_given_size():
+    cache = BoundedCache('test', max_entries=100, max_bytes=1000)
+    payload = encode_payload({'foods': ['x' * 100]})
+    cache.set('a', payload, size=400)
+    cache.set('b', payload, size=400)
+    cache.set('c', payload, size=400)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 800
+    # Too big to fit at all, nothing else is evicted for it
+    cache.set('d', payload, size=2000)
+    assert cache.get('d') is None and cache.get('b') is payload
+    assert payload_size(payload) == 2 * len(payload['json'])
+
+
+def test_catalog_counts_against_the_byte_budget():
+    catalog = UnitsCatalog(UNITS)
+    cache = BoundedCache('test', max_entries=10, max_bytes=estimate_size(catalog) - 1)
+    cache.set('units', catalog)
+    assert cache.get('units') is None
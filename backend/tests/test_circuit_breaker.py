@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreakers, UpstreamUnavailable, OPEN, HALF_OPEN
+from scheduler import DeadlineExceeded
+
+KEY = '/user/-/foods/log.json'
+
+
+def open_circuit(breakers):
+    for _ in range(breakers.failure_threshold):
+        breakers.before_call(KEY)
+        breakers.record_failure(KEY)
+
+
+def test_opens_after_threshold_failures():
+    breakers = CircuitBreakers(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breakers.before_call(KEY)
+        breakers.record_failure(KEY)
+    breakers.before_call(KEY)
+    breakers.record_failure(KEY)
+    assert breakers.stats()[KEY]['state'] == OPEN
+
+    with pytest.raises(UpstreamUnavailable) as raised:
+        breakers.before_call(KEY)
+    assert 0 < raised.value.retry_in <= 30
+    # Never sent, so it is handled like a job that missed its deadline
+    assert isinstance(raised.value, DeadlineExceeded)
+    assert breakers.stats()[KEY]['rejected'] == 1
+
+
+def test_success_resets_the_failure_count():
+    breakers = CircuitBreakers(failure_threshold=2, reset_timeout=30)
+    breakers.record_failure(KEY)
+    breakers.record_success(KEY)
+    breakers.record_failure(KEY)
+    breakers.before_call(KEY)
+    assert not breakers.is_open(KEY)
+
+
+def test_half_open_lets_a_single_probe_through():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.05)
+    open_circuit(breakers)
+    time.sleep(0.06)
+
+    breakers.before_call(KEY)  # the probe
+    assert breakers.stats()[KEY]['state'] == HALF_OPEN
+    with pytest.raises(UpstreamUnavailable):
+        breakers.before_call(KEY)
+
+    breakers.record_success(KEY)
+    assert not breakers.is_open(KEY)
+    breakers.before_call(KEY)
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.05)
+    open_circuit(breakers)
+    time.sleep(0.06)
+    breakers.before_call(KEY)
+    breakers.record_failure(KEY)
+    assert breakers.stats()[KEY]['state'] == OPEN
+    with pytest.raises(UpstreamUnavailable):
+        breakers.before_call(KEY)
+
+
+def test_released_probe_can_be_retried():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=0.05)
+    open_circuit(breakers)
+    time.sleep(0.06)
+    breakers.before_call(KEY)
+    breakers.release(KEY)
+    breakers.before_call(KEY)
+    assert breakers.stats()[KEY]['state'] == HALF_OPEN
+
+
+def test_endpoints_have_their_own_circuit():
+    breakers = CircuitBreakers(failure_threshold=1, reset_timeout=30)
+    open_circuit(breakers)
+    breakers.before_call('/foods/units.json')
+    assert breakers.stats().get('/foods/units.json') is None
+    assert breakers.is_open(KEY)
@@ -0,0 +1,43 @@
+import server
+from models import FoodLogEntry
+
+DAY = '2024-04-10'
+OTHER_DAY = '2024-04-11'
+
+
+def mirror_day(fitbit, target_date):
+    log_id = fitbit.add(target_date, 101)
+    server.food_mirror.store_day(target_date, [FoodLogEntry(log_id, 101, 'Oatmeal', 1, 1.0, 'cup', 91, 150, '')])
+    return log_id
+
+
+def test_delete_without_date_finds_it_in_the_mirror(app, fitbit):
+    log_id = mirror_day(fitbit, DAY)
+    mirror_day(fitbit, OTHER_DAY)
+
+    response = app.test_client().delete(f'/api/foods/{log_id}')
+
+    assert response.status_code == 200
+    assert fitbit.entries(DAY) == []
+    # Only the entry's day is fetched again, not every mirrored day
+    assert server.food_mirror.dirty_dates() == [DAY]
+    assert server.food_mirror.day_foods(DAY, stale_ok=True) == []
+
+
+def test_delete_of_an_unmirrored_entry_leaves_the_mirror_alone(app, fitbit):
+    mirror_day(fitbit, OTHER_DAY)
+    log_id = fitbit.add(DAY, 102)
+
+    response = app.test_client().delete(f'/api/foods/{log_id}')
+
+    assert response.status_code == 200
+    assert server.food_mirror.dirty_dates() == []
+
+
+def test_bulk_delete_without_dates_finds_them_in_the_mirror(app, fitbit):
+    log_ids = [mirror_day(fitbit, DAY), mirror_day(fitbit, OTHER_DAY)]
+
+    response = app.test_client().post('/api/foods/bulk_delete', json={'logIds': log_ids})
+
+    assert response.status_code == 200
+    assert sorted(server.food_mirror.dirty_dates()) == [DAY, OTHER_DAY]
@@ -0,0 +1,168 @@
+import server
+from edit_journal import EditJournal, PENDING, DELETED, UPDATED, RESTORED, FAILED, QUEUED, FINAL_STATES
+from write_queue import MAX_ATTEMPTS
+
+DAY = '2024-04-10'
+
+
+def edit_of(log_id, food_id=5, amount=1.0, new_amount=2.0):
+    original = {'foodId': food_id, 'mealTypeId': 1, 'unitId': 91, 'amount': amount, 'date': DAY}
+    return original, dict(original, amount=new_amount)
+
+
+def test_unresolved_lists_edits_not_final(tmp_path):
+    journal = EditJournal(str(tmp_path / 'edit_journal.json'))
+    pending = journal.begin(1, *edit_of(1))
+    deleted = journal.begin(2, *edit_of(2))
+    journal.update(deleted, DELETED)
+    done = journal.begin(3, *edit_of(3))
+    journal.update(done, UPDATED, newLogId=4)
+    failed = journal.begin(5, *edit_of(5))
+    journal.update(failed, FAILED, error='boom')
+
+    assert {entry['id']: entry['state'] for entry in journal.unresolved()} == {pending: PENDING, deleted: DELETED}
+    assert UPDATED in FINAL_STATES and FAILED in FINAL_STATES and QUEUED not in FINAL_STATES
+
+    # A restart reads the journal back from disk
+    reopened = EditJournal(journal.path)
+    assert [entry['id'] for entry in reopened.unresolved()] == [pending, deleted]
+
+
+def test_recovery_creates_the_replacement_of_a_deleted_entry(app, fitbit):
+    original, new = edit_of(41)
+    journal_id = server.edit_journal.begin(41, original, new)
+    server.edit_journal.update(journal_id, DELETED)
+
+    server.recover_edit_journal()
+
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+    assert server.edit_journal.unresolved() == []
+
+
+def test_recovery_runs_an_edit_again_when_the_original_is_still_logged(app, fitbit):
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    server.edit_journal.begin(log_id, original, new)
+
+    server.recover_edit_journal()
+
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+    assert ('DELETE', f'/1/user/-/foods/log/{log_id}.json') in fitbit.calls
+    assert server.edit_journal.unresolved() == []
+
+
+def test_failed_replacement_restores_the_original(app, fitbit):
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    fitbit.fail('POST', '/foods/log.json', 400, times=server.CREATE_ATTEMPTS)
+
+    result = server.apply_food_edit(log_id, original, new)
+
+    assert result['status'] == 'restored'
+    assert fitbit.entries(DAY) == [(5, 1.0)]
+
+
+def test_lost_create_answer_is_not_logged_twice(app, fitbit):
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    fitbit.fail('POST', '/foods/log.json', 'lost')
+
+    result = server.apply_food_edit(log_id, original, new)
+
+    assert result['status'] == 'updated'
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+    assert [call for call in fitbit.calls if call[0] == 'POST'] == [('POST', '/1/user/-/foods/log.json')]
+
+
+def test_lost_restore_answer_is_not_logged_twice(app, fitbit):
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    fitbit.fail('POST', '/foods/log.json', 400, times=server.CREATE_ATTEMPTS)
+    fitbit.fail('POST', '/foods/log.json', 'lost')
+
+    result = server.apply_food_edit(log_id, original, new)
+
+    assert result['status'] == 'restored'
+    assert fitbit.entries(DAY) == [(5, 1.0)]
+
+
+def test_lost_delete_answer_goes_on_with_the_create(app, fitbit):
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    fitbit.fail('DELETE', '/foods/log/', 'lost')
+
+    assert server.apply_food_edit(log_id, original, new)['status'] == 'updated'
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+
+
+def test_recovery_finds_a_replacement_created_before_the_crash(app, fitbit):
+    original, new = edit_of(40)
+    fitbit.add(DAY, 5, amount=2.0)  # created, but the answer never arrived
+    journal_id = server.edit_journal.begin(40, original, new)
+    server.edit_journal.update(journal_id, DELETED)
+
+    server.recover_edit_journal()
+
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+    assert ('POST', '/1/user/-/foods/log.json') not in fitbit.calls
+    assert server.edit_journal.unresolved() == []
+
+
+def queue_edit(fitbit):
+    """An edit queued whole while Fitbit was unavailable, like apply_food_edit() queues it"""
+    log_id = fitbit.add(DAY, 5, amount=1.0)
+    original, new = edit_of(log_id)
+    journal_id = server.edit_journal.begin(log_id, original, new)
+    server.queue_food_edit(journal_id, log_id, [
+        ('DELETE', f"https://api.fitbit.com/1/user/-/foods/log/{log_id}.json", "deleting old food log for update", DAY),
+        ('POST', server.food_log_create_url(new), "creating new food log for update", DAY)])
+    return journal_id
+
+
+def replay(times=MAX_ATTEMPTS):
+    for _ in range(times):
+        server.write_queue.replay_once()
+
+
+def test_replayed_queued_edit_is_updated(app, fitbit):
+    journal_id = queue_edit(fitbit)
+
+    replay(1)
+
+    assert fitbit.entries(DAY) == [(5, 2.0)]
+    assert server.edit_journal.get(journal_id)['state'] == UPDATED
+    assert server.edit_journal.get(journal_id)['newLogId'] is not None
+
+
+def test_queued_edit_whose_post_fails_restores_the_original(app, fitbit):
+    journal_id = queue_edit(fitbit)
+    fitbit.fail('POST', '/foods/log.json', 400, times=MAX_ATTEMPTS)
+
+    replay()
+
+    # The replayed DELETE went through, the original is logged again
+    assert fitbit.entries(DAY) == [(5, 1.0)]
+    assert server.edit_journal.get(journal_id)['state'] == RESTORED
+    assert server.edit_journal.unresolved() == []
+
+
+def test_queued_edit_whose_delete_fails_sends_no_post(app, fitbit):
+    journal_id = queue_edit(fitbit)
+    fitbit.fail('DELETE', '/foods/log/', 400, times=MAX_ATTEMPTS)
+
+    replay()
+
+    assert fitbit.entries(DAY) == [(5, 1.0)]
+    assert ('POST', '/1/user/-/foods/log.json') not in fitbit.calls
+    assert server.edit_journal.get(journal_id)['state'] == FAILED
+    assert server.write_queue.pending() == []
+
+
+def test_recovery_leaves_queued_edits_to_the_write_queue(app, fitbit):
+    journal_id = queue_edit(fitbit)
+
+    server.recover_edit_journal()
+
+    assert fitbit.calls == []
+    assert server.edit_journal.get(journal_id)['state'] == QUEUED
+    assert len(server.write_queue.pending()) == 2
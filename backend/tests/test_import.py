@@ -0,0 +1,61 @@
+import io
+import os
+
+import server
+from food_import import ImportCheckpoint, DONE
+from serialization import dump_file, load_file
+
+DAY = '2024-04-10'
+
+ROWS = 'date,foodId,unitId,amount\n' + ''.join(f'{DAY},{food_id},91,1\n' for food_id in range(1, 6)) + f'{DAY},,91,1\n'
+
+
+def test_import_runs_in_the_background_and_reports_progress(app, fitbit):
+    client = app.test_client()
+    response = client.post('/api/import', data={'file': (io.BytesIO(ROWS.encode()), 'history.csv')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    import_id = response.get_json()['importId']
+    server.import_runs[import_id].join(10)
+
+    response = client.get(f'/api/import/{import_id}')
+    body = response.get_json()
+    assert response.status_code == 207
+    assert (body['status'], body['logged'], body['failed'], body['rows_done']) == (DONE, 5, 1, 6)
+    assert [row['row'] for row in body['failed_rows']] == [7]
+    assert [food_id for food_id, _ in fitbit.entries(DAY)] == [1, 2, 3, 4, 5]
+    assert len(server.batch_registry.get(body['batch_id'])['entries']) == 5
+    # The spooled upload is removed once the import is done
+    assert not os.path.exists(os.path.join(server.IMPORT_DIR, f'{import_id}.rows'))
+
+
+def test_checkpoint_keeps_counters_and_appends_rows(tmp_path):
+    checkpoint = ImportCheckpoint(str(tmp_path / 'import.json'), source='history.csv')
+    for wave in range(3):
+        checkpoint.record([{'logId': wave, 'name': 'food', 'date': DAY, 'mealTypeId': 1}],
+                          [{'row': wave, 'error': 'bad row'}])
+        checkpoint.save()
+
+    state = load_file(checkpoint.path)
+    assert (state['logged'], state['failed']) == (3, 3)
+    reopened = ImportCheckpoint(checkpoint.path)
+    assert [entry['logId'] for entry in reopened.logged_entries()] == [0, 1, 2]
+    assert [row['row'] for row in reopened.failed_rows()] == [0, 1, 2]
+
+    # Starting over drops the rows of the earlier run
+    os.remove(checkpoint.path)
+    assert ImportCheckpoint(checkpoint.path).logged_entries() == []
+
+
+def test_checkpoint_with_rows_inline_is_migrated(tmp_path):
+    path = str(tmp_path / 'import.json')
+    dump_file({'source': 'history.csv', 'status': 'paused', 'rows_done': 2, 'retry': [], 'updated_at': None,
+               'logged': [{'logId': 7, 'name': 'food', 'date': DAY, 'mealTypeId': 1}],
+               'failed': [{'row': 2, 'error': 'bad row'}]}, path)
+
+    checkpoint = ImportCheckpoint(path)
+
+    assert checkpoint.summary()['logged'] == 1 and checkpoint.summary()['failed'] == 1
+    assert checkpoint.logged_entries()[0]['logId'] == 7
+    assert load_file(path)['logged'] == 1
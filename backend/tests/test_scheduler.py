@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import (UpstreamScheduler, DeadlineExceeded, INTERACTIVE_READ, INTERACTIVE_WRITE,
+                       PREFETCH, BACKGROUND)
+
+
+def blocked_scheduler(**kwargs):
+    """A one worker scheduler whose worker is busy until the returned event is set"""
+    scheduler = UpstreamScheduler(workers=1, **kwargs)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    scheduler.submit(block, priority=INTERACTIVE_READ)
+    assert started.wait(5)
+    return scheduler, release
+
+
+def test_higher_classes_are_served_first():
+    scheduler, release = blocked_scheduler()
+    order = []
+    futures = [scheduler.submit(order.append, name, priority=priority)
+               for name, priority in (('background', BACKGROUND), ('prefetch', PREFETCH),
+                                      ('write', INTERACTIVE_WRITE), ('read', INTERACTIVE_READ))]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ['read', 'write', 'prefetch', 'background']
+
+
+def test_users_share_a_class_fairly():
+    scheduler, release = blocked_scheduler()
+    order = []
+    futures = [scheduler.submit(order.append, user, priority=PREFETCH, user=user)
+               for user in ('batch', 'batch', 'batch', 'alice')]
+    release.set()
+    for future in futures:
+        future.result(5)
+    # alice's first job is not stuck behind the whole batch
+    assert order.index('alice') == 1
+
+
+def test_reserve_holds_background_work_back():
+    scheduler = UpstreamScheduler(workers=2)
+    scheduler.update_budget(limit=100, remaining=30, reset=3600)
+    assert scheduler.headroom(INTERACTIVE_READ) == 30
+    assert scheduler.headroom(PREFETCH) == 10
+    assert scheduler.headroom(BACKGROUND) == 0
+
+    held = scheduler.submit(lambda: 'background', priority=BACKGROUND)
+    assert scheduler.submit(lambda: 'read', priority=INTERACTIVE_READ).result(5) == 'read'
+    assert scheduler.submit(lambda: 'prefetch', priority=PREFETCH).result(5) == 'prefetch'
+    time.sleep(0.1)
+    assert not held.done()
+    assert scheduler.stats()['classes']['background']['held'] > 0
+
+    # A fresh budget lets it through
+    scheduler.update_budget(remaining=100)
+    assert held.result(5) == 'background'
+
+
+def test_spend_counts_against_the_budget():
+    scheduler = UpstreamScheduler(workers=1)
+    assert scheduler.headroom(PREFETCH) is None
+    scheduler.update_budget(limit=10, remaining=3, reset=3600)
+    assert scheduler.spend(PREFETCH) is True
+    assert scheduler.spend(PREFETCH) is False
+    assert scheduler.headroom(INTERACTIVE_READ) == 2
+
+
+def test_jobs_expire_at_their_deadline():
+    scheduler, release = blocked_scheduler()
+    calls = []
+    future = scheduler.submit(calls.append, 'late', priority=PREFETCH, deadline=time.monotonic() + 0.05)
+    time.sleep(0.1)
+    release.set()
+    with pytest.raises(DeadlineExceeded):
+        future.result(5)
+    assert calls == []
+    assert scheduler.stats()['classes']['prefetch']['expired'] == 1
+
+
+def test_class_deadlines_apply_by_default():
+    scheduler, release = blocked_scheduler(deadlines={INTERACTIVE_READ: 0.05})
+    future = scheduler.submit(lambda: 'read', priority=INTERACTIVE_READ)
+    time.sleep(0.1)
+    release.set()
+    with pytest.raises(DeadlineExceeded):
+        future.result(5)
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        UpstreamScheduler().submit(lambda: None, priority=9)
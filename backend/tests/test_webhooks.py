@@ -0,0 +1,75 @@
+import pytest
+
+import server
+from fake_notifier import build_notifications
+from models import FoodLogEntry
+from serialization import dumps
+from webhooks import FOODS, sign, parse_notifications
+
+NOTIFIED = '2024-05-01'
+UNTOUCHED = '2024-05-02'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('FITBIT_SUBSCRIBER_VERIFY', 'verify-code')
+    app = server.create_app({'TESTING': True}, start_background=False)
+    for target_date in (NOTIFIED, UNTOUCHED):
+        server.food_mirror.store_day(target_date, [
+            FoodLogEntry(1, 101, 'Oatmeal', 1, 1.0, 'cup', 91, 150, '')])
+    return app.test_client()
+
+
+def notify(client, dates, collection=FOODS, secret='test-secret'):
+    body = dumps(build_notifications(collection, dates))
+    return client.post('/api/fitbit/webhook', data=body, headers={
+        'Content-Type': 'application/json', 'X-Fitbit-Signature': sign(body, secret)})
+
+
+def test_verification_answers_configured_code_only(client):
+    assert client.get('/api/fitbit/webhook?verify=verify-code').status_code == 204
+    assert client.get('/api/fitbit/webhook?verify=wrong').status_code == 404
+    assert client.get('/api/fitbit/webhook').status_code == 404
+
+
+def test_bad_signature_is_rejected(client):
+    assert notify(client, [NOTIFIED], secret='other-secret').status_code == 404
+    body = dumps(build_notifications(FOODS, [NOTIFIED]))
+    response = client.post('/api/fitbit/webhook', data=body, headers={'Content-Type': 'application/json'})
+    assert response.status_code == 404
+    assert server.food_mirror.dirty_dates() == []
+
+
+def test_valid_signature_is_accepted(client):
+    assert notify(client, [NOTIFIED]).status_code == 204
+    assert server.webhook_stats.as_dict()['received'] >= 1
+
+
+def test_malformed_body_is_rejected(client):
+    body = b'{"collectionType": "foods"}'
+    response = client.post('/api/fitbit/webhook', data=body, headers={
+        'Content-Type': 'application/json', 'X-Fitbit-Signature': sign(body, 'test-secret')})
+    assert response.status_code == 400
+
+
+def test_notified_dates_only_are_invalidated(client):
+    etags = {target_date: client.get(f'/api/foods?date={target_date}').headers['ETag']
+             for target_date in (NOTIFIED, UNTOUCHED)}
+    for target_date, etag in etags.items():
+        response = client.get(f'/api/foods?date={target_date}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    assert notify(client, [NOTIFIED]).status_code == 204
+
+    assert server.food_mirror.dirty_dates() == [NOTIFIED]
+    assert server.etag_index.get(f'/api/foods?date={NOTIFIED}') is None
+    assert server.etag_index.get(f'/api/foods?date={UNTOUCHED}') is not None
+
+
+def test_parse_notifications_skips_unknown_entries():
+    body = dumps(build_notifications(FOODS, [NOTIFIED]) + [
+        {'collectionType': 'sleep', 'date': UNTOUCHED},
+        {'collectionType': FOODS, 'date': 'yesterday'},
+        'not a notification',
+    ])
+    assert parse_notifications(body)[FOODS] == {NOTIFIED}
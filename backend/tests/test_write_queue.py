@@ -0,0 +1,82 @@
+from circuit_breaker import UpstreamUnavailable
+from write_queue import WriteQueue, MAX_ATTEMPTS
+
+
+class Upstream:
+    """send() for the queue, answers with the outcomes given per write description"""
+
+    def __init__(self, **outcomes):
+        self.outcomes = outcomes
+        self.sent = []
+
+    def __call__(self, write):
+        self.sent.append(write['description'])
+        outcome = self.outcomes.get(write['description'], True)
+        if isinstance(outcome, list):
+            outcome = outcome.pop(0) if outcome else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def queue_of(tmp_path, upstream, *descriptions):
+    queue = WriteQueue(str(tmp_path / 'write_queue.json'), send=upstream)
+    for description in descriptions:
+        queue.add('POST', f'https://api.fitbit.com/1/{description}', description, date='2024-05-01')
+    return queue
+
+
+def test_writes_replay_in_order(tmp_path):
+    upstream = Upstream()
+    written = []
+    queue = queue_of(tmp_path, upstream, 'first', 'second', 'third')
+    queue.on_written = written.extend
+    assert [write['description'] for write in queue.replay_once()] == ['first', 'second', 'third']
+    assert upstream.sent == ['first', 'second', 'third']
+    assert [write['description'] for write in written] == ['first', 'second', 'third']
+    assert queue.pending() == []
+
+
+def test_open_circuit_stops_the_pass_and_keeps_the_order(tmp_path):
+    upstream = Upstream(second=[UpstreamUnavailable('circuit open')])
+    queue = queue_of(tmp_path, upstream, 'first', 'second', 'third')
+    assert [write['description'] for write in queue.replay_once()] == ['first']
+    assert [write['description'] for write in queue.pending()] == ['second', 'third']
+    assert queue.pending()[0]['attempts'] == 0
+
+    assert [write['description'] for write in queue.replay_once()] == ['second', 'third']
+
+
+def test_failing_write_moves_to_failed_after_max_attempts(tmp_path):
+    upstream = Upstream(first=None)
+    queue = queue_of(tmp_path, upstream, 'first', 'second')
+    for attempt in range(1, MAX_ATTEMPTS):
+        assert queue.replay_once() == []
+        assert queue.pending()[0]['attempts'] == attempt
+    # The last attempt gives up on it and the writes behind it go out
+    assert [write['description'] for write in queue.replay_once()] == ['second']
+    assert upstream.sent.count('first') == MAX_ATTEMPTS
+    status = queue.status()
+    assert (status['pending'], status['failed']) == (0, 1)
+
+
+def test_queue_survives_a_restart(tmp_path):
+    queue = queue_of(tmp_path, Upstream(), 'first', 'second')
+    reopened = WriteQueue(queue.path, send=Upstream())
+    assert [write['description'] for write in reopened.pending()] == ['first', 'second']
+
+
+def test_failed_write_fails_the_rest_of_its_edit(tmp_path):
+    upstream = Upstream(delete=None)
+    queue = WriteQueue(str(tmp_path / 'write_queue.json'), send=upstream)
+    failed = []
+    queue.on_failed = failed.append
+    queue.add('DELETE', 'https://api.fitbit.com/1/delete', 'delete', journal_id='edit')
+    queue.add('POST', 'https://api.fitbit.com/1/create', 'create', journal_id='edit')
+    queue.add('POST', 'https://api.fitbit.com/1/other', 'other')
+    for _ in range(MAX_ATTEMPTS):
+        queue.replay_once()
+    assert upstream.sent == ['delete'] * MAX_ATTEMPTS + ['other']
+    # The callback hears of the write that failed, not of the ones dropped with it
+    assert [write['description'] for write in failed] == ['delete']
+    assert queue.status()['failed'] == 2
@@ -0,0 +1,84 @@
+"""
+Units catalog with lookup structures precomputed once per refresh
+
+Fitbit's units list is fetched at most once an hour. Everything the routes need
+from it (unit by id, unit id by name or plural, the compact unit list of a food)
+is built once here so food search expansion and edit lookups are dictionary hits
+instead of scans over the whole list. The structures are shared between
+requests and must be treated as read only, units are frozen Unit records that
+are serialized straight into responses.
+"""
+
+import sys
+from types import MappingProxyType
+
+from models import Unit
+
+# Distinct per-food unit lists remembered, search results reuse a small set of them
+MAX_DETAIL_LISTS = 4096
+
+
+def normalize_unit_name(name):
+    """Lower case, trimmed, single spaced form of a unit name used as a lookup key"""
+    return ' '.join(str(name).lower().replace('.', ' ').split())
+
+
+class UnitsCatalog:
+    __slots__ = ('units', 'by_id', 'by_name', '_details', '_size')
+
+    def __init__(self, units_data):
+        units = tuple(Unit.from_fitbit(unit) for unit in units_data)
+
+        by_name = {}
+        for unit in units:
+            # Names win over plurals, and the first unit with a name keeps it
+            by_name.setdefault(normalize_unit_name(unit.name or ''), unit.id)
+        for unit in units:
+            by_name.setdefault(normalize_unit_name(unit.plural or ''), unit.id)
+        by_name.pop('', None)
+
+        by_id = {unit.id: unit for unit in units}
+
+        self.units = units
+        self.by_id = MappingProxyType(by_id)
+        self.by_name = MappingProxyType(by_name)
+        self._details = {}
+        # Measured once, the lookup structures never change after they are built
+        self._size = (sys.getsizeof(units) + sum(unit.cache_size() for unit in units) + sys.getsizeof(by_id)
+                      + sys.getsizeof(by_name) + sum(sys.getsizeof(name) for name in by_name))
+
+    def __len__(self):
+        return len(self.units)
+
+    def cache_size(self):
+        """Bytes held by the catalog for the bounded caches, the detail lists are capped by MAX_DETAIL_LISTS"""
+        return self._size
+
+    def get(self, unit_id):
+        """Unit by id, None if unknown"""
+        try:
+            return self.by_id.get(int(unit_id))
+        except (TypeError, ValueError):
+            return None
+
+    def resolve_name(self, name):
+        """Unit by exact (normalized) name or plural, None if unknown"""
+        unit_id = self.by_name.get(normalize_unit_name(name))
+        return self.by_id.get(unit_id) if unit_id is not None else None
+
+    def details(self, unit_ids):
+        """Compact [{id, name}] list for a food's unit ids, unknown ids are skipped"""
+        key = tuple(unit_ids)
+        details = self._details.get(key)
+        if details is None:
+            details = tuple({'id': unit_id, 'name': self.by_id[unit_id].name}
+                            for unit_id in key if unit_id in self.by_id)
+            if len(self._details) < MAX_DETAIL_LISTS:
+                self._details[key] = details
+        return details
+
+    def search(self, query):
+        """Units whose name or plural contains the query"""
+        query = query.lower()
+        return [unit for unit in self.units
+                if query in (unit.name or '').lower() or query in (unit.plural or '').lower()]
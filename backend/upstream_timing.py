@@ -0,0 +1,99 @@
+"""
+Latency tracking and hedged reads for upstream Fitbit calls
+
+Every call records how long Fitbit took to answer, grouped by endpoint (the
+URL path with dates and ids replaced). Once an endpoint has enough samples its
+p95 is the point where a GET is considered slow: a hedged GET sends a second,
+identical request at that point and returns whichever answers first.
+"""
+
+import re
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+from urllib.parse import urlsplit
+
+# Samples kept per endpoint, and needed before its p95 is trusted
+LATENCY_SAMPLES = 200
+MIN_SAMPLES = 20
+
+_API_VERSION = re.compile(r'^/\d+(\.\d+)?(?=/)')
+_VARIABLE_PART = re.compile(r'/(\d{4}-\d{2}-\d{2}|\d+|today)(?=/|\.json|$)')
+
+
+def endpoint_key(url):
+    """Endpoint a URL belongs to, /1/user/-/foods/log/date/2024-05-01.json -> /user/-/foods/log/date/:id.json"""
+    return _VARIABLE_PART.sub('/:id', _API_VERSION.sub('', urlsplit(url).path))
+
+
+class LatencyTracker:
+    def __init__(self, samples=LATENCY_SAMPLES, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def p95(self, key):
+        """p95 latency of an endpoint in seconds, None until it has enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def stats(self):
+        with self._lock:
+            endpoints = {key: sorted(samples) for key, samples in self._samples.items()}
+        return {key: {
+            'samples': len(samples),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+        } for key, samples in endpoints.items() if samples}
+
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'hedged': 0, 'hedge_won': 0, 'primary_won': 0, 'skipped_budget': 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def as_dict(self):
+        with self._lock:
+            counts = dict(self.counts)
+        counts['hedge_win_rate'] = round(counts['hedge_won'] / counts['hedged'], 3) if counts['hedged'] else None
+        return counts
+
+
+def hedged_call(pool, fn, delay, may_hedge, stats):
+    """
+    Run fn() on the pool, if it has not returned after delay seconds and may_hedge()
+    allows it, run fn() a second time and return the first successful result
+    the slower attempt is left to finish in the background, its result is ignored
+    """
+    primary = pool.submit(fn)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    if not may_hedge():
+        stats.count('skipped_budget')
+        return primary.result()
+
+    stats.count('hedged')
+    hedge = pool.submit(fn)
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [future for future in done if future.exception() is None]
+        if succeeded:
+            winner = primary if primary in succeeded else hedge
+            stats.count('primary_won' if winner is primary else 'hedge_won')
+            return winner.result()
+        if not pending:
+            # Both attempts failed, raise the error of the first one
+            return primary.result()
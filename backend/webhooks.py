@@ -0,0 +1,88 @@
+"""
+Fitbit Subscriptions API notifications
+
+Fitbit posts a JSON list of notifications when a subscribed collection changes:
+
+    [{"collectionType": "foods", "date": "2024-05-01", "ownerId": "ABC123",
+      "ownerType": "user", "subscriptionId": "1"}]
+
+The body is signed with HMAC-SHA1 using the app's client secret followed by
+"&" as the key, base64 encoded in the X-Fitbit-Signature header. Fitbit also
+verifies the endpoint once with GET ?verify=<code>, which must answer 204 for
+the configured code and 404 for anything else.
+"""
+
+import base64
+import hashlib
+import hmac
+import re
+import threading
+from datetime import datetime
+
+from serialization import loads
+
+# Collections the server reacts to
+FOODS = 'foods'
+BODY = 'body'
+COLLECTIONS = (FOODS, BODY)
+
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def sign(body, client_secret):
+    """Signature Fitbit sends for a notification body"""
+    digest = hmac.new(f"{client_secret}&".encode(), body, hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body, signature, client_secret):
+    if not signature or not client_secret:
+        return False
+    return hmac.compare_digest(sign(body, client_secret), signature)
+
+
+def parse_notifications(body):
+    """
+    Changed dates per collection from a notification body, {collection: set of dates}
+    unknown collections and malformed entries are skipped
+    """
+    notifications = loads(body)
+    if not isinstance(notifications, list):
+        raise ValueError("Notification body must be a list")
+    changed = {collection: set() for collection in COLLECTIONS}
+    for notification in notifications:
+        if not isinstance(notification, dict):
+            continue
+        collection = notification.get('collectionType')
+        date = notification.get('date')
+        if collection in changed and isinstance(date, str) and _DATE.match(date):
+            changed[collection].add(date)
+    return changed
+
+
+class WebhookStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.received = 0
+        self.rejected = 0
+        self.dates = {collection: 0 for collection in COLLECTIONS}
+        self.last_received = None
+
+    def record(self, changed=None):
+        with self._lock:
+            if changed is None:
+                self.rejected += 1
+                return
+            self.received += 1
+            self.last_received = datetime.now().isoformat(timespec='seconds')
+            for collection, dates in changed.items():
+                self.dates[collection] += len(dates)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'received': self.received,
+                'rejected': self.rejected,
+                'dates_invalidated': dict(self.dates),
+                'last_received': self.last_received,
+            }
@@ -0,0 +1,170 @@
+"""
+Retry queue for writes that could not be sent to Fitbit
+
+While an endpoint's circuit is open, writes to it are not sent at all (see
+circuit_breaker.py), so they can be replayed later without risking a duplicate
+entry. The routes queue them here and answer 202. A background thread replays
+the queue every REPLAY_INTERVAL seconds, in the order the writes were made,
+stopping at the first one that does not go through. A write that fails
+MAX_ATTEMPTS times is moved to the failed list.
+
+The writes left of a food edit share the edit's journal id. When one of them
+fails for good the ones after it are failed too, a POST whose DELETE never
+went through would log the entry twice.
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from scheduler import DeadlineExceeded
+from serialization import dump_file, load_file
+
+REPLAY_INTERVAL = 15
+MAX_ATTEMPTS = 3
+
+# Failed writes kept on disk for inspection
+MAX_FAILED = 100
+
+
+class WriteQueue:
+    """
+    Persistent queue of writes, send(write) returns the Fitbit result or None if
+    it failed, on_written(writes) is called with the writes that went through
+    (with the Fitbit result under 'result') and on_failed(write) with every write
+    that failed MAX_ATTEMPTS times
+    """
+
+    def __init__(self, path='write_queue.json', send=None, on_written=None, on_failed=None,
+                 interval=REPLAY_INTERVAL):
+        self.path = path
+        self.send = send
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._replay_lock = threading.Lock()
+
+    def _load(self):
+        if self._state is None:
+            if os.path.exists(self.path):
+                self._state = load_file(self.path)
+            else:
+                self._state = {'pending': [], 'failed': []}
+        return self._state
+
+    def _save(self):
+        self._state['failed'] = self._state['failed'][-MAX_FAILED:]
+        tmp_path = f"{self.path}.tmp"
+        dump_file(self._state, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def add(self, method, url, description, date=None, journal_id=None):
+        """Queue a write, returns its id, journal_id ties the writes of one food edit together"""
+        write = {
+            'id': uuid.uuid4().hex[:12],
+            'method': method,
+            'url': url,
+            'description': description,
+            'date': date,
+            'journalId': journal_id,
+            'queued_at': datetime.now().isoformat(timespec='seconds'),
+            'attempts': 0,
+        }
+        with self._lock:
+            self._load()['pending'].append(write)
+            self._save()
+        return write['id']
+
+    def pending(self):
+        with self._lock:
+            return list(self._load()['pending'])
+
+    def status(self):
+        with self._lock:
+            state = self._load()
+            return {
+                'pending': len(state['pending']),
+                'failed': len(state['failed']),
+                'oldest_queued_at': state['pending'][0]['queued_at'] if state['pending'] else None,
+                'replay_running': self.running,
+            }
+
+    def _finish(self, write, failed=False, error=None):
+        with self._lock:
+            state = self._load()
+            state['pending'] = [w for w in state['pending'] if w['id'] != write['id']]
+            if failed:
+                state['failed'].append(dict(write, error=error, failed_at=datetime.now().isoformat(timespec='seconds')))
+            self._save()
+
+    def _attempted(self, write):
+        with self._lock:
+            for w in self._load()['pending']:
+                if w['id'] == write['id']:
+                    w['attempts'] += 1
+                    write['attempts'] = w['attempts']
+            self._save()
+
+    def replay_once(self):
+        """Send the queued writes in order, returns the ones that went through"""
+        written = []
+        failed = []
+        with self._replay_lock:
+            for write in self.pending():
+                if write.get('journalId') and any(f.get('journalId') == write['journalId'] for f in failed):
+                    self._finish(write, failed=True, error="An earlier write of the same edit failed")
+                    continue
+                try:
+                    result = self.send(write)
+                except DeadlineExceeded:
+                    # Circuit still open (UpstreamUnavailable) or the write could not be
+                    # dispatched, keep the order and try again on the next pass
+                    break
+                if result is not None:
+                    self._finish(write)
+                    written.append(dict(write, result=result))
+                    continue
+                self._attempted(write)
+                if write['attempts'] < MAX_ATTEMPTS:
+                    break
+                self._finish(write, failed=True, error=f"Failed {MAX_ATTEMPTS} times")
+                failed.append(write)
+        if written and self.on_written is not None:
+            self.on_written(written)
+        if self.on_failed is not None:
+            for write in failed:
+                self.on_failed(write)
+        return written
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='write-queue-replay', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                written = self.replay_once()
+                if written:
+                    print(f"[Backend] Replayed {len(written)} queued writes")
+            except Exception as e:
+                print(f"[Backend] Write queue replay failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
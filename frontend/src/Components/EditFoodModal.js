@@ -32,12 +32,13 @@ const EditFoodModal = ({ isOpen, onClose, food, onUpdate, currentDate }) => {
       const originalUnitExists = allUnits.some(unit => unit.name === food.unit);
       if (!originalUnitExists) {
         try {
-          // Search for the unit by name to get its ID
-          const response = await axios.get(`http://localhost:5000/api/units/search?q=${encodeURIComponent(food.unit)}`);
-          if (response.data.units && response.data.units.length > 0) {
-            // Use the first matching unit
-            const foundUnit = response.data.units[0];
-            allUnits.push({ id: foundUnit.id, name: foundUnit.name });
+          // Look the unit up by the ID the log entry already has, falling back to its exact name
+          const response = food.unitId
+            ? await axios.get(`http://localhost:5000/api/units/${food.unitId}`)
+            : await axios.post('http://localhost:5000/api/units/resolve', { names: [food.unit] });
+          const foundUnit = food.unitId ? response.data : response.data.names[food.unit];
+          if (foundUnit) {
+            allUnits.push({ id: foundUnit.id, name: food.unit });
           } else {
             // If not found, add with a placeholder that will be handled by the backend
             allUnits.push({ id: 'original', name: food.unit });
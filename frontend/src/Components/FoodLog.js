@@ -1,8 +1,13 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 import EditFoodModal from './EditFoodModal';
 import FoodInfoModal from './FoodInfoModal';
 
+// Patch a loaded day with a change pushed over /api/events
+const withFoods = (data, foods) => data && { ...data, foods, total_foods: foods.length };
+const addEntry = (data, entry) => data && withFoods(data, [...data.foods.filter(food => food.id !== entry.id), entry]);
+const removeEntry = (data, id) => data && withFoods(data, data.foods.filter(food => food.id !== id));
+
 const FoodLog = ({ selectedDate, refreshTrigger = 0 }) => {
   const [foodsData, setFoodsData] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -12,6 +17,10 @@ const FoodLog = ({ selectedDate, refreshTrigger = 0 }) => {
   const [isEditModalOpen, setIsEditModalOpen] = useState(false);
   const [selectedFood, setSelectedFood] = useState(null);
   const [isInfoModalOpen, setIsInfoModalOpen] = useState(false);
+  const streamOpen = useRef(false);
+  const lastRefreshTrigger = useRef(refreshTrigger);
+  const dateRef = useRef(selectedDate);
+  const fetchRef = useRef(null);
 
   const fetchFoodsData = useCallback(async () => {
     try {
@@ -32,11 +41,63 @@ const FoodLog = ({ selectedDate, refreshTrigger = 0 }) => {
   }, [selectedDate]);
 
   useEffect(() => {
-    if (selectedDate) {
-      fetchFoodsData();
+    dateRef.current = selectedDate;
+    fetchRef.current = fetchFoodsData;
+  }, [selectedDate, fetchFoodsData]);
+
+  useEffect(() => {
+    if (!selectedDate) {
+      return;
     }
+    // Foods logged from this page arrive over the event stream, only fetch again without it
+    const refreshed = refreshTrigger !== lastRefreshTrigger.current;
+    lastRefreshTrigger.current = refreshTrigger;
+    if (refreshed && streamOpen.current) {
+      return;
+    }
+    fetchFoodsData();
   }, [selectedDate, refreshTrigger, fetchFoodsData]);
 
+  // Changes made in other tabs, the CLI or the Fitbit app are pushed by the server
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') {
+      return undefined;
+    }
+    const source = new EventSource('http://localhost:5000/api/events');
+    const onDate = (date) => date === null || date === dateRef.current;
+    const listen = (type, handler) => source.addEventListener(type, (message) => handler(JSON.parse(message.data)));
+
+    source.onopen = () => { streamOpen.current = true; };
+    source.onerror = () => { streamOpen.current = false; };
+    listen('entry.added', ({ date, entry }) => {
+      if (date === dateRef.current) {
+        setFoodsData(current => addEntry(current, entry));
+      }
+    });
+    listen('entry.removed', ({ date, id }) => {
+      if (onDate(date)) {
+        setFoodsData(current => removeEntry(current, id));
+      }
+    });
+    listen('entry.updated', ({ date, id, newDate, entry }) => {
+      if (onDate(date)) {
+        setFoodsData(current => removeEntry(current, id));
+      }
+      if (newDate === dateRef.current) {
+        setFoodsData(current => addEntry(current, entry));
+      }
+    });
+    listen('date.invalidated', ({ dates }) => {
+      if (dates === null || dates.includes(dateRef.current)) {
+        fetchRef.current();
+      }
+    });
+    // Missed too many events, start over
+    listen('resync', () => fetchRef.current());
+
+    return () => source.close();
+  }, []);
+
   const handleDeleteFood = async (foodId, foodName) => {
     if (!window.confirm(`Are you sure you want to delete "${foodName}"?`)) {
       return;
@@ -44,10 +105,15 @@ const FoodLog = ({ selectedDate, refreshTrigger = 0 }) => {
 
     try {
       setDeletingFood(foodId);
-      await axios.delete(`http://localhost:5000/api/foods/${foodId}`);
+      const response = await axios.delete(`http://localhost:5000/api/foods/${foodId}?date=${selectedDate}`);
       
-      // Refresh the food data after successful deletion
-      await fetchFoodsData();
+      if (response.status === 200) {
+        // Deleted, no need to fetch the day again
+        setFoodsData(current => removeEntry(current, foodId));
+      } else {
+        // Queued until Fitbit is back
+        await fetchFoodsData();
+      }
       
     } catch (err) {
       console.error('Error deleting food:', err);
@@ -78,7 +144,10 @@ const FoodLog = ({ selectedDate, refreshTrigger = 0 }) => {
   };
 
   const handleFoodUpdate = async () => {
-    await fetchFoodsData();
+    // The replacement entry arrives over the event stream
+    if (!streamOpen.current) {
+      await fetchFoodsData();
+    }
   };
 
   const getMealTypeName = (mealTypeId) => {
@@ -18,12 +18,23 @@ const FoodSearchModal = ({ isOpen, onClose, onFoodSelected, selectedDate }) => {
       setAmount('');
       setSelectedUnit('');
       setError(null);
+      loadQuickPicks();
     }
   }, [isOpen]);
 
+  // The foods logged most often, shown before anything is typed
+  const loadQuickPicks = async () => {
+    try {
+      const response = await axios.get('http://localhost:5000/api/foods/quick_picks');
+      setSearchResults(response.data.foods);
+    } catch (err) {
+      console.error('Error loading quick picks:', err);
+    }
+  };
+
   const searchFoods = async (query) => {
     if (!query.trim()) {
-      setSearchResults([]);
+      loadQuickPicks();
       return;
     }
 
@@ -54,8 +65,9 @@ const FoodSearchModal = ({ isOpen, onClose, onFoodSelected, selectedDate }) => {
 
   const handleFoodSelect = (food) => {
     setSelectedFood(food);
-    setSelectedUnit('');
-    setAmount('');
+    // Personal foods start from the unit and amount they were last logged with
+    setSelectedUnit(food.personal && food.unitId ? String(food.unitId) : '');
+    setAmount(food.personal && food.amount ? String(food.amount) : '');
   };
 
   const handleSubmit = async (e) => {
@@ -199,6 +211,12 @@ const FoodSearchModal = ({ isOpen, onClose, onFoodSelected, selectedDate }) => {
                     <div style={{ fontSize: '12px', color: '#E74C3C' }}>
                       {food.calories} calories
                     </div>
+                    {food.personal && (
+                      <div style={{ fontSize: '12px', color: '#27AE60' }}>
+                        {food.favorite ? '★ Favorite' : 'Your food'}
+                        {food.timesLogged > 0 && ` · logged ${food.timesLogged} times`}
+                      </div>
+                    )}
                   </div>
                 ))}
               </div>
@@ -1,147 +1,13 @@
-import requests
-import json
+"""
+List or search units, e.g. python search_units.py cup
+kept for compatibility, same as `fitbit-logger units`, see backend/cli.py
+"""
 import os
-import base64
-from dotenv import load_dotenv
+import sys
 
-# get env variables
-load_dotenv()
-client_id = os.getenv('CLIENTID')
-client_secret = os.getenv('CLIENTSECRET')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
 
-basic_token = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+from cli import main
 
-def make_fitbit_api_request(url, method='GET', headers=None, data=None, description=''):
-    """
-    Centralized function to make Fitbit API requests with rate limiting logging
-    """
-    global access_token, refresh_token
-    
-    if headers is None:
-        headers = {}
-    
-    # Add authorization header
-    headers['Authorization'] = f'Bearer {access_token}'
-    if 'Content-Type' not in headers:
-        headers['Content-Type'] = 'application/json'
-    
-    # Make the request
-    if method.upper() == 'GET':
-        response = requests.get(url, headers=headers)
-    elif method.upper() == 'POST':
-        response = requests.post(url, headers=headers, data=data)
-    elif method.upper() == 'PUT':
-        response = requests.put(url, headers=headers, data=data)
-    elif method.upper() == 'DELETE':
-        response = requests.delete(url, headers=headers)
-    else:
-        raise ValueError(f"Unsupported HTTP method: {method}")
-    
-    # Log rate limiting information
-    rate_limit = response.headers.get('Fitbit-Rate-Limit-Limit')
-    rate_remaining = response.headers.get('Fitbit-Rate-Limit-Remaining')
-    rate_reset = response.headers.get('Fitbit-Rate-Limit-Reset')
-    
-    print(f"[Fitbit API] {description}")
-    print(f"  Rate limit: {rate_limit}")
-    print(f"  Remaining: {rate_remaining}")
-    print(f"  Reset time: {rate_reset}")
-    print(f"  Status: {response.status_code}")
-    
-    # Handle different response status codes
-    if response.status_code in [200, 201, 204]:
-        if response.status_code == 204:  # No content for DELETE
-            return True
-        return response.json()
-    elif response.status_code == 401:
-        # Token expired, try to refresh
-        print(f"[Fitbit API] Token expired, attempting refresh...")
-        access_token, refresh_token = refresh_access_token(refresh_token)
-        if access_token and refresh_token:
-            # Retry the request with new token
-            headers['Authorization'] = f'Bearer {access_token}'
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=headers, data=data)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=headers, data=data)
-            elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=headers)
-            
-            # Log rate limiting info for retry
-            rate_limit = response.headers.get('Fitbit-Rate-Limit-Limit')
-            rate_remaining = response.headers.get('Fitbit-Rate-Limit-Remaining')
-            rate_reset = response.headers.get('Fitbit-Rate-Limit-Reset')
-            
-            print(f"[Fitbit API] Retry {description}")
-            print(f"  Rate limit: {rate_limit}")
-            print(f"  Remaining: {rate_remaining}")
-            print(f"  Reset time: {rate_reset}")
-            print(f"  Status: {response.status_code}")
-            
-            if response.status_code in [200, 201, 204]:
-                if response.status_code == 204:
-                    return True
-                return response.json()
-    
-    # If we get here, the request failed
-    print(f"[Fitbit API] Request failed: {response.status_code} - {response.text}")
-    return None
-
-def load_token(file_path, osvar):
-    # osvar is used 
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            return json.load(file)
-    return os.getenv('CLIENTID') or None
-
-def save_token(file_path, token):
-    with open(file_path, 'w') as file:
-        json.dump(token, file)
-
-# Function to refresh the access token
-def refresh_access_token(refresh_token):
-    url = "https://api.fitbit.com/oauth2/token"
-    payload = {
-        'grant_type': 'refresh_token',
-        'refresh_token': refresh_token,
-        'client_id': client_id,
-        'client_secret': client_secret
-    }
-    # note that we need to use the base token which should never expire
-    headers = {
-        'Authorization': f'Basic {basic_token}',
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    response = requests.post(url, data=payload, headers=headers)
-    # if success, save new tokens
-    if response.status_code == 200:
-        new_tokens = response.json()
-        save_token('access_token.json', {'access_token': new_tokens['access_token']})
-        save_token('refresh_token.json', {'refresh_token': new_tokens['refresh_token']})
-        return new_tokens['access_token'], new_tokens['refresh_token']
-    else:
-        print("Failed to refresh token:", response.json())
-        return None, None
-
-# load token data from json files
-access_token_data = load_token('access_token.json', 'ACCESSTOKEN')
-refresh_token_data = load_token('refresh_token.json', 'REFRESHTOKEN')
-
-# load tokens
-access_token = access_token_data['access_token']
-refresh_token = refresh_token_data['refresh_token']
-
-# Make the API request
-result = make_fitbit_api_request(
-    'https://api.fitbit.com/1/foods/units.json',
-    method='GET',
-    description="fetching units"
-)
-
-if result:
-    for unit in result:
-        print(f"Unit ID: {unit['id']} - Name: {unit['name']} - Plural: {unit['plural']}")
-else:
-    print("Error fetching units")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main(['units'] + sys.argv[1:]))